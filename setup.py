@@ -8,6 +8,6 @@ setuptools.setup(
     install_requires=[
           'numpy',
           'sympy',
-          'scipy'
+          'scipy>=1.12'
     ]
 )
\ No newline at end of file
@@ -1,6 +1,75 @@
 import numpy as np
 
 
+# properties that can be detected, in the order they are calculated.
+PROPERTIES = ('amplitude', 'intensity', 'S intensity', 'P intensity',
+              'a intensity', 'b intensity', 'Stokes', 'phase')
+# properties that are powers, and so sum incoherently.
+POWER_PROPERTIES = ('intensity', 'S intensity', 'P intensity', 'a intensity',
+                    'b intensity', 'Stokes')
+
+
+def calculate_properties(amplitudes, properties, axis=None):
+    """Calculates detected properties from node amplitudes.
+
+    All properties are calculated in a single vectorised pass, so any number
+    of detectors (or evaluations) can be read out at once.
+
+    Parameters
+    ----------
+    amplitudes : ndarray
+            Electric field amplitudes (aP, aS, bP, bS) along the last axis.
+    properties : tuple of str
+            Optical properties to be calculated - see
+            :py:class:`strapy.Detector()` for current options. Amplitudes are
+            always included.
+    axis : int
+            Sweep axis of `amplitudes`, along which phases are unwrapped. If
+            not given phases are wrapped to (-pi, pi].
+
+    Returns
+    -------
+    readout : dict
+            Calculated properties, keyed by property name, with the shape of
+            `amplitudes` excluding the last axis (or including it, for
+            amplitudes).
+    """
+
+    readout = {'amplitude': amplitudes}
+
+    if any(prop in properties for prop in ('intensity', 'S intensity',
+                                           'P intensity', 'a intensity',
+                                           'b intensity')):
+        powers = np.abs(amplitudes)**2
+
+    if 'intensity' in properties:
+        readout['intensity'] = np.sum(powers, axis=-1)
+    if 'S intensity' in properties:
+        readout['S intensity'] = powers[..., 1] + powers[..., 3]
+    if 'P intensity' in properties:
+        readout['P intensity'] = powers[..., 0] + powers[..., 2]
+    if 'a intensity' in properties:
+        readout['a intensity'] = powers[..., 0] + powers[..., 1]
+    if 'b intensity' in properties:
+        readout['b intensity'] = powers[..., 2] + powers[..., 3]
+
+    if 'Stokes' in properties:
+        fields = amplitudes.reshape(amplitudes.shape[:-1] + (2, 2))
+        powers = np.abs(fields)**2
+        coherence = fields[..., 0] * np.conj(fields[..., 1])
+        readout['Stokes'] = np.stack((powers[..., 0] + powers[..., 1],
+                                      powers[..., 0] - powers[..., 1],
+                                      2 * np.real(coherence),
+                                      2 * np.imag(coherence)), axis=-1)
+
+    if 'phase' in properties:
+        readout['phase'] = np.angle(amplitudes)
+        if axis is not None:
+            readout['phase'] = np.unwrap(readout['phase'], axis=axis)
+
+    return readout
+
+
 class Detector:
     """A detector for logging electric field amplitude and related properties.
 
@@ -18,12 +87,33 @@ class Detector:
                     through the detector in both directions.
             * `P intensity` - the intensity of P polarised light passing
                     through the detector in both directions.
+            * `a intensity` - the intensity of light propagating in the
+                    direction of the 'a' field components at the node, the
+                    direction in which sources emit.
+            * `b intensity` - the intensity of light propagating in the
+                    direction of the 'b' field components at the node.
+            * `Stokes` - the Stokes parameters (S0, S1, S2, S3) of the light
+                    propagating in each direction, with P polarised light as
+                    the horizontal axis. Right hand circularly polarised light
+                    has S3 = S0.
+            * `phase` - the optical phases of the forward and backward
+                    propagating S and P polarised electric fields. For batched
+                    evaluations phases are unwrapped along the sweep.
 
     Note that calculated intensity is proportional to both the amplitude and
     the dielectric properties of the medium; the intensity for a detector is
     only directly comparable to other intensities calculated in the same
     medium.
 
+    When evaluated as part of a model, the properties of all detectors are
+    calculated together, and detected values are views into the model's
+    readout arrays.
+
+    For models with sources in several coherence groups (see
+    :py:meth:`strapy.components.Source.set_coherence_group()`), powers are
+    summed incoherently over groups, and amplitudes and phases have an extra
+    leading axis with one row for each group.
+
     Attributes
     ----------
     name : str
@@ -36,6 +126,28 @@ class Detector:
     node_index : int
             Index of the node the detector is to monitor in the solution
             vector.
+    readout : dict
+            Detected properties of all detectors in the readout, keyed by
+            property name.
+    row : int
+            Index of the detector in the readout arrays.
+    amplitudes : ndarray
+            Detected amplitudes (aP, aS, bP, bS).
+    intensity : float
+            Detected intensity.
+    S_intensity : float
+            Detected S polarised intensity.
+    P_intensity : float
+            Detected P polarised intensity.
+    a_intensity : float
+            Detected intensity propagating in the 'a' direction.
+    b_intensity : float
+            Detected intensity propagating in the 'b' direction.
+    stokes : ndarray
+            Detected Stokes parameters, with shape (2, 4), for light
+            propagating in the 'a' and 'b' directions.
+    phase : ndarray
+            Detected phases of the amplitudes (aP, aS, bP, bS).
     """
 
     def __init__(self, name, node, properties):
@@ -43,6 +155,8 @@ class Detector:
         self.node = node
         self.properties = properties
         self.node_index = None
+        self.readout = None
+        self.row = None
 
         if 'amplitude' in properties:
             self.AMP = True
@@ -64,22 +178,34 @@ class Detector:
         else:
             self.P_INT = False
 
+    def _detected(self, prop):
+        """Returns detected property from readout."""
+        if self.readout is None or prop not in self.readout:
+            raise AttributeError(
+                'Detector {} has no detected {}.'.format(self.name, prop))
+        return self.readout[prop][self.row]
+
+    amplitudes = property(lambda self: self._detected('amplitude'))
+    intensity = property(lambda self: self._detected('intensity'))
+    S_intensity = property(lambda self: self._detected('S intensity'))
+    P_intensity = property(lambda self: self._detected('P intensity'))
+    a_intensity = property(lambda self: self._detected('a intensity'))
+    b_intensity = property(lambda self: self._detected('b intensity'))
+    stokes = property(lambda self: self._detected('Stokes'))
+    phase = property(lambda self: self._detected('phase'))
+
     def update(self, solution_vector):
         """Update the detected values from solution vector.
 
+        Used when reading out a single detector; models read out all
+        detectors together.
+
         Parameters
         ----------
         solution_vector : ndarray
                 solution to network matrix equation."""
 
-        self.amplitudes = \
-            solution_vector[self.node_index:self.node_index + 4].flatten()
-
-        if self.INT:
-            self.intensity = np.sum(np.abs(self.amplitudes)**2)
-        if self.S_INT:
-            self.S_intensity = np.abs(self.amplitudes[1])**2 \
-                + np.abs(self.amplitudes[3])**2
-        if self.P_INT:
-            self.P_intensity = np.abs(self.amplitudes[0])**2 \
-                + np.abs(self.amplitudes[2])**2
+        self.readout = calculate_properties(
+            solution_vector[self.node_index:self.node_index + 4].reshape(1, 4),
+            self.properties)
+        self.row = 0
@@ -1,12 +1,87 @@
 from .Node import Node
-from .Detector import Detector
+from .Detector import Detector, calculate_properties, PROPERTIES, \
+    POWER_PROPERTIES
 from . import components
+from . import solvers
+from . import materials
+from .cache import LRUCache
+from .store import ResultStore
 import sympy as sp
 import numpy as np
 import timeit
+import warnings
+import itertools
+import hashlib
+import scipy.linalg
 from scipy.sparse.linalg import lsqr
 
 
+# batched evaluations in which the changed matrix elements span at most this
+# fraction of the network matrix rows are solved by low rank updates of a
+# single solve, rather than by solving every network matrix.
+REDUCED_FRACTION = 0.25
+# approximate memory limit, in bytes, for the network matrices of a batched
+# evaluation that are solved together.
+BATCH_MEMORY = 2**27
+# default number of points evaluated together by `simulate_trajectory()`.
+TRAJECTORY_CHUNK = 2**14
+# eigenvalues of the resonance eigenproblem with a modulus below this, or
+# above its reciprocal, are zero or infinite rather than poles.
+POLE_CUTOFF = 1e-9
+# relative tolerance on pole moduli for poles of the same family of
+# resonances.
+POLE_RTOL = 1e-6
+# minimum overlap of the normalised mode amplitudes in the stack rows for
+# poles of the same family of resonances.
+POLE_OVERLAP = 1e-3
+
+
+def _chunks(points, size):
+    """Yields successive arrays of at most `size` points from an iterable,
+    without holding more than one chunk in memory."""
+
+    if isinstance(points, np.ndarray):
+        for start in range(0, len(points), size):
+            yield points[start:start + size]
+        return
+
+    iterator = iter(points)
+    while True:
+        chunk = np.fromiter(itertools.islice(iterator, size), dtype=float)
+        if len(chunk) == 0:
+            return
+        yield chunk
+
+
+def _concatenate(chunks):
+    """Joins batched detector results from a sequence of chunks."""
+
+    chunks = list(chunks)
+
+    return {name: {prop: np.concatenate([result[name][prop]
+                                         for result in chunks])
+                   for prop in chunks[0][name]}
+            for name in chunks[0]}
+
+
+def _interpolation_errors(points, values):
+    """Estimates the error of linear interpolation on each interval between
+    sorted points, from the second divided differences of `values` along the
+    last axis."""
+
+    widths = np.diff(points)
+    slopes = np.diff(values, axis=-1) / widths
+
+    curvature = np.zeros(values.shape)
+    curvature[..., 1:-1] = 2 * np.diff(slopes, axis=-1) \
+        / (widths[:-1] + widths[1:])
+    curvature[..., 0] = curvature[..., 1]
+    curvature[..., -1] = curvature[..., -2]
+    curvature = np.abs(curvature)
+
+    return widths**2 / 8 * np.maximum(curvature[..., :-1], curvature[..., 1:])
+
+
 class Model:
     """Defines the optical network to be modelled.
 
@@ -19,7 +94,8 @@ class Model:
     Attributes
     ----------
     wavelength : float
-            The vacuum (n = 1) wavelength of illuminating light.
+            The vacuum (n = 1) wavelength of illuminating light, see
+            `set_wavelength()`.
     components : dict
             Dictionary of optical components that have been added to the model.
     detectors : dict
@@ -39,11 +115,49 @@ class Model:
             List of optical components that have changed since the model was
             last evaluated.
     useLambdify : bool
-            True if sympy's lambdify functionality should be used to set right
-            hand side vector and matrix before evaluation. If false only
-            components that are included in the `updated` list are updated in
-            the matrix equation before solving. Lambdify is currently a
-            fallback if there is more than one sympy symbol per matrix element.
+            True if some matrix or right hand side elements contain more than
+            one sympy symbol. These elements are evaluated by a single
+            function, lambdified once at build time, that writes only those
+            elements into the existing matrix equation; all other elements are
+            updated directly for components in the `updated` list.
+    solution_vector : ndarray
+            Solution to the network matrix equation from the last evaluation,
+            with one column for each coherence group. Reused without solving
+            if no matrix or right hand side entries have changed since the
+            last evaluation.
+    solver : strapy.solvers._Solver
+            Backend used to solve the network matrix equation, see
+            `set_solver()`.
+    nodeIndex : dict
+            Index of the first element of each node in the solution vector,
+            keyed by node name. Set when the model is built.
+    sweepSolutions : ndarray
+            Solution vectors of the last batched evaluation, if requested,
+            with shape (N, len(solution_vector), len(coherenceGroups)).
+    coherenceGroups : list
+            Coherence groups of the sources, in the order of the solution
+            vector columns, see `Source.set_coherence_group()`. Set when the
+            model is built.
+    rhsGroups : ndarray
+            Index in `coherenceGroups` of the group of each right hand side
+            element.
+    batchResponse : tuple
+            Responses of the current network matrix used by low rank batched
+            evaluations, kept until the matrix equation changes.
+    memo : strapy.cache.LRUCache
+            Solutions and detector readouts of previous evaluations, keyed by
+            the state of all components, if enabled with `set_memo()`,
+            otherwise None.
+    staleFactors : bool
+            True if the network matrix has changed since the solver last
+            factorised it, because an evaluation was taken from `memo` or
+            `store`.
+    store : strapy.store.ResultStore
+            Persistent result store, if set with `set_store()`, otherwise
+            None.
+    topology : str
+            Hash of the components, nodes and detectors of the model, keying
+            results in `store`. Set when the model is built.
     """
 
     def __init__(self):
@@ -57,6 +171,18 @@ class Model:
         self.matrixVariables = []
         self.updated = []
         self.useLambdify = False
+        self.solution_vector = None
+        self.solverName = 'auto'
+        self.solverOptions = {}
+        self.solver = None
+        self.sweepSolutions = None
+        self.batchResponse = None
+        self.coherenceGroups = None
+        self.rhsGroups = None
+        self.memo = None
+        self.staleFactors = False
+        self.store = None
+        self.topology = None
 
     def add_component(self, component, name, nodes):
         """Adds component to model and updates the node list.
@@ -120,6 +246,167 @@ class Model:
         if not(node[0] in self.nodes):
             self.nodes[node[0]] = Node(node[0])
 
+    def set_solver(self, name='auto', **options):
+        """Sets the backend used to solve the network matrix equation.
+
+        For details on the available backends see :py:mod:`strapy.solvers`.
+        May be called before or after the model is built.
+
+        Parameters
+        ----------
+        name : str
+                Name of the solver backend: `'dense'`, `'lu'`, `'sparse'`,
+                `'iterative'` or `'auto'`. If `'auto'` the backend is chosen
+                from the shape and sparsity of the network matrix when the
+                model is built.
+        options
+                Keyword arguments passed to the solver backend.
+        """
+
+        if name != 'auto' and name not in solvers.SOLVERS:
+            raise Exception('Unknown solver {}.'.format(name))
+
+        self.solverName = name
+        self.solverOptions = options
+
+        if hasattr(self, 'matrixPattern'):
+            self._init_solver()
+
+    def set_memo(self, maxsize=128):
+        """Enables or disables memoisation of `evaluate()`.
+
+        With memoisation enabled, the solution and detector readout of each
+        evaluation are kept in a least recently used cache, keyed by a hash
+        of the values of all components (their `setVals()` outputs). An
+        evaluation that returns the model to a previously evaluated state,
+        as optimisers and interactive use often do, then takes its results
+        from the cache without solving. Results are copied into and out of
+        the cache, so the solution vector and detector readouts can be
+        changed in place as without memoisation.
+
+        Parameters
+        ----------
+        maxsize : int
+                Maximum number of cached evaluations. If None, memoisation is
+                disabled and the cache discarded.
+        """
+
+        if maxsize is None:
+            self.memo = None
+        else:
+            self.memo = LRUCache(maxsize)
+
+    def memo_stats(self):
+        """Returns statistics of the `evaluate()` memoisation cache.
+
+        Returns
+        -------
+        stats : dict
+                Number of cached evaluations (`size`), the cache size
+                (`maxsize`), numbers of `hits`, `misses` and `evictions`, and
+                the fraction of lookups that were hits (`hit_rate`).
+        """
+
+        if self.memo is None:
+            raise Exception('Memoisation is not enabled, see set_memo().')
+
+        lookups = self.memo.hits + self.memo.misses
+
+        return {'size': len(self.memo),
+                'maxsize': self.memo.maxsize,
+                'hits': self.memo.hits,
+                'misses': self.memo.misses,
+                'evictions': self.memo.evictions,
+                'hit_rate': self.memo.hits / lookups if lookups else 0.0}
+
+    def set_store(self, store):
+        """Sets the persistent result store consulted before solving.
+
+        With a store set, `evaluate()` and `evaluate_batch()` (and so all
+        sweeps, except those keeping full solution vectors) look up the
+        results of each state in the store before solving, and write the
+        results of any states they solve. Results are keyed by a hash of the
+        model topology and a hash of the values of all components, so a store
+        can be shared by many runs and models. See :py:mod:`strapy.store`.
+
+        Results of batched evaluations are written together as they are
+        solved. Results of single evaluations are held by the store and
+        written in bulk, so `store.flush()` or `store.close()` should be
+        called before other processes read the store; they are otherwise
+        written when the interpreter exits. Pending results of a store
+        replaced by this call are written.
+
+        Parameters
+        ----------
+        store : strapy.store.ResultStore or str
+                Result store, or the directory of a result store to be opened
+                or created. If None, no store is used.
+        """
+
+        if isinstance(store, str):
+            store = ResultStore(store)
+
+        if self.store is not None and self.store is not store:
+            self.store.flush()
+
+        self.store = store
+
+    def _topology_key(self):
+        """Returns a hash of the components, nodes and detectors of the model.
+        Should not be called externally."""
+
+        description = repr((
+            [(name, type(component).__module__, type(component).__qualname__,
+              component.nodes)
+             for name, component in self.components.items()],
+            [(name, detector.node) for name, detector in
+             self.detectors.items()],
+            list(self.nodeIndex)))
+
+        return hashlib.blake2b(description.encode(),
+                               digest_size=16).hexdigest()
+
+    def _state_keys(self, values=None):
+        """Returns hashes of the values of all components and the coherence
+        groups of sources, identifying the state of the model equation.
+
+        Returns the key of the current state, or of each point of a batch of
+        `values`, as passed to `evaluate_batch()` with shape
+        (N, len(setVals())). Should not be called externally.
+        """
+
+        values = {} if values is None else values
+        nPoints = len(next(iter(values.values()))) if values else 1
+
+        states = np.concatenate(
+            [np.broadcast_to(values[name], (nPoints, len(values[name][0])))
+             if name in values else
+             np.broadcast_to(component.stampedVals,
+                             (nPoints, len(component.stampedVals)))
+             for name, component in self.components.items()
+             if name in values or component.stampedVals is not None]
+            + [np.empty((nPoints, 0), dtype=complex)], axis=1)
+        states = np.ascontiguousarray(states, dtype=complex)
+        groups = self.rhsGroups.tobytes()
+
+        return [hashlib.blake2b(state.tobytes() + groups,
+                                digest_size=16).hexdigest()
+                for state in states]
+
+    def _init_solver(self):
+        """Initialises solver backend for the built network matrix.
+
+        Should not be called externally.
+        """
+
+        name = self.solverName
+        if name == 'auto':
+            name = solvers.select_solver(self.matrixShape, self.sparcity)
+
+        self.solver = solvers.SOLVERS[name](**self.solverOptions)
+        self.solver.setup(self.matrixShape, self.matrixPattern)
+        self.batchResponse = None
+
     def build(self, verbose=False):
         """Builds network matrix from defined components.
 
@@ -180,66 +467,115 @@ class Model:
         self.matrix = np.zeros(self.matrixShape, dtype=np.complex)
         self.rhs = np.zeros(rhsVector.shape, dtype=np.complex)
 
-        # These loops may be thread safe, other than the lambdify command, and
-        # the loops could therefore be parfored. Unknown if access to a sympy
-        # matrix is actually thread safe, needs testing.
+        # map each symbol to its owning component, so that matrix elements
+        # consisting of a single (possibly negated) symbol can be stamped
+        # directly.
+        symbolLookup = {}
+        for component in self.components.values():
+            for k, symbol in enumerate(component.symbols):
+                symbolLookup[symbol] = (component, k)
+
+        fusedMatrix = []
+        fusedRhs = []
+
+        # These loops may be thread safe, and could therefore be parfored.
+        # Unknown if access to a sympy matrix is actually thread safe, needs
+        # testing.
         for i in range(networkMatrix.shape[0]):
             for j in range(networkMatrix.shape[1]):
+                element = networkMatrix[i, j]
                 # isinstance() is significantly faster than .equals(0)
-                if not(isinstance(networkMatrix[i, j], sp.core.numbers.Zero)):
-                    if networkMatrix[i, j].is_constant():
-                        self.matrix[i, j] = sp.N(networkMatrix[i, j])
-                    else:
-                        for component in self.components.values():
-                            for k, symbol in enumerate(component.symbols):
-                                if len(networkMatrix[i, j].free_symbols) > 1:
-                                    print(
-                                        "Multiple symbols per matrix element",
-                                        ", falling back to lambdify matrix",
-                                        " setting.")
-                                    self.useLambdify = True
-                                    self.setMatrix = sp.lambdify(
-                                        self.matrixVariables,
-                                        networkMatrix,
-                                        modules=["numpy"])
-                                if networkMatrix[i, j] == symbol:
-                                    component.symbolIdxs[k].append((i, j, 1))
-                                if networkMatrix[i, j] == -symbol:
-                                    component.symbolIdxs[k].append((i, j, -1))
+                if isinstance(element, sp.core.numbers.Zero):
+                    continue
+                if element.is_constant():
+                    self.matrix[i, j] = sp.N(element)
+                elif element in symbolLookup:
+                    component, k = symbolLookup[element]
+                    component.symbolIdxs[k].append((i, j, 1))
+                elif -element in symbolLookup:
+                    component, k = symbolLookup[-element]
+                    component.symbolIdxs[k].append((i, j, -1))
+                else:
+                    fusedMatrix.append((i, j, element))
 
         # Again, may be threadable.
         for i in range(len(rhsVector)):
+            element = rhsVector[i]
             # isinstance() is significantly faster than .equals(0)
-            if not(isinstance(rhsVector[i], sp.core.numbers.Zero)):
-                if rhsVector[i].is_constant():
-                    self.rhs[i, j] = sp.N(rhsVector[i])
-                else:
-                    for component in self.components.values():
-                        for k, symbol in enumerate(component.symbols):
-                            if len(rhsVector[i].free_symbols) > 1:
-                                print(
-                                    "Multiple symbols per rhs vector element",
-                                    ", falling back to lambdify rhs vector",
-                                    " setting.")
-                                self.useLambdify = True
-                                self.setRhs = sp.lambdify(
-                                    self.rhsVariables,
-                                    rhsVector,
-                                    modules=["numpy"])
-                            if rhsVector[i] == symbol:
-                                component.symbolIdxs[k].append((i, 0, 1))
-                            if rhsVector[i] == -symbol:
-                                component.symbolIdxs[k].append((i, 0, -1))
+            if isinstance(element, sp.core.numbers.Zero):
+                continue
+            if element.is_constant():
+                self.rhs[i, 0] = sp.N(element)
+            elif element in symbolLookup:
+                component, k = symbolLookup[element]
+                component.symbolIdxs[k].append((i, 0, 1))
+            elif -element in symbolLookup:
+                component, k = symbolLookup[-element]
+                component.symbolIdxs[k].append((i, 0, -1))
+            else:
+                fusedRhs.append((i, 0, element))
+
+        # elements that are not a constant or a single symbol are evaluated
+        # together by one lambdified function, built once here, which returns
+        # only those elements.
+        self.fusedMatrixRows = np.array([e[0] for e in fusedMatrix], dtype=int)
+        self.fusedMatrixCols = np.array([e[1] for e in fusedMatrix], dtype=int)
+        self.setMatrix = None
+        if len(fusedMatrix) > 0:
+            self.useLambdify = True
+            self.setMatrix = sp.lambdify(self.matrixVariables,
+                                         [e[2] for e in fusedMatrix],
+                                         modules=["numpy"], cse=True)
+
+        self.fusedRhsRows = np.array([e[0] for e in fusedRhs], dtype=int)
+        self.fusedRhsCols = np.array([e[1] for e in fusedRhs], dtype=int)
+        self.setRhs = None
+        if len(fusedRhs) > 0:
+            self.useLambdify = True
+            self.setRhs = sp.lambdify(self.rhsVariables,
+                                      [e[2] for e in fusedRhs],
+                                      modules=["numpy"], cse=True)
+
+        # pass vector entries read by the lambdified elements; components
+        # whose values enter them cannot be differentiated through their
+        # stamped entries alone.
+        fusedSymbols = set().union(
+            *[e[2].free_symbols for e in fusedMatrix + fusedRhs])
+        self.fusedMatrixVariables = np.array(
+            [symbol in fusedSymbols for symbol in self.matrixVariables],
+            dtype=bool)
+        self.fusedRhsVariables = np.array(
+            [symbol in fusedSymbols for symbol in self.rhsVariables],
+            dtype=bool)
 
         # identify the location in the solution vector which the detector
         # should detect.
+        self.nodeIndex = {}
+        for i, node in enumerate(self.nodes.values()):
+            self.nodeIndex[node.name] = 4 * i
+
         for detector in self.detectors.values():
-            detector.node_index = self.symbols.index(
-                self.nodes[detector.node[0]].symbols[0])
+            detector.node_index = self.nodeIndex[detector.node[0]]
 
-        self.matrixPassVector = np.empty((len(self.matrixVariables),),
+        # all detectors are read out together, by gathering their amplitudes
+        # from the solution vector with a single index array. Detectors share
+        # the readout dictionary, which is updated in place on evaluation.
+        self.detectorIndex = np.array(
+            [detector.node_index + np.arange(4)
+             for detector in self.detectors.values()],
+            dtype=int).reshape(-1, 4)
+        self.detectorProperties = ('amplitude',) + tuple(
+            prop for prop in PROPERTIES[1:]
+            if any(prop in detector.properties
+                   for detector in self.detectors.values()))
+        self.detectorReadout = {}
+        for row, detector in enumerate(self.detectors.values()):
+            detector.readout = self.detectorReadout
+            detector.row = row
+
+        self.matrixPassVector = np.zeros((len(self.matrixVariables),),
                                          dtype=np.complex)
-        self.rhsPassVector = np.empty((len(self.rhsVariables),),
+        self.rhsPassVector = np.zeros((len(self.rhsVariables),),
                                       dtype=np.complex)
 
         self.sparcity = len(self.matrixPassVector) \
@@ -247,6 +583,18 @@ class Model:
 
         # Should be threadable.
         for component in self.components.values():
+            # flatten symbol locations into index arrays, so that changed
+            # entries can be written in a single assignment when evaluating.
+            stampIdxs = [(k, index[0], index[1], index[2])
+                         for k, symbol in enumerate(component.symbolIdxs)
+                         for index in symbol]
+            stampIdxs = np.array(stampIdxs, dtype=int).reshape(-1, 4)
+            component.stampSymbols = stampIdxs[:, 0]
+            component.stampRows = stampIdxs[:, 1]
+            component.stampCols = stampIdxs[:, 2]
+            component.stampSigns = stampIdxs[:, 3]
+            component.stampedVals = None
+
             # print(component.name, component.symbols, component.symbolIdxs)
             if isinstance(component, components.Source):
                 component.set_slice = slice(self.rhsVariables.index(
@@ -259,30 +607,168 @@ class Model:
                     self.matrixVariables.index(component.symbols[0])
                     + len(component.symbols))
 
+        # all elements of the network matrix that may be non-zero; constant
+        # elements have already been set, component and lambdified elements
+        # are set on evaluation.
+        patternRows = [np.nonzero(self.matrix)[0], self.fusedMatrixRows]
+        patternCols = [np.nonzero(self.matrix)[1], self.fusedMatrixCols]
+        for component in self.components.values():
+            if not(isinstance(component, components.Source)):
+                patternRows.append(component.stampRows)
+                patternCols.append(component.stampCols)
+        pattern = np.unique(np.ravel_multi_index(
+            (np.concatenate(patternRows), np.concatenate(patternCols)),
+            self.matrixShape))
+        self.matrixPattern = np.unravel_index(pattern, self.matrixShape)
+
+        self._group_sources()
+        self._init_solver()
+        self.topology = self._topology_key()
+
         if verbose:
             print('\nNetwork built, {} matrix.\n'.format(networkMatrix.shape))
 
-    def _update(self):
-        """Updates numerical values in model matrix.
+    def _group_sources(self):
+        """Assigns each right hand side element to the coherence group of its
+        source.
+
+        Called when the model is built, and when the coherence group of a
+        source is changed. Should not be called externally.
+        """
+
+        self.coherenceGroups = []
+        self.rhsGroups = np.zeros(self.matrixShape[0], dtype=int)
+
+        for component in self.components.values():
+            if isinstance(component, components.Source):
+                if component.coherence_group not in self.coherenceGroups:
+                    self.coherenceGroups.append(component.coherence_group)
+                self.rhsGroups[component.stampRows] = \
+                    self.coherenceGroups.index(component.coherence_group)
+
+        if len(self.coherenceGroups) > 1 and len(self.fusedRhsRows) > 0:
+            raise Exception('Right hand side elements combining several '
+                            'sources cannot be split into coherence groups.')
+
+        # solutions for the previous grouping are no longer valid.
+        self.solution_vector = None
+        self.batchResponse = None
+
+    def _group_rhs(self):
+        """Returns the right hand side vector split into one column for each
+        coherence group. Should not be called externally."""
+
+        rhs = np.zeros((self.matrixShape[0], len(self.coherenceGroups)),
+                       dtype=complex)
+        rhs[np.arange(self.matrixShape[0]), self.rhsGroups] = self.rhs[:, 0]
+
+        return rhs
+
+    def _detect(self, amplitudes, axis=None):
+        """Calculates detected properties from amplitudes with coherence
+        groups along the second last axis.
+
+        Powers are summed incoherently over groups; amplitudes and phases
+        keep the group axis, which is dropped for models with a single
+        coherence group. Should not be called externally.
+        """
+
+        readout = calculate_properties(amplitudes, self.detectorProperties,
+                                       axis=axis)
+        groupAxis = amplitudes.ndim - 2
+
+        if amplitudes.shape[groupAxis] == 1:
+            return {prop: np.take(readout[prop], 0, axis=groupAxis)
+                    for prop in readout}
+
+        for prop in readout:
+            if prop in POWER_PROPERTIES:
+                readout[prop] = np.sum(readout[prop], axis=groupAxis)
+
+        return readout
+
+    def _stamp(self):
+        """Writes changed component values into the matrix equation.
 
-        Model must have been built first.
+        Values returned by `setVals()` for each updated component are compared
+        with the values last written to the matrix equation, and only entries
+        that differ are overwritten. Model must have been built first.
         Should not be called externally.
+
+        Returns
+        -------
+        matrixChanged : bool
+                True if any entry in the network matrix has changed.
+        rhsChanged : bool
+                True if any entry in the right hand side vector has changed.
         """
 
+        matrixChanged = False
+        rhsChanged = False
+
         # Threadable
         for key in self.updated:
-            if isinstance(self.components[key], components.Source):
-                self.rhsPassVector[self.components[key].set_slice] = \
-                    self.components[key].setVals()
-            elif not(isinstance(self.components[key], components.Dump)):
-                self.matrixPassVector[self.components[key].set_slice] = \
-                    self.components[key].setVals()
+            component = self.components[key]
+
+            if isinstance(component, components.Dump):
+                continue
+
+            vals = np.array(component.setVals(), dtype=complex)
+
+            if component.stampedVals is None:
+                differs = np.ones(vals.shape, dtype=bool)
+            else:
+                differs = vals != component.stampedVals
+                if not(differs.any()):
+                    continue
+
+            component.stampedVals = vals
+            entries = differs[component.stampSymbols]
+
+            if isinstance(component, components.Source):
+                target = self.rhs
+                self.rhsPassVector[component.set_slice] = vals
+                rhsChanged = True
+            else:
+                target = self.matrix
+                self.matrixPassVector[component.set_slice] = vals
+                matrixChanged = True
+
+            target[component.stampRows[entries],
+                   component.stampCols[entries]] = \
+                vals[component.stampSymbols[entries]] \
+                * component.stampSigns[entries]
+
         self.updated.clear()
 
+        if matrixChanged or rhsChanged:
+            self.batchResponse = None
+
+        if matrixChanged and self.setMatrix is not None:
+            self.matrix[self.fusedMatrixRows, self.fusedMatrixCols] = \
+                self.setMatrix(*self.matrixPassVector)
+        if rhsChanged and self.setRhs is not None:
+            self.rhs[self.fusedRhsRows, self.fusedRhsCols] = \
+                self.setRhs(*self.rhsPassVector)
+
+        return matrixChanged, rhsChanged
+
     def evaluate(self, timing=False):
         """Solve the network matrix and log optical properties at detectors.
 
-        `build()` must have been called before the model is evaluated.
+        `build()` must have been called before the model is evaluated. If no
+        component values have changed since the last evaluation the previous
+        solution is kept and the network matrix is not solved again. If
+        memoisation is enabled (see `set_memo()`), or a result store set
+        (see `set_store()`), results of earlier evaluations of the same state
+        are reused in the same way.
+
+        Sources in different coherence groups (see
+        `Source.set_coherence_group()`) are solved as separate right hand
+        side columns of a single solve, so the network matrix is factorised
+        once however many groups there are. Detected powers are summed
+        incoherently over groups, while detected amplitudes and phases have
+        an extra axis, before the last, for each group of `coherenceGroups`.
 
         Parameters
         ----------
@@ -292,66 +778,1209 @@ class Model:
                 equation (`solve_time`) and pull out the detected values
                 (`detector_time`) are returned."""
 
+        set_time = timeit.default_timer()
+
+        matrixChanged, rhsChanged = self._stamp()
+
+        set_time = timeit.default_timer() - set_time
+
+        solve = matrixChanged or rhsChanged or self.solution_vector is None
+
+        cached = None
+        if solve and (self.memo is not None or self.store is not None):
+            key = self._state_keys()[0]
+            if self.memo is not None:
+                cached = self.memo.get(key)
+            if cached is None and self.store is not None:
+                stored = self.store.get(self.topology, 'solution', key)
+                if stored is not None:
+                    cached = (stored, None)
+
+        solve_time = timeit.default_timer()
+        readout = None
+        if cached is not None:
+            # the solver has not seen the current network matrix.
+            self.staleFactors = self.staleFactors or matrixChanged
+            # copies, so that cached results are not changed through the
+            # model or its detectors.
+            self.solution_vector = cached[0].copy()
+            if cached[1] is not None:
+                readout = {prop: value.copy()
+                           for prop, value in cached[1].items()}
+        elif solve:
+            self.solution_vector = self.solver.solve(
+                self.matrix, self._group_rhs(),
+                matrixChanged or self.staleFactors)
+            self.staleFactors = False
+            if self.store is not None:
+                self.store.put(self.topology, 'solution', key,
+                               self.solution_vector)
+        solve_time = timeit.default_timer() - solve_time
+
+        detector_time = timeit.default_timer()
+        if solve and readout is None:
+            readout = self._detect(np.moveaxis(
+                self.solution_vector[self.detectorIndex], -1, -2))
+
+            if self.memo is not None:
+                self.memo.put(key, (self.solution_vector.copy(),
+                                    {prop: value.copy()
+                                     for prop, value in readout.items()}))
+        if solve:
+            self.detectorReadout.update(readout)
+        detector_time = timeit.default_timer() - detector_time
+
         if timing:
-            set_time = timeit.default_timer()
-
-            if not(self.useLambdify):
-                for key in self.updated:
-                    if isinstance(self.components[key], components.Source):
-                        vals = self.components[key].setVals()
-                        for i, index in enumerate(
-                                self.components[key].symbolIdxs):
-                            self.rhs[index[0]] = vals[i] * index[2]
-                    elif not(isinstance(self.components[key],
-                                        components.Dump)):
-                        vals = self.components[key].setVals()
-                        for i, index in enumerate(
-                                self.components[key].symbolIdxs):
-                            self.matrix[index[0], index[1]
-                                        ] = vals[i] * index[2]
-                self.updated.clear()
+            return (set_time, solve_time, detector_time)
+
+    def evaluate_batch(self, values, fields=False):
+        """Solve the network matrix for a batch of component values.
+
+        Each point in the batch is the current state of the model with the
+        values of the given components replaced. If the changed matrix
+        elements are confined to a small fraction of the network matrix rows,
+        all points are found from a single solve of the current network matrix
+        by low rank (Woodbury) updates; otherwise the network matrices of all
+        points are solved together in chunks. Coherence groups are solved
+        and detected as in `evaluate()`. The current state of the model, and
+        its detectors, are not changed.
+
+        `build()` must have been called before the model is evaluated.
+
+        Parameters
+        ----------
+        values : dict
+                Numerical component values for each point, as returned by the
+                component's `setVals()`, keyed by component name. Each entry
+                has shape (N, len(setVals())).
+        fields : bool
+                If true, full solution vectors are calculated and stored in
+                `sweepSolutions`, for use with `field_map()`. Otherwise only
+                the detected nodes are calculated.
+
+        Returns
+        -------
+        results : dict
+                Detected properties for each detector, keyed by detector name.
+                Each entry is a dict of arrays with leading dimension N, keyed
+                by property name.
+        """
+
+        self._stamp()
+
+        n = self.matrixShape[0]
+        nPoints = None
+
+        batch = {}
+        for name, vals in values.items():
+            vals = np.asarray(vals, dtype=complex)
+            batch[name] = vals.reshape(vals.shape[0], -1)
+
+            if nPoints is None:
+                nPoints = vals.shape[0]
+            elif vals.shape[0] != nPoints:
+                raise Exception('Batched values for {} have {} points, '
+                                'expected {}.'.format(name, vals.shape[0],
+                                                      nPoints))
+
+        if nPoints is None or nPoints == 0:
+            raise Exception('No batched values to evaluate.')
+
+        if fields:
+            targets = np.arange(n)
+        else:
+            targets = self.detectorIndex.flatten()
+
+        if self.store is not None and not(fields):
+            solutions = self._stored_batch(batch, targets)
+        else:
+            solutions = self._solve_batch(batch, targets)
+
+        if fields:
+            self.sweepSolutions = solutions
+            amplitudes = solutions[:, self.detectorIndex]
+        else:
+            self.sweepSolutions = None
+            amplitudes = solutions.reshape(nPoints, -1, 4, solutions.shape[-1])
+
+        readout = self._detect(np.moveaxis(amplitudes, -1, -2), axis=0)
+
+        results = {}
+        for row, detector in enumerate(self.detectors.values()):
+            results[detector.name] = {
+                prop: readout[prop][:, row] for prop in readout}
+
+        return results
+
+    def _solve_batch(self, values, targets, columns=()):
+        """Solves a batch of component values, as passed to
+        `evaluate_batch()` with shape (N, len(setVals())), for the solution
+        vector elements `targets`.
+
+        The responses to unit right hand side vectors in rows `columns`,
+        columns of the inverse network matrix of each point, are solved
+        together with the solutions. Should not be called externally.
+
+        Returns
+        -------
+        solutions : ndarray
+                Solution vector elements with shape
+                (N, len(targets), len(coherenceGroups) + len(columns)),
+                followed by the responses to each of `columns`.
+        """
+
+        n = self.matrixShape[0]
+        nPoints = len(next(iter(values.values())))
+
+        matrixRows, matrixCols, matrixVals = [], [], []
+        rhsRows, rhsVals = [], []
+        matrixPass, rhsPass = None, None
+
+        for name, vals in values.items():
+            component = self.components[name]
+
+            entries = vals[:, component.stampSymbols] * component.stampSigns
+
+            if isinstance(component, components.Source):
+                rhsRows.append(component.stampRows)
+                rhsVals.append(entries)
+                if len(self.fusedRhsRows) > 0:
+                    if rhsPass is None:
+                        rhsPass = np.tile(self.rhsPassVector, (nPoints, 1))
+                    rhsPass[:, component.set_slice] = vals
             else:
-                self._update()
-                self.matrix = self.setMatrix(*self.matrixPassVector)
-                self.rhs = self.setRhs(*self.rhsPassVector)
+                matrixRows.append(component.stampRows)
+                matrixCols.append(component.stampCols)
+                matrixVals.append(entries)
+                if len(self.fusedMatrixRows) > 0:
+                    if matrixPass is None:
+                        matrixPass = np.tile(self.matrixPassVector,
+                                             (nPoints, 1))
+                    matrixPass[:, component.set_slice] = vals
 
-            set_time = timeit.default_timer() - set_time
+        # lambdified elements are evaluated for all points at once.
+        if matrixPass is not None:
+            matrixRows.append(self.fusedMatrixRows)
+            matrixCols.append(self.fusedMatrixCols)
+            matrixVals.append(np.stack(
+                [np.broadcast_to(val, (nPoints,)) for val in
+                 self.setMatrix(*matrixPass.T)], axis=1))
+        if rhsPass is not None:
+            rhsRows.append(self.fusedRhsRows)
+            rhsVals.append(np.stack(
+                [np.broadcast_to(val, (nPoints,)) for val in
+                 self.setRhs(*rhsPass.T)], axis=1))
 
-            solve_time = timeit.default_timer()
-            self.solution_vector = np.linalg.solve(self.matrix, self.rhs)
-            solve_time = timeit.default_timer() - solve_time
+        matrixRows = np.concatenate(matrixRows + [np.empty(0, dtype=int)])
+        matrixCols = np.concatenate(matrixCols + [np.empty(0, dtype=int)])
+        matrixVals = np.concatenate(
+            matrixVals + [np.empty((nPoints, 0), dtype=complex)], axis=1)
+        rhsRows = np.concatenate(rhsRows + [np.empty(0, dtype=int)])
+        rhsVals = np.concatenate(
+            rhsVals + [np.empty((nPoints, 0), dtype=complex)], axis=1)
 
-            detector_time = timeit.default_timer()
-            for detector in self.detectors.values():
-                detector.update(self.solution_vector)
-            detector_time = timeit.default_timer() - detector_time
+        columns = np.asarray(columns, dtype=int)
 
-            return (set_time, solve_time, detector_time)
+        if len(np.unique(matrixRows)) <= REDUCED_FRACTION * n:
+            return self._reduced_batch(matrixRows, matrixCols, matrixVals,
+                                       rhsRows, rhsVals, targets, columns)
+
+        return self._dense_batch(matrixRows, matrixCols, matrixVals, rhsRows,
+                                 rhsVals, targets, columns)
+
+    def _stored_batch(self, values, targets):
+        """Returns the solutions of a batch, as `_solve_batch()`, taking the
+        points found in the result store from the store, and solving and
+        storing the rest together. Should not be called externally."""
+
+        states = self._state_keys(values)
+        found, stored = self.store.get_many(self.topology, 'detectors',
+                                            states)
+
+        if found.all():
+            return stored
+
+        missing = np.logical_not(found)
+        solved = self._solve_batch(
+            {name: vals[missing] for name, vals in values.items()}, targets)
+        self.store.put_many(self.topology, 'detectors',
+                            [state for state, hit in zip(states, found)
+                             if not(hit)], solved)
+
+        if stored is None:
+            return solved
+
+        solutions = np.empty((len(states),) + solved.shape[1:], dtype=complex)
+        solutions[found] = stored
+        solutions[missing] = solved
+
+        return solutions
+
+    def _reduced_batch(self, matrixRows, matrixCols, matrixVals, rhsRows,
+                       rhsVals, targets, columns):
+        """Solves a batch by low rank updates of the current network matrix.
+
+        With the changed matrix elements in rows R and columns C, the change
+        to the network matrix is P_R D P_C^T, for a small matrix D at each
+        point, and the Woodbury identity gives each solution from the current
+        solution and the responses to unit vectors in rows R. Each coherence
+        group has its own current solution and rhs changes, and each of the
+        unit vectors in rows `columns` is treated as a further group with no
+        rhs changes. Should not be called externally.
+        """
+
+        n = self.matrixShape[0]
+        nPoints = matrixVals.shape[0]
+        nGroups = len(self.coherenceGroups) + len(columns)
+
+        R, rowPos = np.unique(matrixRows, return_inverse=True)
+        C, colPos = np.unique(matrixCols, return_inverse=True)
+        Rb, rhsPos = np.unique(rhsRows, return_inverse=True)
+
+        # responses of the current network to the current rhs, and to unit
+        # vectors in the changed matrix rows and rhs elements. These are kept
+        # until the model changes, so repeated batches changing the same
+        # elements need no further solves of the network matrix.
+        key = (R.tobytes(), Rb.tobytes(), columns.tobytes())
+        if self.batchResponse is not None and self.batchResponse[0] == key:
+            response = self.batchResponse[1]
+        else:
+            block = np.zeros((n, nGroups + len(R) + len(Rb)), dtype=complex)
+            block[:, :nGroups - len(columns)] = self._group_rhs()
+            block[columns, nGroups - len(columns) + np.arange(len(columns))] \
+                = 1
+            block[R, nGroups + np.arange(len(R))] = 1
+            block[Rb, nGroups + len(R) + np.arange(len(Rb))] = 1
+            response = self.solver.solve(self.matrix, block)
+            self.batchResponse = (key, response)
+
+        x0 = response[:, :nGroups]
+        Z = response[:, nGroups:nGroups + len(R)]
+        Zb = response[:, nGroups + len(R):]
+
+        # rhs changes of each group, with shape (N, groups, len(Rb)).
+        beta = np.zeros((nPoints, 1, len(Rb)), dtype=complex)
+        beta[:, 0, rhsPos] = rhsVals - self.rhs[rhsRows, 0]
+        beta = beta * (self.rhsGroups[Rb] == np.arange(nGroups)[:, np.newaxis])
+
+        solutions = x0[targets].T + beta @ Zb[targets].T
+
+        if len(R) > 0:
+            D = np.zeros((nPoints, len(R), len(C)), dtype=complex)
+            D[:, rowPos, colPos] = matrixVals \
+                - self.matrix[matrixRows, matrixCols]
+
+            yC = x0[C].T + beta @ Zb[C].T
+            S = np.identity(len(R)) + D @ Z[C]
+            u = np.linalg.solve(S, D @ np.swapaxes(yC, 1, 2))
+
+            solutions -= np.swapaxes(u, 1, 2) @ Z[targets].T
+
+        return np.swapaxes(solutions, 1, 2)
+
+    def _dense_batch(self, matrixRows, matrixCols, matrixVals, rhsRows,
+                     rhsVals, targets, columns):
+        """Solves a batch by solving the network matrix of every point.
+
+        Points are solved in chunks, limited in memory by `BATCH_MEMORY`.
+        Should not be called externally.
+        """
+
+        n = self.matrixShape[0]
+        nPoints = matrixVals.shape[0]
+        chunk = max(1, BATCH_MEMORY // (16 * n * n))
+        groupRhs = np.zeros((n, len(self.coherenceGroups) + len(columns)),
+                            dtype=complex)
+        groupRhs[:, :len(self.coherenceGroups)] = self._group_rhs()
+        groupRhs[columns, len(self.coherenceGroups)
+                 + np.arange(len(columns))] = 1
+
+        solutions = np.empty((nPoints, len(targets), groupRhs.shape[1]),
+                             dtype=complex)
+
+        for start in range(0, nPoints, chunk):
+            stop = min(start + chunk, nPoints)
+
+            matrix = np.repeat(self.matrix[np.newaxis], stop - start, axis=0)
+            matrix[:, matrixRows, matrixCols] = matrixVals[start:stop]
+            rhs = np.repeat(groupRhs[np.newaxis], stop - start, axis=0)
+            rhs[:, rhsRows, self.rhsGroups[rhsRows]] = rhsVals[start:stop]
+
+            solutions[start:stop] = np.linalg.solve(matrix, rhs)[:, targets]
+
+        return solutions
+
+    def sweep(self, setter, points, fields=False):
+        """Evaluate the model at a sequence of points as a single batch.
+
+        For each point `setter(point)` is called, which should set component
+        properties in the same way as before a call to `evaluate()`, for
+        example through `Stack.set_length()`. The values of all changed
+        components are collected and evaluated together by `evaluate_batch()`.
+        Components are left in the state of the last point, and will be
+        updated in the network matrix on the next evaluation.
+
+        Parameters
+        ----------
+        setter : callable
+                Function setting the model state for a single point.
+        points : iterable
+                Points passed to `setter`.
+        fields : bool
+                If true, the solution vectors of all points are kept for use
+                with `field_map()`.
+
+        Returns
+        -------
+        results : dict
+                Detected properties for each detector, keyed by detector name,
+                see `evaluate_batch()`.
+        """
+
+        self._stamp()
+
+        current = {}
+        changes = []
+
+        for point in points:
+            setter(point)
+            for key in self.updated:
+                if not(isinstance(self.components[key], components.Dump)):
+                    current[key] = np.array(self.components[key].setVals(),
+                                            dtype=complex)
+            changes.append(dict(current))
+            self.updated.clear()
+
+        # components changed part way through the sweep keep their current
+        # values for earlier points.
+        values = {}
+        for key in current:
+            values[key] = np.array(
+                [change.get(key, self.components[key].stampedVals)
+                 for change in changes])
+
+        self.updated.extend(current.keys())
+
+        return self.evaluate_batch(values, fields=fields)
+
+    def adaptive_sweep(self, setter, start, stop, tolerance=1e-3,
+                       detectors=None, prop='intensity', initial=17,
+                       max_points=2049):
+        """Evaluate the model over a range of points, refining the sampling
+        where detected values change rapidly.
+
+        The range is first sampled at `initial` evenly spaced points. The
+        error of linear interpolation on each interval is then estimated from
+        the local curvature of the detected values, and every interval whose
+        error exceeds the tolerance is split at its midpoint. All midpoints
+        of a refinement pass are evaluated together by `sweep()`, and passes
+        continue until no interval exceeds the tolerance or `max_points` have
+        been evaluated, when the intervals with the largest errors are
+        refined first and a warning gives the largest remaining error if it
+        still exceeds the tolerance. Sharp features, such as cavity
+        resonances, are resolved with far fewer points than a uniform sweep,
+        provided the initial sampling sees each feature at least once.
+
+        Components are left in the state of the last point evaluated.
+
+        Parameters
+        ----------
+        setter : callable
+                Function setting the model state for a single point, as for
+                `sweep()`.
+        start : double
+                First point of the range.
+        stop : double
+                Last point of the range.
+        tolerance : double
+                Target interpolation error, as a fraction of the range of
+                values at each detector.
+        detectors : list of str
+                Detectors whose values drive the refinement. Defaults to all
+                detectors detecting `prop`.
+        prop : str
+                Detected property driving the refinement, which must have a
+                single value for each point, for example `'intensity'`.
+        initial : int
+                Number of points of the initial sampling, at least 3.
+        max_points : int
+                Maximum number of points evaluated.
+
+        Returns
+        -------
+        points : ndarray
+                Evaluated points, in increasing order.
+        results : dict
+                Detected properties for each detector at each point, keyed by
+                detector name, see `evaluate_batch()`.
+        """
+
+        if detectors is None:
+            detectors = [name for name, detector in self.detectors.items()
+                         if prop in detector.properties]
+        if len(detectors) == 0:
+            raise Exception('No detectors detect {}.'.format(prop))
+        if initial < 3:
+            raise Exception('Adaptive sweeps need at least 3 initial points.')
+        if start == stop:
+            raise Exception('Adaptive sweeps need a range of points, not a '
+                            'single point {}.'.format(start))
+
+        samples = np.linspace(start, stop, initial)
+        passes = [self.sweep(setter, samples)]
+
+        while True:
+            results = _concatenate(passes)
+            order = np.argsort(samples, kind='stable')
+            points = samples[order]
+
+            values = np.stack([results[name][prop][order]
+                               for name in detectors])
+            if values.ndim != 2:
+                raise Exception('Adaptive sweeps need a property with a '
+                                'single value, not {}.'.format(prop))
+
+            # errors relative to the range of each detector's values.
+            scale = np.ptp(values, axis=1)[:, np.newaxis]
+            errors = np.max(_interpolation_errors(points, values)
+                            / np.where(scale > 0, scale, 1), axis=0)
+
+            refine = np.nonzero(errors > tolerance)[0]
+            budget = max_points - len(points)
+            if len(refine) == 0:
+                break
+            if budget <= 0:
+                warnings.warn('Adaptive sweep reached {} points with an '
+                              'interpolation error of {:.3g}, above the '
+                              'tolerance of {:.3g}.'.format(
+                                  len(points), np.max(errors), tolerance))
+                break
+            if len(refine) > budget:
+                refine = refine[np.argsort(errors[refine])[::-1][:budget]]
+
+            midpoints = (points[refine] + points[refine + 1]) / 2
+            passes.append(self.sweep(setter, midpoints))
+            samples = np.concatenate((samples, midpoints))
+
+        return points, {name: {key: results[name][key][order]
+                               for key in results[name]}
+                        for name in results}
+
+    def simulate_trajectory(self, stack, lengths, chunk=TRAJECTORY_CHUNK,
+                            loss=0):
+        """Evaluate detector signals along a trajectory of stack lengths.
+
+        A generator that evaluates the model for each length of `stack` in
+        turn, with all other components in their current state. Lengths are
+        taken from `lengths` in chunks of `chunk` points, each evaluated as a
+        single batch by `evaluate_batch()`, so that memory use does not depend
+        on the length of the trajectory and `lengths` may itself be a
+        generator. For most models the low rank batched path is used, and the
+        network matrix is solved only once for the whole trajectory. Phases
+        are unwrapped continuously across chunks.
+
+        The model state, including `stack`, is not changed.
+
+        Parameters
+        ----------
+        stack : str
+                Name of the `Stack` component to be moved.
+        lengths : iterable
+                Optical thickness of the stack in units of wavelength at each
+                point of the trajectory.
+        chunk : int
+                Number of points evaluated together.
+        loss : double
+                Intensity loss for propagation through the stack.
+
+        Yields
+        ------
+        results : dict
+                Detected properties for each point of the chunk, keyed by
+                detector name, see `evaluate_batch()`.
+        """
+
+        component = self.components[stack]
+
+        if not(isinstance(component, components.Stack)):
+            raise Exception('{} is not a Stack.'.format(stack))
+
+        return self._evaluate_chunks(
+            lambda points: {stack: component.length_values(points, loss)},
+            lengths, chunk)
+
+    def _evaluate_chunks(self, values, points, chunk):
+        """Generator evaluating a long batch in chunks of `chunk` points.
+
+        `values(points)` returns the batched component values of a chunk, as
+        passed to `evaluate_batch()`. Phases are made continuous across
+        chunks. Should not be called externally.
+        """
+
+        previous = None
+
+        for chunkPoints in _chunks(points, chunk):
+            results = self.evaluate_batch(values(chunkPoints))
+
+            # shift each chunk's phases by whole cycles to continue from the
+            # last point of the previous chunk.
+            if 'phase' in self.detectorProperties:
+                if previous is not None:
+                    for name in results:
+                        phase = results[name]['phase']
+                        phase += 2 * np.pi * np.round(
+                            (previous[name] - phase[0]) / (2 * np.pi))
+                previous = {name: results[name]['phase'][-1]
+                            for name in results}
+
+            yield results
+
+    def set_wavelength(self, wavelength):
+        """Sets the vacuum wavelength of the illuminating light.
+
+        Wavelength dependent components are updated for the new wavelength:
+        stacks with a physical optical path length or multilayer, set with
+        `Stack.set_path_length()`, `Stack.set_material()`,
+        `Stack.set_layers()` or `Stack.set_periodic()`, and waveplates with
+        a physical `path_difference` or materials. Stacks set with
+        `Stack.set_length()` are in units of wavelength, and are not changed.
+
+        Parameters
+        ----------
+        wavelength : float
+                The vacuum (n = 1) wavelength of illuminating light.
+        """
+
+        self.wavelength = wavelength
+
+        for component in self.components.values():
+            if isinstance(component, (components.Stack,
+                                      components.Waveplate)):
+                component.update_wavelength()
+
+    def frequency_trajectory(self, frequencies, chunk=TRAJECTORY_CHUNK):
+        """Evaluate detector outputs along a series of source optical
+        frequencies.
+
+        The generator form of `frequency_sweep()`: frequencies are taken from
+        `frequencies` in chunks of `chunk` points, each evaluated as a single
+        batch by `evaluate_batch()`, so that memory use does not depend on the
+        number of frequencies and `frequencies` may itself be a generator.
+        Phases are unwrapped continuously across chunks, and the model state
+        is not changed.
+
+        Parameters
+        ----------
+        frequencies : iterable
+                Vacuum optical frequency, in Hz, at each point.
+        chunk : int
+                Number of points evaluated together.
+
+        Yields
+        ------
+        results : dict
+                Detected properties for each point of the chunk, keyed by
+                detector name, see `evaluate_batch()`.
+        """
+
+        stacks = [component for component in self.components.values()
+                  if isinstance(component, components.Stack)
+                  and component.optical_lengths(self.wavelength) is not None]
+
+        if len(stacks) == 0:
+            raise Exception('No stacks have a physical path length set.')
+
+        return self._evaluate_chunks(
+            lambda points: {stack.name: stack.path_values(points)
+                            for stack in stacks},
+            frequencies, chunk)
+
+    def frequency_sweep(self, frequencies, chunk=TRAJECTORY_CHUNK):
+        """Evaluate detector outputs for a series of source optical
+        frequencies.
+
+        The phase of every stack with a physical optical path length, set
+        with `Stack.set_path_length()` or `Stack.set_material()`, changes in
+        proportion to its length and the optical frequency; all other
+        components are kept in their current state. This models laser
+        frequency (or wavelength) modulation and scanning, for example phase
+        generated carrier or frequency scanning interferometry, where
+        `frequencies` is the instantaneous source frequency at each sample
+        time. Points are evaluated as batches
+        of `chunk` points by `evaluate_batch()`, and the model state is not
+        changed. All results are held in memory; use `frequency_trajectory()`
+        to process long series chunk by chunk.
+
+        Parameters
+        ----------
+        frequencies : array_like
+                Vacuum optical frequency, in Hz, at each point.
+        chunk : int
+                Number of points evaluated together.
+
+        Returns
+        -------
+        results : dict
+                Detected properties for each detector, keyed by detector name,
+                see `evaluate_batch()`.
+        """
+
+        return _concatenate(self.frequency_trajectory(
+            np.asarray(frequencies, dtype=float), chunk))
+
+    def spectral_sweep(self, wavelengths, chunk=TRAJECTORY_CHUNK):
+        """Evaluate detector outputs over a range of wavelengths.
+
+        The matrices of all wavelength dependent components (see
+        `set_wavelength()`) are recalculated at each wavelength, and all
+        wavelengths solved as a batch by `evaluate_batch()`, in chunks of
+        `chunk` points. Other components are kept in their current state, and
+        the model state is not changed.
+
+        Parameters
+        ----------
+        wavelengths : array_like
+                Vacuum wavelength, in metres, at each point.
+        chunk : int
+                Number of points evaluated together.
+
+        Returns
+        -------
+        results : dict
+                Detected properties for each detector, keyed by detector name,
+                see `evaluate_batch()`.
+        """
+
+        dependent = self._wavelength_dependent()
+
+        return _concatenate(self._evaluate_chunks(
+            lambda points: {component.name: component.wavelength_values(points)
+                            for component in dependent},
+            np.asarray(wavelengths, dtype=float), chunk))
+
+    def _wavelength_dependent(self):
+        """Returns the components whose values depend on wavelength. Should
+        not be called externally."""
+
+        dependent = [component for component in self.components.values()
+                     if isinstance(component, (components.Stack,
+                                               components.Waveplate))
+                     and component.wavelength_values([self.wavelength])
+                     is not None]
+
+        if len(dependent) == 0:
+            raise Exception('No components depend on wavelength.')
+
+        return dependent
+
+    def _heterodyne_values(self):
+        """Returns the two optical frequencies of a heterodyne model, and the
+        values of its sources and frequency dependent components at each,
+        with shape (2, len(setVals())). Should not be called externally."""
+
+        sources = [component for component in self.components.values()
+                   if isinstance(component, components.Source)]
+        offsets = sorted(set(source.frequency_offset for source in sources))
+
+        if len(offsets) != 2:
+            raise Exception('Heterodyne models must have sources at two '
+                            'frequencies, not {}.'.format(len(offsets)))
+
+        # only mutually coherent fields at the two frequencies beat.
+        groups = [set(source.coherence_group for source in sources
+                      if source.frequency_offset == offset)
+                  for offset in offsets]
+        if len(groups[0] & groups[1]) == 0:
+            raise Exception('Sources at the two heterodyne frequencies are in '
+                            'different coherence groups, so do not beat.')
+
+        frequencies = components.SPEED_OF_LIGHT / self.wavelength \
+            + np.array(offsets)
+
+        # each source emits only at its own frequency.
+        values = {}
+        for source in sources:
+            vals = np.array(source.setVals(), dtype=complex)
+            values[source.name] = np.array(
+                [vals if source.frequency_offset == offset else 0 * vals
+                 for offset in offsets])
+
+        for component in self.components.values():
+            if isinstance(component, (components.Stack,
+                                      components.Waveplate)):
+                vals = component.wavelength_values(
+                    components.SPEED_OF_LIGHT / frequencies)
+                if vals is not None:
+                    values[component.name] = vals
+
+        return frequencies, values
+
+    def _beats(self, results, nPoints):
+        """Returns the beat signals and detected powers of each detector from
+        `evaluate_batch()` results for `nPoints` points at the first
+        frequency followed by the same points at the second. Beat phases are
+        wrapped. Should not be called externally."""
+
+        heterodyne = {}
+        for name, result in results.items():
+            low = result['amplitude'][:nPoints].reshape(nPoints, -1)
+            high = result['amplitude'][nPoints:].reshape(nPoints, -1)
+            beat = 2 * np.sum(low * np.conj(high), axis=1)
+
+            heterodyne[name] = {
+                prop: result[prop][:nPoints] + result[prop][nPoints:]
+                for prop in result if prop in POWER_PROPERTIES}
+            heterodyne[name]['beat amplitude'] = np.abs(beat)
+            heterodyne[name]['beat phase'] = np.angle(beat)
+
+        return heterodyne
+
+    def _heterodyne_chunks(self, values, points, chunk):
+        """Generator evaluating heterodyne beat signals in chunks of `chunk`
+        points.
+
+        `values(points, ratios)` returns the batched values of swept
+        components for all points at the first frequency followed by all
+        points at the second, given the ratio of each frequency to the model
+        frequency. Both frequencies of a chunk are solved in one call of
+        `evaluate_batch()`, and beat phases are made continuous across
+        chunks. Should not be called externally.
+        """
+
+        frequencies, fixed = self._heterodyne_values()
+        ratios = frequencies * self.wavelength / components.SPEED_OF_LIGHT
+
+        previous = None
+
+        for chunkPoints in _chunks(points, chunk):
+            nPoints = len(chunkPoints)
+
+            batch = {name: np.repeat(vals, nPoints, axis=0)
+                     for name, vals in fixed.items()}
+            batch.update(values(chunkPoints, ratios))
+            heterodyne = self._beats(self.evaluate_batch(batch), nPoints)
+
+            for name in heterodyne:
+                phase = np.unwrap(heterodyne[name]['beat phase'])
+                if previous is not None:
+                    phase += 2 * np.pi * np.round(
+                        (previous[name] - phase[0]) / (2 * np.pi))
+                heterodyne[name]['beat phase'] = phase
+
+            previous = {name: heterodyne[name]['beat phase'][-1]
+                        for name in heterodyne}
+
+            yield heterodyne
+
+    def evaluate_heterodyne(self):
+        """Evaluate detected beat signals of a heterodyne model.
+
+        Sources are at two optical frequencies, set with
+        `Source.set_frequency_offset()`. The model is solved at both
+        frequencies in a single call of `evaluate_batch()`, with the matrices
+        of frequency dependent components (see `set_wavelength()`) evaluated
+        at each frequency, and each source emitting only at its own
+        frequency. At each detector, the field E1 at the lower frequency and
+        E2 at the higher frequency give the beat
+
+            B = 2 sum(E1 * conj(E2))
+
+        summed over polarisations and directions, so that the detected
+        intensity is I1 + I2 + Re(B exp(i 2 pi df t)) for the difference
+        frequency df. The model state is not changed.
+
+        Returns
+        -------
+        results : dict
+                For each detector, keyed by detector name, a dict of the
+                `'beat amplitude'` |B| and `'beat phase'` arg(B), in radians,
+                and detected powers summed over both frequencies, keyed by
+                property name.
+        """
+
+        frequencies, values = self._heterodyne_values()
+        results = self._beats(self.evaluate_batch(values), 1)
+
+        return {name: {prop: results[name][prop][0] for prop in results[name]}
+                for name in results}
+
+    def heterodyne_trajectory(self, stack, lengths, chunk=TRAJECTORY_CHUNK,
+                              loss=0):
+        """Evaluate heterodyne beat signals along a trajectory of stack
+        lengths.
+
+        The heterodyne counterpart of `simulate_trajectory()`: a generator
+        yielding, for each chunk of `chunk` lengths, the beat signals of
+        `evaluate_heterodyne()`, with both frequencies of every point solved
+        in a single batch. Lengths are optical thicknesses in units of the
+        model wavelength, so the stack phase at each frequency is scaled by
+        the ratio of that frequency to the model frequency. Beat phases are
+        unwrapped continuously along the trajectory, ready for periodic
+        error analysis with :py:mod:`strapy.analysis`. The model state is not
+        changed.
+
+        Parameters
+        ----------
+        stack : str
+                Name of the `Stack` component to be moved.
+        lengths : iterable
+                Optical thickness of the stack in units of the model
+                wavelength at each point of the trajectory.
+        chunk : int
+                Number of points evaluated together.
+        loss : double
+                Intensity loss for propagation through the stack.
+
+        Yields
+        ------
+        results : dict
+                Beat signals and detected powers for each point of the chunk,
+                keyed by detector name, see `evaluate_heterodyne()`.
+        """
+
+        component = self.components[stack]
+
+        if not(isinstance(component, components.Stack)):
+            raise Exception('{} is not a Stack.'.format(stack))
+
+        return self._heterodyne_chunks(
+            lambda points, ratios: {stack: component.length_values(
+                np.concatenate([points * ratio for ratio in ratios]), loss)},
+            lengths, chunk)
+
+    def impulse_response(self, detector, bandwidth, n_freq,
+                         chunk=TRAJECTORY_CHUNK):
+        """Returns the time domain impulse response of the model at a
+        detector.
+
+        The model is evaluated as by `spectral_sweep()` on a uniform grid of
+        `n_freq` optical frequencies spanning `bandwidth` about the model
+        frequency, and the detected amplitudes transformed to delay with a
+        single FFT. Light reaching the detector by different paths, for
+        example ghost reflections within a stack, appears as separate
+        peaks at the delay of each path. The delay resolution is
+        1 / `bandwidth`, and delays are centred on zero, wrapping outside
+        +-n_freq / (2 `bandwidth`).
+
+        Delays follow the propagation phase exp(i k L) of stacks set with
+        `Stack.set_path_length()` or `Stack.set_material()`, so light
+        delayed by these appears at positive delays. Multilayers, set with
+        `Stack.set_layers()` or `Stack.set_periodic()`, follow the opposite
+        phase convention of pyctmm, so their stack matrices are conjugated
+        for the sweep, giving the same magnitudes with the propagation phase
+        of path length stacks. Delays through both kinds of stack then add.
+        Only wavelength dependent components (see `set_wavelength()`) add
+        delay; the model state is not changed.
+
+        Parameters
+        ----------
+        detector : str
+                Name of the detector.
+        bandwidth : double
+                Optical frequency span of the sweep, in Hz.
+        n_freq : int
+                Number of optical frequencies, and of delays.
+        chunk : int
+                Number of frequencies evaluated together.
+
+        Returns
+        -------
+        delays : ndarray
+                Delay of each point of the response, in seconds, in
+                increasing order.
+        response : ndarray
+                Complex impulse response of the detected amplitudes
+                (aP, aS, bP, bS) at each delay, with delays along the first
+                axis, for the current source amplitudes.
+        """
+
+        if detector not in self.detectors:
+            raise Exception('Unknown detector {}.'.format(detector))
+
+        # frequency offsets from the model frequency, in FFT order.
+        offsets = np.fft.fftfreq(n_freq, 1 / bandwidth)
+
+        dependent = self._wavelength_dependent()
+        multilayers = set(
+            component.name for component in dependent
+            if isinstance(component, components.Stack)
+            and component.optical_lengths(self.wavelength) is None)
+
+        amplitudes = _concatenate(self._evaluate_chunks(
+            lambda points: {
+                component.name: np.conj(component.wavelength_values(points))
+                if component.name in multilayers
+                else component.wavelength_values(points)
+                for component in dependent},
+            components.SPEED_OF_LIGHT
+            / (components.SPEED_OF_LIGHT / self.wavelength + offsets),
+            chunk))[detector]['amplitude']
+
+        return np.fft.fftshift(np.fft.fftfreq(n_freq, bandwidth / n_freq)), \
+            np.fft.fftshift(np.fft.fft(amplitudes, axis=0), axes=0) / n_freq
+
+    def max_path_difference(self):
+        """Returns an estimate of the longest optical path difference in the
+        model.
+
+        Taken as twice the total optical path length of all stacks with a
+        physical length (path lengths, materials and multilayers), the round
+        trip through every stack. Light making several round trips of a
+        cavity can have longer path differences.
+
+        Returns
+        -------
+        path_difference : double
+                Optical path difference in metres.
+        """
+
+        total = 0
+
+        for component in self.components.values():
+            if not(isinstance(component, components.Stack)):
+                continue
+
+            lengths = component.optical_lengths(self.wavelength)
+            if lengths is not None:
+                total += lengths * self.wavelength
+            elif component.layers is not None:
+                indices = materials.layer_indices(component.layers[0],
+                                                  self.wavelength)
+                total += np.sum(np.real(indices[1:-1])
+                                * component.layers[1][1:-1])
+            elif component.periodic is not None:
+                indices = materials.layer_indices(component.periodic[1],
+                                                  self.wavelength)
+                total += component.periodic[3] * np.sum(
+                    np.real(indices) * component.periodic[2])
+
+        return 2 * total
+
+    def resonances(self, stack):
+        """Finds the resonances of the network as the optical thickness of a
+        stack changes.
+
+        Adding a propagation phase z = exp(2 pi i d) at the entry of the
+        stack, its first node, for a change d in its optical thickness in
+        wavelengths, scales the columns of its stack matrix acting on the
+        entry fields by z or 1/z, so the network matrix is
+        A(z) = A + (z - 1) B + (1/z - 1) C about the current state A. For
+        stacks set by thickness, this is the same as changing the thickness.
+        The poles of every detector response are the roots of det A(z),
+        found by the Woodbury identity from a quadratic eigenvalue problem
+        the size of the few rows stamped by the stack, after a single solve
+        of the current network matrix. No sweep is needed.
+
+        A pole z_p gives a resonance at d = arg(z_p) / (2 pi). The free
+        spectral range is one wavelength divided by the number k of poles of
+        the same modulus at distinct phases, for example two for a linear
+        cavity, whose round trip passes through the stack twice; poles of
+        the same modulus belong to separate families, for example the two
+        polarisations, if their modes do not share any stack rows. The round
+        trip gain of the family is p^k, for p the smaller of |z_p| and
+        1 / |z_p|, giving a full width at half maximum in wavelengths of
+        arccos(1 - (1 - p^k)^2 / (2 p^k)) / (k pi), that of an Airy peak of
+        the round trip phase. Degenerate modes, such as
+        the two polarisations of an isotropic cavity or the two directions of
+        a ring cavity, give repeated poles.
+
+        Parameters
+        ----------
+        stack : str
+                Name of the `Stack` component whose thickness is changed.
+
+        Returns
+        -------
+        resonances : dict
+                Arrays with one entry for each pole, in order of `offset`:
+                `pole`, the complex pole z_p; `offset`, the change in optical
+                thickness of the stack at resonance, in wavelengths, in
+                [0, 1); `linewidth`, the full width at half maximum in
+                wavelengths; `fsr`, the free spectral range in wavelengths;
+                and `finesse`, the ratio of the free spectral range to the
+                linewidth.
+        """
+
+        component = self.components[stack]
+
+        if not(isinstance(component, components.Stack)):
+            raise Exception('{} is not a Stack.'.format(stack))
+
+        self._stamp()
+
+        # changes to the network matrix, in the rows R and columns C stamped
+        # by the stack, per unit change in z (stack matrix columns acting on
+        # the forward propagating entry fields) and in 1/z (columns acting on
+        # the backward propagating entry fields).
+        vals = np.array(component.setVals(), dtype=complex)
+        entries = vals[component.stampSymbols] * component.stampSigns
+        forward = np.isin(component.stampSymbols % 4, (0, 2))
+
+        R, rowPos = np.unique(component.stampRows, return_inverse=True)
+        C, colPos = np.unique(component.stampCols, return_inverse=True)
+
+        B = np.zeros((len(R), len(C)), dtype=complex)
+        np.add.at(B, (rowPos[forward], colPos[forward]), entries[forward])
+        Cz = np.zeros((len(R), len(C)), dtype=complex)
+        np.add.at(Cz, (rowPos[~forward], colPos[~forward]),
+                  entries[~forward])
+
+        block = np.zeros((self.matrixShape[0], len(R)), dtype=complex)
+        block[R, np.arange(len(R))] = 1
+        Z = self.solver.solve(self.matrix, block)[C]
+
+        # det A(z) = det A det(I + ((z - 1) B + (1/z - 1) C) Z), which times
+        # z is the quadratic z^2 M2 + z M1 + M0, solved as a generalised
+        # eigenvalue problem in companion form.
+        identity = np.identity(len(R))
+        zeros = np.zeros((len(R), len(R)))
+        M2 = B @ Z
+        M1 = identity - B @ Z - Cz @ Z
+        M0 = Cz @ Z
+
+        poles, modes = scipy.linalg.eig(
+            np.block([[zeros, identity], [-M0, -M1]]),
+            np.block([[identity, zeros], [zeros, M2]]))
+        with np.errstate(invalid='ignore'):
+            valid = np.isfinite(poles) & (np.abs(poles) > POLE_CUTOFF) \
+                & (np.abs(poles) < 1 / POLE_CUTOFF)
+
+        offset = np.mod(np.angle(poles[valid]) / (2 * np.pi), 1)
+        offset[offset == 1] = 0
+        order = np.argsort(offset)
+        poles = poles[valid][order]
+        offset = offset[order]
+
+        # mode amplitudes in the stack rows, which separate families of
+        # resonances of the same modulus, such as the two polarisations.
+        modes = np.abs(modes[:len(R), valid][:, order])
+        modes = modes / np.linalg.norm(modes, axis=0)
+
+        modulus = np.abs(poles)
+
+        fsr = np.empty(len(poles))
+        for i in range(len(poles)):
+            family = poles[np.isclose(modulus, modulus[i], rtol=POLE_RTOL)
+                           & (modes.T @ modes[:, i] > POLE_OVERLAP)]
+            phases = np.unique(np.round(family / np.abs(family), 6))
+            fsr[i] = 1 / len(phases)
+
+        # the round trip of a family with k poles per wavelength has gain
+        # rho^k and changes in phase k times as fast as the stack.
+        k = np.round(1 / fsr)
+        gain = np.minimum(modulus, 1 / modulus)**k
+        linewidth = np.arccos(
+            np.clip(1 - (1 - gain)**2 / (2 * gain), -1, 1)) / (k * np.pi)
+
+        with np.errstate(divide='ignore'):
+            finesse = fsr / linewidth
+
+        return {'pole': poles, 'offset': offset, 'linewidth': linewidth,
+                'fsr': fsr, 'finesse': finesse}
+
+    def evaluate_broadband(self, nodes=None, chunk=TRAJECTORY_CHUNK):
+        """Evaluate detected powers for broadband sources.
+
+        Detected powers (intensities and Stokes parameters) are found as the
+        incoherent sum over the line shape of the sources, weighted by the
+        quadrature of `Source.quadrature()`. All quadrature wavelengths are
+        solved together by `spectral_sweep()`. The number of nodes adapts to
+        `max_path_difference()`, so that fringes are resolved and washed out
+        correctly. All sources must have the same line shape, and the model
+        state is not changed.
+
+        Parameters
+        ----------
+        nodes : int
+                Number of quadrature nodes, overriding the adaptive choice.
+        chunk : int
+                Number of wavelengths evaluated together.
+
+        Returns
+        -------
+        results : dict
+                Detected powers for each detector, keyed by detector name.
+                Each entry is a dict keyed by property name.
+        """
+
+        sources = [component for component in self.components.values()
+                   if isinstance(component, components.Source)]
+        shapes = set((source.line_shape, source.linewidth,
+                      None if source.spectrum is None else
+                      (source.spectrum[0].tobytes(),
+                       source.spectrum[1].tobytes()))
+                     for source in sources)
+
+        if len(shapes) != 1:
+            raise Exception('All sources must have the same line shape.')
+
+        dependent = any(
+            component.wavelength_values([self.wavelength]) is not None
+            for component in self.components.values()
+            if isinstance(component, (components.Stack,
+                                      components.Waveplate)))
+
+        if dependent:
+            wavelengths, weights = sources[0].quadrature(
+                self.max_path_difference(), nodes)
+            results = self.spectral_sweep(wavelengths, chunk)
+        else:
+            # no component depends on wavelength, so every node is the same.
+            weights = np.ones(1)
+            results = self.evaluate_batch(
+                {sources[0].name: [sources[0].setVals()]})
+
+        return {name: {prop: np.tensordot(weights, results[name][prop],
+                                          axes=(0, 0))
+                       for prop in results[name] if prop in POWER_PROPERTIES}
+                for name in results}
+
+    def field_map(self, nodes=None, sweep=False):
+        """Returns the electric field amplitudes at every node.
+
+        The amplitudes (aP, aS, bP, bS) of each node are read directly from
+        the solution vector, so no detectors are needed. Rows are ordered as
+        the model's `nodes`, with the first element of each node at
+        `nodeIndex[name]` in the solution vector.
+
+        Parameters
+        ----------
+        nodes : str or sequence of str
+                Node, or nodes, to return the field amplitudes of. If not
+                given, all nodes are returned.
+        sweep : bool
+                If true, the amplitudes for every point of the last batched
+                evaluation with `fields=True` are returned.
+
+        Returns
+        -------
+        fields : ndarray
+                Field amplitudes with shape (n_nodes, 4), or (N, n_nodes, 4)
+                for a batched evaluation. For models with several coherence
+                groups the amplitudes of each group are along an extra axis
+                before the last.
+        """
+
+        if sweep:
+            if self.sweepSolutions is None:
+                raise Exception(
+                    'No batched solutions, evaluate with fields=True.')
+            solutions = self.sweepSolutions
         else:
-            if not(self.useLambdify):
-                # Should be threadable.
-                for key in self.updated:
-                    if isinstance(self.components[key], components.Source):
-                        vals = self.components[key].setVals()
-                        for i, symbol in enumerate(
-                                self.components[key].symbolIdxs):
-                            for index in symbol:
-                                self.rhs[index[0]] = vals[i] * index[2]
-                    elif not(isinstance(self.components[key],
-                                        components.Dump)):
-                        vals = self.components[key].setVals()
-                        for i, symbol in enumerate(
-                                self.components[key].symbolIdxs):
-                            for index in symbol:
-                                self.matrix[index[0], index[1]] = \
-                                    vals[i] * index[2]
-                self.updated.clear()
+            solutions = self.solution_vector
+
+        # amplitudes with shape (..., n_nodes, groups, 4).
+        fields = np.moveaxis(solutions.reshape(
+            solutions.shape[:-2] + (-1, 4, solutions.shape[-1])), -1, -2)
+
+        if nodes is not None:
+            if isinstance(nodes, str):
+                fields = fields[..., self.nodeIndex[nodes] // 4, :, :]
             else:
-                self._update()
-                self.matrix = self.setMatrix(*self.matrixPassVector)
-                self.rhs = self.setRhs(*self.rhsPassVector)
+                fields = fields[..., [self.nodeIndex[node] // 4
+                                      for node in nodes], :, :]
 
-            self.solution_vector = np.linalg.solve(self.matrix, self.rhs)
+        if fields.shape[-2] == 1:
+            return fields[..., 0, :]
 
-            for detector in self.detectors.values():
-                detector.update(self.solution_vector)
+        return fields
@@ -1,4 +1,11 @@
 from .Model import Model
 from .Node import Node
 from .Detector import Detector
-from . import components
\ No newline at end of file
+from . import components
+from . import solvers
+from . import analysis
+from . import tmm
+from . import cache
+from . import materials
+from . import store
+from . import fitting
\ No newline at end of file
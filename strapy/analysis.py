@@ -0,0 +1,219 @@
+"""The analysis module holds functions for analysing detector outputs from
+strapy sweeps, primarily for quantifying periodic nonlinearity in homodyne
+displacement measuring interferometers: Heydemann correction of quadrature
+signals, and harmonic analysis of the remaining periodic error.
+
+All functions operate on the last axis of their inputs, the sweep axis, and
+treat any leading axes as independent realisations, so that many Monte-Carlo
+realisations or model variants can be analysed in a single call. Batched
+detector outputs can be taken directly from :py:meth:`strapy.Model.sweep()`.
+"""
+
+
+import numpy as np
+
+
+def fit_ellipse(x, y):
+    """Fits the Heydemann ellipse to a pair of quadrature signals.
+
+    The signals are modelled as
+
+        x = p + R cos(phi)
+        y = q + (R / r) sin(phi - alpha)
+
+    and the general conic A x^2 + B y^2 + C x y + D x + E y = 1 fitted by
+    linear least squares, solved for all realisations at once. Signals are
+    centred and scaled before fitting to keep the normal equations well
+    conditioned.
+
+    Parameters
+    ----------
+    x : ndarray
+            First quadrature signal, for example PD1 intensities, with the
+            sweep along the last axis.
+    y : ndarray
+            Second quadrature signal, with the same shape as `x`.
+
+    Returns
+    -------
+    ellipse : dict
+            Fitted offsets `p` and `q`, gain ratio `r`, quadrature error
+            `alpha` (radians) and radius `R`, each with the shape of the
+            leading axes of `x`.
+    """
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    xCentre = np.mean(x, axis=-1, keepdims=True)
+    yCentre = np.mean(y, axis=-1, keepdims=True)
+    scale = np.sqrt(np.mean((x - xCentre)**2 + (y - yCentre)**2, axis=-1,
+                            keepdims=True))
+    u = (x - xCentre) / scale
+    v = (y - yCentre) / scale
+
+    design = np.stack((u**2, v**2, u * v, u, v), axis=-1)
+    normal = np.swapaxes(design, -1, -2) @ design
+    coefficients = np.linalg.solve(
+        normal, np.sum(design, axis=-2)[..., np.newaxis])[..., 0]
+    A, B, C, D, E = np.moveaxis(coefficients, -1, 0)
+
+    denominator = C**2 - 4 * A * B
+    p = (2 * B * D - E * C) / denominator
+    q = (2 * A * E - D * C) / denominator
+    alpha = np.arcsin(C / np.sqrt(4 * A * B))
+    R = np.sqrt((1 + A * p**2 + B * q**2 + C * p * q) / A) / np.cos(alpha)
+
+    scale = scale[..., 0]
+
+    return {'p': xCentre[..., 0] + scale * p,
+            'q': yCentre[..., 0] + scale * q,
+            'r': np.sqrt(B / A),
+            'alpha': alpha,
+            'R': scale * R}
+
+
+def correct(x, y, ellipse):
+    """Returns the interferometric phase of Heydemann corrected signals.
+
+    Parameters
+    ----------
+    x : ndarray
+            First quadrature signal, with the sweep along the last axis.
+    y : ndarray
+            Second quadrature signal, with the same shape as `x`.
+    ellipse : dict
+            Ellipse parameters from `fit_ellipse()`.
+
+    Returns
+    -------
+    phase : ndarray
+            Corrected phase, unwrapped along the sweep axis.
+    """
+
+    p = np.asarray(ellipse['p'])[..., np.newaxis]
+    q = np.asarray(ellipse['q'])[..., np.newaxis]
+    r = np.asarray(ellipse['r'])[..., np.newaxis]
+    alpha = np.asarray(ellipse['alpha'])[..., np.newaxis]
+
+    u1 = x - p
+    u2 = (u1 * np.sin(alpha) + r * (y - q)) / np.cos(alpha)
+
+    return np.unwrap(np.arctan2(u2, u1), axis=-1)
+
+
+def linear_residual(phase, displacement):
+    """Returns the nonlinear part of phase against displacement.
+
+    A straight line is fitted to the phase of each realisation by least
+    squares, and the residual converted to displacement units with the
+    fitted slope.
+
+    Parameters
+    ----------
+    phase : ndarray
+            Unwrapped phase, with the sweep along the last axis.
+    displacement : ndarray
+            Displacement at each point, broadcastable to `phase`.
+
+    Returns
+    -------
+    residual : ndarray
+            Displacement nonlinearity at each point, in the units of
+            `displacement`.
+    slope : ndarray
+            Fitted phase change per unit displacement.
+    """
+
+    displacement = np.broadcast_to(displacement, np.shape(phase))
+
+    dMean = np.mean(displacement, axis=-1, keepdims=True)
+    pMean = np.mean(phase, axis=-1, keepdims=True)
+    slope = np.sum((displacement - dMean) * (phase - pMean), axis=-1,
+                   keepdims=True) \
+        / np.sum((displacement - dMean)**2, axis=-1, keepdims=True)
+
+    residual = (phase - pMean - slope * (displacement - dMean)) / slope
+
+    return residual, slope[..., 0]
+
+
+def heydemann(x, y, displacement=None):
+    """Heydemann correction of quadrature signals from a displacement sweep.
+
+    Fits the Heydemann ellipse, corrects the signals and, if the displacement
+    at each point is given, calculates the residual nonlinearity.
+
+    Parameters
+    ----------
+    x : ndarray
+            First quadrature signal, for example PD1 intensities, with the
+            sweep along the last axis.
+    y : ndarray
+            Second quadrature signal, with the same shape as `x`.
+    displacement : ndarray
+            Displacement at each point, broadcastable to `x`.
+
+    Returns
+    -------
+    result : dict
+            Ellipse parameters (see `fit_ellipse()`), the corrected `phase`
+            and, if `displacement` is given, the displacement `nonlinearity`
+            and phase per unit displacement, `slope`.
+    """
+
+    result = fit_ellipse(x, y)
+    result['phase'] = correct(x, y, result)
+
+    if displacement is not None:
+        result['nonlinearity'], result['slope'] = \
+            linear_residual(result['phase'], displacement)
+
+    return result
+
+
+def periodic_error(residual, fringes, orders=(1, 2)):
+    """Harmonic amplitudes of periodic nonlinearity.
+
+    The displacement nonlinearity of each realisation is transformed with a
+    single real FFT along the sweep axis. For a sweep over a whole number of
+    fringes, the periodic error of order `k` (`k` cycles per fringe) falls
+    exactly on frequency bin `k * fringes`, so no windowing is needed.
+
+    Parameters
+    ----------
+    residual : ndarray
+            Displacement nonlinearity, for example from `heydemann()`, with
+            the sweep along the last axis. The sweep must cover exactly
+            `fringes` fringes with evenly spaced points, excluding the end
+            point.
+    fringes : int
+            Number of fringes covered by the sweep.
+    orders : tuple of int
+            Orders of periodic error to return.
+
+    Returns
+    -------
+    amplitudes : ndarray
+            Amplitudes of the periodic error of each order, in the units of
+            `residual`, with orders along the last axis.
+    phases : ndarray
+            Phases of the periodic error of each order (radians, relative to
+            a cosine at the start of the sweep), with orders along the last
+            axis.
+    """
+
+    residual = np.asarray(residual, dtype=float)
+    nPoints = residual.shape[-1]
+
+    if int(fringes) != fringes or fringes < 1:
+        raise Exception('Sweep must cover a whole number of fringes.')
+
+    bins = int(fringes) * np.asarray(orders, dtype=int)
+    if np.any(bins < 1) or np.any(2 * bins >= nPoints):
+        raise Exception('Periodic error orders {} not resolved by {} points '
+                        'over {} fringes.'.format(orders, nPoints, fringes))
+
+    spectrum = np.fft.rfft(residual, axis=-1)[..., bins]
+
+    return 2 * np.abs(spectrum) / nPoints, np.angle(spectrum)
@@ -0,0 +1,89 @@
+"""The cache module holds the bounded least recently used cache used to reuse
+expensive numerical results in strapy, for example multilayer stack matrices
+calculated by :py:meth:`strapy.components.Stack.set_layers()`.
+"""
+
+
+from collections import OrderedDict
+
+
+class LRUCache():
+    """Bounded least recently used cache.
+
+    Entries are kept in order of use; once `maxsize` entries are held, adding
+    a new entry evicts the least recently used one.
+
+    Attributes
+    ----------
+    maxsize : int
+            Maximum number of entries held.
+    hits : int
+            Number of lookups that found a cached entry.
+    misses : int
+            Number of lookups that found no cached entry.
+    evictions : int
+            Number of entries evicted to respect `maxsize`.
+    """
+
+    def __init__(self, maxsize=128):
+        if maxsize < 1:
+            raise Exception('Cache size must be at least 1.')
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        """Returns the cached entry for `key`, marking it as most recently
+        used, or `default` if there is no entry.
+
+        Parameters
+        ----------
+        key : hashable
+                Key of the entry.
+        default
+                Value returned if there is no entry for `key`.
+        """
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+
+        return value
+
+    def put(self, key, value):
+        """Adds an entry, evicting the least recently used entry if the cache
+        is full.
+
+        Parameters
+        ----------
+        key : hashable
+                Key of the entry.
+        value
+                Value to be cached.
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
@@ -36,7 +36,31 @@ probably a better approach as well.
 
 import sympy as sp
 import numpy as np
-import pyctmm
+from . import tmm
+from . import materials
+from .cache import LRUCache
+
+try:
+    import pyctmm
+except ImportError:
+    pyctmm = None
+
+
+# speed of light in vacuum, in m/s.
+SPEED_OF_LIGHT = 299792458.0
+# line shapes are integrated over this many half widths either side of the
+# centre frequency.
+LINE_SPAN = {'gaussian': 6 / np.sqrt(2 * np.log(2)), 'lorentzian': 100}
+# minimum number of quadrature nodes for broadband sources.
+MIN_NODES = 16
+# quadrature nodes per fringe period, in frequency, of the longest optical path
+# difference.
+NODES_PER_FRINGE = 4
+# quadrature nodes per half width of Gaussian and Lorentzian line shapes.
+NODES_PER_WIDTH = 4
+# multilayer stack matrices, keyed by layer indices, thicknesses, wavelength
+# and angle of incidence, shared by all stacks.
+LAYER_CACHE = LRUCache(1024)
 
 
 def rotationMatrix44(theta):
@@ -119,6 +143,23 @@ def rotationMatrix88(theta0, theta1):
     return rMat
 
 
+def _layer_key(indices):
+    """Returns layer refractive indices as a hashable tuple, keeping any
+    materials."""
+    return tuple(index if isinstance(index, materials._Material)
+                 else complex(index) for index in indices)
+
+
+def _periodic_indices(periodic, wavelengths):
+    """Returns the incident, unit cell, thickness, repeat and exit arguments
+    of `tmm.periodic_matrices()` for a periodic multilayer at wavelengths."""
+    incident, indices, thicknesses, repeats, exit_medium = periodic[:5]
+
+    return (materials.index(incident, wavelengths),
+            materials.layer_indices(indices, wavelengths), thicknesses,
+            repeats, materials.index(exit_medium, wavelengths))
+
+
 class _Component():
     """General component class for inheritance of common properties.
 
@@ -164,12 +205,174 @@ class Source(_Component):
             polarised light. Should be set by user for other polarisations.
     node_number : int
             Number of nodes component attaches to. Should not be changed.
+    line_shape : str
+            Spectral line shape of the emitted light, `'monochromatic'` (the
+            default), `'gaussian'`, `'lorentzian'` or `'table'`; see
+            `set_line_shape()`.
+    linewidth : double
+            Full width at half maximum of Gaussian and Lorentzian line
+            shapes, in metres of wavelength.
+    spectrum : tuple of ndarray
+            Wavelengths and spectral power densities of a tabulated line
+            shape.
+    coherence_group : hashable
+            Coherence group of the source, see `set_coherence_group()`.
+    frequency_offset : double
+            Optical frequency of the source relative to the model frequency,
+            in Hz, see `set_frequency_offset()`.
     """
 
     def __init__(self, name, nodes, model):
         _Component.__init__(self, name, nodes, model)
         self.amplitude = [0, 1]  # defaults to S polarised light
         self.node_number = 1
+        self.line_shape = 'monochromatic'
+        self.linewidth = None
+        self.spectrum = None
+        self.coherence_group = 0
+        self.frequency_offset = 0
+
+    def set_coherence_group(self, group):
+        """Sets the coherence group of the source.
+
+        Sources in the same group are mutually coherent, and their fields add
+        at detectors. Sources in different groups are mutually incoherent,
+        for example independent lasers or stray light, and their detected
+        powers add instead. All sources are in group 0 by default.
+
+        Parameters
+        ----------
+        group : hashable
+                Label of the coherence group.
+        """
+        self.coherence_group = group
+
+        if self.model.coherenceGroups is not None:
+            self.model._group_sources()
+
+    def set_frequency_offset(self, offset):
+        """Sets the optical frequency of the source for heterodyne
+        evaluation.
+
+        Heterodyne models have sources at two optical frequencies, for
+        example the two outputs of a Zeeman laser, which are evaluated
+        together by :py:meth:`strapy.Model.evaluate_heterodyne()`. Other
+        evaluations ignore the offset.
+
+        Parameters
+        ----------
+        offset : double
+                Optical frequency relative to the model frequency,
+                `SPEED_OF_LIGHT / model.wavelength`, in Hz.
+        """
+        self.frequency_offset = offset
+
+    def set_line_shape(self, line_shape, linewidth=None, wavelengths=None,
+                       density=None):
+        """Sets the spectral line shape of the source.
+
+        Gaussian and Lorentzian line shapes are centred on the model
+        wavelength. Broadband sources are evaluated with
+        :py:meth:`strapy.Model.evaluate_broadband()`; `amplitude` gives the
+        total emitted amplitude, spread over the line shape.
+
+        Parameters
+        ----------
+        line_shape : str
+                `'monochromatic'`, `'gaussian'`, `'lorentzian'` or
+                `'table'`.
+        linewidth : double
+                Full width at half maximum in metres of wavelength, for
+                Gaussian and Lorentzian line shapes.
+        wavelengths : array_like
+                Vacuum wavelengths in metres, for a tabulated line shape.
+        density : array_like
+                Spectral power density per unit wavelength at each of
+                `wavelengths`, for a tabulated line shape. Need not be
+                normalised.
+        """
+        if line_shape in ('gaussian', 'lorentzian'):
+            if linewidth is None or linewidth <= 0:
+                raise Exception('A positive linewidth is required for a {} '
+                                'line shape.'.format(line_shape))
+            spectrum = None
+        elif line_shape == 'table':
+            if wavelengths is None or density is None or \
+                    len(wavelengths) != len(density) or len(wavelengths) < 2:
+                raise Exception('Tabulated line shapes need matching '
+                                'wavelengths and densities.')
+            spectrum = (np.asarray(wavelengths, dtype=float),
+                        np.asarray(density, dtype=float))
+        elif line_shape == 'monochromatic':
+            spectrum = None
+        else:
+            raise Exception('Unknown line shape {}.'.format(line_shape))
+
+        self.line_shape = line_shape
+        self.linewidth = linewidth
+        self.spectrum = spectrum
+
+    def quadrature(self, path_difference, nodes=None):
+        """Returns quadrature nodes and weights for the source line shape.
+
+        The line shape is integrated over optical frequency with the midpoint
+        rule, which converges rapidly for smooth line shapes. Unless given,
+        the number of nodes is chosen so that the fringes of an optical path
+        difference of `path_difference` are sampled at least
+        `NODES_PER_FRINGE` times per period, the line shape at least
+        `NODES_PER_WIDTH` times per half width (or at every tabulated point),
+        and is at least `MIN_NODES`.
+
+        Parameters
+        ----------
+        path_difference : double
+                Longest optical path difference to be resolved, in metres.
+        nodes : int
+                Number of quadrature nodes.
+
+        Returns
+        -------
+        wavelengths : ndarray
+                Vacuum wavelength of each node, in metres.
+        weights : ndarray
+                Fraction of the emitted power at each node, summing to one.
+        """
+        if self.line_shape == 'monochromatic':
+            return np.array([float(self.model.wavelength)]), np.ones(1)
+
+        if self.line_shape == 'table':
+            tableFrequencies = SPEED_OF_LIGHT / self.spectrum[0]
+            order = np.argsort(tableFrequencies)
+            tableFrequencies = tableFrequencies[order]
+            # density per unit frequency, from density per unit wavelength.
+            tableDensity = (self.spectrum[1] * self.spectrum[0]**2)[order]
+            low, high = tableFrequencies[0], tableFrequencies[-1]
+            shapeNodes = len(tableFrequencies)
+        else:
+            centre = SPEED_OF_LIGHT / self.model.wavelength
+            halfWidth = SPEED_OF_LIGHT * self.linewidth \
+                / self.model.wavelength**2 / 2
+            low = centre - LINE_SPAN[self.line_shape] * halfWidth
+            high = centre + LINE_SPAN[self.line_shape] * halfWidth
+            shapeNodes = NODES_PER_WIDTH * 2 * LINE_SPAN[self.line_shape]
+
+        if nodes is None:
+            fringes = (high - low) * path_difference / SPEED_OF_LIGHT
+            nodes = int(np.ceil(max(MIN_NODES, shapeNodes,
+                                    NODES_PER_FRINGE * fringes)))
+
+        step = (high - low) / nodes
+        frequencies = low + step * (np.arange(nodes) + 0.5)
+
+        if self.line_shape == 'gaussian':
+            density = np.exp(-np.log(2) * ((frequencies - centre)
+                                           / halfWidth)**2)
+        elif self.line_shape == 'lorentzian':
+            density = 1 / (1 + ((frequencies - centre) / halfWidth)**2)
+        else:
+            density = np.interp(frequencies, tableFrequencies, tableDensity)
+
+        return SPEED_OF_LIGHT / frequencies, density / np.sum(density)
 
     def initEquation(self, nodes):
         """Initialises sympy equation for component.
@@ -307,6 +510,20 @@ class BeamSplitter(_ScatterComponent):
         """
         return [self.rP, self.rS, self.tP, self.tS]
 
+    def value_derivative(self, attribute):
+        """Returns the derivative of the values returned by `setVals()` with
+        respect to an attribute, or None if there is no analytic derivative.
+
+        Used by :py:class:`strapy.fitting.Fit`. Should not need to be called
+        by the user.
+        """
+        if attribute in ('rP', 'rS', 'tP', 'tS'):
+            return np.array([attribute == 'rP', attribute == 'rS',
+                             attribute == 'tP', attribute == 'tS'],
+                            dtype=complex)
+
+        return None
+
 
 class PolarisingBeamSplitter(_ScatterComponent):
     """Symmetrical polarising beam splitter component.
@@ -681,10 +898,50 @@ class Stack(_TransferComponent):
     """
             Stack of one or more layers for linking components.
             Nodes: 2
+
+    Attributes
+    ----------
+    path_length : double
+            Physical optical path length of the stack in metres, if set with
+            `set_path_length()`, otherwise None.
+    loss : double
+            Intensity loss for propagation through the stack.
+    layers : tuple
+            Refractive indices, thicknesses and angle of incidence of the
+            multilayer set with `set_layers()`, otherwise None.
+    periodic : tuple
+            Incident index, unit cell indices and thicknesses, number of
+            repeats, exit index and angle of incidence of the periodic
+            multilayer set with `set_periodic()`, otherwise None.
+    material : strapy.materials._Material
+            Material of the stack, if set with `set_material()`, otherwise
+            None.
+    thickness : double
+            Physical thickness of the stack in metres, if set with
+            `set_material()`.
+
+    Refractive indices of multilayers may be given as materials from
+    :py:mod:`strapy.materials` in place of numbers, and are evaluated at
+    each wavelength.
     """
 
     def __init__(self, name, nodes, model):
         _TransferComponent.__init__(self, name, nodes, model)
+        self.path_length = None
+        self.loss = 0
+        self.layers = None
+        self.periodic = None
+        self.material = None
+        self.thickness = None
+
+    def _clear_lengths(self):
+        """Clears the physical path length, multilayer and material of the
+        stack, before it is set in another way."""
+        self.path_length = None
+        self.layers = None
+        self.periodic = None
+        self.material = None
+        self.thickness = None
 
     def set_length(self, length, loss=0):
         """Sets stack transfer matrix to a single layer of thickness length,
@@ -697,6 +954,8 @@ class Stack(_TransferComponent):
         loss : double
                 Intensity loss for propagation through stack.
         """
+        self._clear_lengths()
+        self.loss = loss
         self.stack_matrix = np.identity(4, dtype=np.complex)
 
         loss = 1 - loss
@@ -708,6 +967,131 @@ class Stack(_TransferComponent):
 
         self.model.updated.append(self.name)
 
+    def length_values(self, lengths, loss=0):
+        """Returns network matrix values for a sequence of stack lengths.
+
+        Equivalent to calling `set_length()` and `setVals()` for each length,
+        calculated for all lengths at once for use with
+        :py:meth:`strapy.Model.evaluate_batch()`. The stack itself is not
+        changed.
+
+        Parameters
+        ----------
+        lengths : array_like
+                Optical thicknesses of stack in units of wavelength.
+        loss : double or array_like
+                Intensity loss for propagation through stack, for all lengths
+                or for each length.
+
+        Returns
+        -------
+        values : ndarray
+                Flattened stack matrices, with shape (N, 16).
+        """
+
+        lengths = np.asarray(lengths, dtype=float)
+        phase = np.exp(1j * lengths * 2 * np.pi)
+        transmission = np.sqrt(1 - np.asarray(loss, dtype=float))
+
+        values = np.zeros((len(lengths), 16), dtype=complex)
+        values[:, 0] = transmission * phase
+        values[:, 5] = transmission / phase
+        values[:, 10] = values[:, 0]
+        values[:, 15] = values[:, 5]
+
+        return values
+
+    def set_path_length(self, path_length, loss=0):
+        """Sets stack transfer matrix to a single layer with a physical
+        optical path length, at the model wavelength.
+
+        Unlike `set_length()`, the stack phase follows changes of the model
+        wavelength (see :py:meth:`strapy.Model.set_wavelength()`) and of the
+        source frequency in :py:meth:`strapy.Model.frequency_sweep()`.
+
+        Parameters
+        ----------
+        path_length : double
+                Optical path length (refractive index times thickness) of
+                stack in metres.
+        loss : double
+                Intensity loss for propagation through stack.
+        """
+        self.set_length(path_length / self.model.wavelength, loss)
+        self.path_length = path_length
+
+    def set_material(self, material, thickness, loss=0):
+        """Sets stack transfer matrix to a single layer of a dispersive
+        material, at the model wavelength.
+
+        As for `set_path_length()`, the stack follows changes of wavelength
+        and source frequency, with the optical path length calculated from
+        the real part of the material's refractive index at each wavelength.
+
+        Parameters
+        ----------
+        material : strapy.materials._Material
+                Material of the stack.
+        thickness : double
+                Physical thickness of the stack in metres.
+        loss : double
+                Intensity loss for propagation through stack.
+        """
+        index = np.real(materials.index(material, self.model.wavelength))
+        self.set_length(index * thickness / self.model.wavelength, loss)
+        self.material = material
+        self.thickness = thickness
+
+    def optical_lengths(self, wavelengths):
+        """Returns the optical thickness of a path length or material stack.
+
+        Parameters
+        ----------
+        wavelengths : array_like
+                Vacuum wavelengths in metres.
+
+        Returns
+        -------
+        lengths : ndarray
+                Optical thickness in units of each wavelength, or None if the
+                stack has no physical path length or material.
+        """
+        if self.material is not None:
+            return np.real(materials.index(self.material, wavelengths)) \
+                * self.thickness / wavelengths
+
+        if self.path_length is not None:
+            return self.path_length / wavelengths
+
+        return None
+
+    def path_values(self, frequencies):
+        """Returns network matrix values for a sequence of optical
+        frequencies.
+
+        Parameters
+        ----------
+        frequencies : array_like
+                Vacuum optical frequencies in Hz.
+
+        Returns
+        -------
+        values : ndarray
+                Flattened stack matrices, with shape (N, 16).
+        """
+        if self.material is not None:
+            return self.length_values(self.optical_lengths(
+                SPEED_OF_LIGHT / np.asarray(frequencies, dtype=float)),
+                self.loss)
+
+        if self.path_length is None:
+            raise Exception(
+                'Stack {} has no physical path length.'.format(self.name))
+
+        return self.length_values(
+            self.path_length * np.asarray(frequencies) / SPEED_OF_LIGHT,
+            self.loss)
+
     def set_pyctmm(self, cstack):
         """Sets stack transfer matrix to that of a pyctmm stack.
 
@@ -727,11 +1111,206 @@ class Stack(_TransferComponent):
                 A pyctmm with pre-set layer thicknesses and refractive indexes.
         """
 
+        if pyctmm is None:
+            raise Exception('pyctmm is not installed, use set_layers() for '
+                            'multilayer stacks.')
+
         pyctmm.evaluate(cstack)
         self.stack_matrix = pyctmm.get_matrix(cstack)
+        self._clear_lengths()
 
         self.model.updated.append(self.name)
 
+    def set_layers(self, indices, thicknesses, theta=0):
+        """Sets stack transfer matrix to that of a multilayer, at the model
+        wavelength.
+
+        The multilayer is calculated with the vectorised transfer matrix
+        method of :py:mod:`strapy.tmm`, which follows the conventions of
+        pyctmm (see `set_pyctmm()`), without needing pyctmm installed.
+        Calculated matrices are kept in the bounded least recently used cache
+        `LAYER_CACHE`, shared by all stacks, so repeated layer definitions
+        are not recalculated. The layers are kept so that the stack can be
+        recalculated when the wavelength changes (see
+        :py:meth:`strapy.Model.set_wavelength()` and
+        :py:meth:`strapy.Model.spectral_sweep()`), or swept with
+        `layer_values()`.
+
+        Parameters
+        ----------
+        indices : tuple of complex
+                Complex refractive index of each layer, including the
+                semi-infinite incident and exit media.
+        thicknesses : tuple of double
+                Physical thickness of each layer in metres.
+        theta : double
+                Angle of incidence in radians.
+        """
+        if len(indices) != len(thicknesses):
+            raise Exception('{} layer indices given for {} '
+                            'thicknesses.'.format(len(indices),
+                                                  len(thicknesses)))
+
+        layers = (_layer_key(indices),
+                  tuple(float(thickness) for thickness in thicknesses),
+                  float(theta))
+        key = layers + (float(self.model.wavelength),)
+
+        # cached matrices are shared between stacks, so are made read only.
+        matrix = LAYER_CACHE.get(key)
+        if matrix is None:
+            matrix = tmm.stack_matrices(
+                materials.layer_indices(layers[0], self.model.wavelength),
+                thicknesses, self.model.wavelength, theta)
+            matrix.setflags(write=False)
+            LAYER_CACHE.put(key, matrix)
+
+        self.stack_matrix = matrix
+        self._clear_lengths()
+        self.layers = layers
+
+        self.model.updated.append(self.name)
+
+    def set_periodic(self, incident, indices, thicknesses, repeats,
+                     exit_medium, theta=0):
+        """Sets stack transfer matrix to that of a periodic multilayer, at
+        the model wavelength.
+
+        The multilayer is a unit cell of layers, for example a high and low
+        index quarter wave pair of a Bragg mirror, repeated `repeats` times
+        between incident and exit media. The unit cell matrix is raised to
+        the number of repeats by binary exponentiation (see
+        :py:func:`strapy.tmm.periodic_matrices()`), so mirrors with hundreds
+        of layers cost little more than a single cell. As for `set_layers()`,
+        matrices are cached in `LAYER_CACHE` and the stack is recalculated
+        when the wavelength changes.
+
+        Parameters
+        ----------
+        incident : complex
+                Complex refractive index of the incident medium.
+        indices : tuple of complex
+                Complex refractive index of each layer of the unit cell.
+        thicknesses : tuple of double
+                Physical thickness of each layer of the unit cell in metres.
+        repeats : int
+                Number of repeats of the unit cell.
+        exit_medium : complex
+                Complex refractive index of the exit medium.
+        theta : double
+                Angle of incidence in radians.
+        """
+        if len(indices) != len(thicknesses):
+            raise Exception('{} layer indices given for {} '
+                            'thicknesses.'.format(len(indices),
+                                                  len(thicknesses)))
+
+        periodic = (_layer_key((incident,))[0], _layer_key(indices),
+                    tuple(float(thickness) for thickness in thicknesses),
+                    int(repeats), _layer_key((exit_medium,))[0],
+                    float(theta))
+        key = ('periodic',) + periodic + (float(self.model.wavelength),)
+
+        matrix = LAYER_CACHE.get(key)
+        if matrix is None:
+            matrix = tmm.periodic_matrices(
+                *_periodic_indices(periodic, self.model.wavelength),
+                self.model.wavelength, theta)
+            matrix.setflags(write=False)
+            LAYER_CACHE.put(key, matrix)
+
+        self.stack_matrix = matrix
+        self._clear_lengths()
+        self.periodic = periodic
+
+        self.model.updated.append(self.name)
+
+    def layer_values(self, indices=None, thicknesses=None, theta=None):
+        """Returns network matrix values for a sweep of multilayer
+        parameters, at the model wavelength.
+
+        Arguments not given are taken from the layers set with
+        `set_layers()`. All arguments are broadcast against each other, with
+        the sweep along the first axis, so for example a thickness sweep of
+        the second layer of a three layer stack is given by `thicknesses`
+        with shape (N, 3). The stack itself is not changed.
+
+        Parameters
+        ----------
+        indices : array_like
+                Complex refractive index of each layer, with shape (N, L) or
+                (L,).
+        thicknesses : array_like
+                Physical thickness of each layer in metres, with shape (N, L)
+                or (L,).
+        theta : array_like
+                Angle of incidence in radians, with shape (N,) or scalar.
+
+        Returns
+        -------
+        values : ndarray
+                Flattened stack matrices, with shape (N, 16).
+        """
+        if self.layers is not None:
+            if indices is None:
+                indices = materials.layer_indices(self.layers[0],
+                                                  self.model.wavelength)
+            thicknesses = self.layers[1] if thicknesses is None \
+                else thicknesses
+            theta = self.layers[2] if theta is None else theta
+        elif indices is None or thicknesses is None:
+            raise Exception('Stack {} has no layers set.'.format(self.name))
+
+        return tmm.stack_matrices(indices, thicknesses, self.model.wavelength,
+                                  0 if theta is None else theta
+                                  ).reshape(-1, 16)
+
+    def update_wavelength(self):
+        """Recalculates the stack transfer matrix at the model wavelength.
+
+        Only stacks with a physical path length or multilayer are changed.
+        """
+        if self.path_length is not None:
+            self.set_path_length(self.path_length, self.loss)
+        elif self.layers is not None:
+            self.set_layers(*self.layers)
+        elif self.periodic is not None:
+            self.set_periodic(*self.periodic)
+        elif self.material is not None:
+            self.set_material(self.material, self.thickness, self.loss)
+
+    def wavelength_values(self, wavelengths):
+        """Returns network matrix values for a sequence of wavelengths.
+
+        Parameters
+        ----------
+        wavelengths : array_like
+                Vacuum wavelengths in metres.
+
+        Returns
+        -------
+        values : ndarray
+                Flattened stack matrices, with shape (N, 16), or None if the
+                stack does not depend on wavelength.
+        """
+        wavelengths = np.asarray(wavelengths, dtype=float)
+
+        lengths = self.optical_lengths(wavelengths)
+        if lengths is not None:
+            return self.length_values(lengths, self.loss)
+
+        if self.layers is not None:
+            return tmm.stack_matrices(
+                materials.layer_indices(self.layers[0], wavelengths),
+                self.layers[1], wavelengths, self.layers[2]).reshape(-1, 16)
+
+        if self.periodic is not None:
+            return tmm.periodic_matrices(
+                *_periodic_indices(self.periodic, wavelengths), wavelengths,
+                self.periodic[5]).reshape(-1, 16)
+
+        return None
+
 
 class FaradayRotator(_ScatterComponent):
     """Faraday rotator with variable rotation angle.
@@ -1062,22 +1641,34 @@ class Waveplate(_ScatterComponent):
             Phase retardance of the waveplate - the phase difference introduced
             between polarisation components passing through the fast and slow
             axes of the waveplate.
+    path_difference : double
+            Optical path difference between the slow and fast axes, in metres
+            (birefringence times thickness). If set, `retardance` is
+            calculated from the model wavelength on `update()`, and follows
+            the wavelength in spectral sweeps.
+    slow_material : strapy.materials._Material
+            Material giving the refractive index of the slow axis, for
+            example `strapy.materials.QUARTZ_E`. If set, with `fast_material`
+            and `thickness`, the path difference is calculated from the
+            dispersion of both materials, and takes precedence over
+            `path_difference`. Set with `set_materials()`.
+    fast_material : strapy.materials._Material
+            Material giving the refractive index of the fast axis.
+    thickness : double
+            Physical thickness of the waveplate in metres.
     """
 
     def __init__(self, name, nodes, model):
         _ScatterComponent.__init__(self, name, nodes, model, 2)
         self.rotation = 0
         self.retardance = 0
-
-        self.numeric_matrix = np.zeros((4, 4), dtype=complex)
-
-        self.numeric_matrix[0][2] = np.exp(-1j * self.retardance / 2)
-        self.numeric_matrix[1][3] = np.exp(1j * self.retardance / 2)
-        self.numeric_matrix[2][0] = np.exp(-1j * self.retardance / 2)
-        self.numeric_matrix[3][1] = np.exp(1j * self.retardance / 2)
+        self.path_difference = None
+        self.slow_material = None
+        self.fast_material = None
+        self.thickness = None
 
         self.numeric_matrix = rotationMatrix44(-self.rotation) \
-            @ self.numeric_matrix \
+            @ self._plate(self.retardance) \
             @ rotationMatrix44(self.rotation)
 
     def initEquation(self, nodes):
@@ -1141,19 +1732,135 @@ class Waveplate(_ScatterComponent):
 
         Must be called manually when values have been changed.
         """
-        self.numeric_matrix = np.zeros((4, 4), dtype=np.complex)
-
-        self.numeric_matrix[0][2] = np.exp(-1j * self.retardance / 2)
-        self.numeric_matrix[1][3] = np.exp(1j * self.retardance / 2)
-        self.numeric_matrix[2][0] = np.exp(-1j * self.retardance / 2)
-        self.numeric_matrix[3][1] = np.exp(1j * self.retardance / 2)
+        retardance = self._retardance(self.model.wavelength)
+        if retardance is not None:
+            self.retardance = retardance
 
         self.numeric_matrix = rotationMatrix44(-self.rotation) \
-            @ self.numeric_matrix \
+            @ self._plate(self.retardance) \
             @ rotationMatrix44(self.rotation)
 
         self.model.updated.append(self.name)
 
+    def value_derivative(self, attribute):
+        """Returns the derivative of the values returned by `setVals()` with
+        respect to an attribute, or None if there is no analytic derivative.
+
+        Derivatives are given for `rotation`, and for `retardance` unless the
+        retardance is calculated from a path difference or materials. Used by
+        :py:class:`strapy.fitting.Fit`. Should not need to be called by the
+        user.
+        """
+        plate = self._plate(self.retardance)
+
+        if attribute == 'rotation':
+            # the derivative of a rotation matrix is the rotation matrix
+            # advanced by a quarter turn.
+            derivative = rotationMatrix44(-self.rotation) @ plate \
+                @ rotationMatrix44(self.rotation + np.pi / 2) \
+                - rotationMatrix44(np.pi / 2 - self.rotation) @ plate \
+                @ rotationMatrix44(self.rotation)
+        elif attribute == 'retardance' \
+                and self._retardance(self.model.wavelength) is None:
+            plate[0][2] *= -0.5j
+            plate[1][3] *= 0.5j
+            plate[2][0] *= -0.5j
+            plate[3][1] *= 0.5j
+            derivative = rotationMatrix44(-self.rotation) @ plate \
+                @ rotationMatrix44(self.rotation)
+        else:
+            return None
+
+        return derivative.flatten()
+
+    def _plate(self, retardance):
+        """Returns the scattering matrix of the waveplate before rotation,
+        or a stack of matrices for an array of retardances."""
+        retardance = np.asarray(retardance)
+
+        plate = np.zeros(retardance.shape + (4, 4), dtype=complex)
+        plate[..., 0, 2] = np.exp(-1j * retardance / 2)
+        plate[..., 1, 3] = np.exp(1j * retardance / 2)
+        plate[..., 2, 0] = plate[..., 0, 2]
+        plate[..., 3, 1] = plate[..., 1, 3]
+
+        return plate
+
+    def set_materials(self, slow_material, fast_material, thickness):
+        """Sets the retardance from the birefringence of a plate of
+        dispersive material, at the model wavelength.
+
+        The retardance follows changes of wavelength, as for a waveplate with
+        a `path_difference`.
+
+        Parameters
+        ----------
+        slow_material : strapy.materials._Material
+                Material giving the refractive index of the slow axis.
+        fast_material : strapy.materials._Material
+                Material giving the refractive index of the fast axis.
+        thickness : double
+                Physical thickness of the waveplate in metres.
+        """
+        if slow_material is None or fast_material is None:
+            raise Exception('Waveplate {} needs both a slow and a fast axis '
+                            'material.'.format(self.name))
+
+        self.slow_material = slow_material
+        self.fast_material = fast_material
+        self.thickness = thickness
+        self.update()
+
+    def _retardance(self, wavelengths):
+        """Returns the retardance at each wavelength from the materials or
+        path difference, or None if neither is set."""
+        if self.slow_material is not None or self.fast_material is not None:
+            if self.slow_material is None or self.fast_material is None \
+                    or self.thickness is None:
+                raise Exception('Waveplate {} needs a slow and a fast axis '
+                                'material and a thickness, set with '
+                                'set_materials().'.format(self.name))
+
+            birefringence = np.real(
+                materials.index(self.slow_material, wavelengths)
+                - materials.index(self.fast_material, wavelengths))
+            return 2 * np.pi * birefringence * self.thickness / wavelengths
+
+        if self.path_difference is not None:
+            return 2 * np.pi * self.path_difference / wavelengths
+
+        return None
+
+    def update_wavelength(self):
+        """Recalculates the retardance at the model wavelength, if the
+        waveplate has a physical path difference or materials."""
+        if self._retardance(self.model.wavelength) is not None:
+            self.update()
+
+    def wavelength_values(self, wavelengths):
+        """Returns network matrix values for a sequence of wavelengths.
+
+        Parameters
+        ----------
+        wavelengths : array_like
+                Vacuum wavelengths in metres.
+
+        Returns
+        -------
+        values : ndarray
+                Flattened scattering matrices, with shape (N, 16), or None if
+                the waveplate has no physical path difference or materials.
+        """
+        retardance = self._retardance(np.asarray(wavelengths, dtype=float))
+        if retardance is None:
+            return None
+
+        matrices = rotationMatrix44(-self.rotation) \
+            @ self._plate(retardance) \
+            @ rotationMatrix44(self.rotation)
+
+        return matrices.reshape(-1, 16)
+
 
 class Polariser(_ScatterComponent):
     """Linear polariser with variable rotation angle, extinction ratio and
@@ -1327,6 +2034,19 @@ class Mirror(_Component):
         """
         return [self.rP, self.rS]
 
+    def value_derivative(self, attribute):
+        """Returns the derivative of the values returned by `setVals()` with
+        respect to an attribute, or None if there is no analytic derivative.
+
+        Used by :py:class:`strapy.fitting.Fit`. Should not need to be called
+        by the user.
+        """
+        if attribute in ('rP', 'rS'):
+            return np.array([attribute == 'rP', attribute == 'rS'],
+                            dtype=complex)
+
+        return None
+
 
 class Dump(_Component):
     """Beam dump to terminate stack.
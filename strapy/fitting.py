@@ -0,0 +1,381 @@
+"""The fitting module holds the least squares fitting of model parameters to
+measured detector data, for example to identify the real rotations of
+waveplates and the leakage of polarising beam splitters from measured
+interferometer signals.
+
+Fitted parameters are named component attributes, mapped to a flat parameter
+vector. Residuals are evaluated over the whole measured sweep by a single
+batched evaluation (see :py:meth:`strapy.Model.evaluate_batch()`), and the
+Jacobian is calculated analytically from the same solve: the derivative of
+the solution of A x = b with respect to a parameter is
+
+    dx = A^-1 (db - dA x)
+
+where dA and db are the changes to the matrix equation stamped by the
+component. The columns of A^-1 needed are solved together with the sweep, so
+the Jacobian costs about as much as one evaluation of the residuals, whatever
+the number of parameters. Components give the derivatives of their values
+through a `value_derivative()` method where available, otherwise these are
+found by central differences of the component values alone, without solving
+the model.
+"""
+
+
+import re
+import numpy as np
+import scipy.optimize
+from . import components
+from .Detector import POWER_PROPERTIES, calculate_properties
+
+
+# relative step for central differences of component values.
+DIFFERENCE_STEP = 1e-6
+
+
+def _parse_parameter(parameter):
+    """Splits a parameter name into component name, attribute and index."""
+    match = re.fullmatch(r'(.+)\.(\w+)(?:\[(\d+)\])?', parameter)
+    if match is None:
+        raise Exception('Parameter {} is not of the form '
+                        '"component.attribute".'.format(parameter))
+
+    index = None if match.group(3) is None else int(match.group(3))
+
+    return match.group(1), match.group(2), index
+
+
+class Fit():
+    """Least squares fit of model parameters to measured detector data.
+
+    The measured data are detected powers at each point of a batch of
+    component values, as passed to :py:meth:`strapy.Model.evaluate_batch()`,
+    for example the intensities at two photodetectors as the length of a
+    stack is swept. Fitted components must not be among the batched
+    components.
+
+    Model must be built before fitting.
+
+    Attributes
+    ----------
+    model : strapy.Model
+            Model to be fitted.
+    parameters : list of str
+            Names of the fitted parameters, each of the form
+            `'component.attribute'`, or `'component.attribute[i]'` for an
+            element of a list attribute such as `Source.amplitude`.
+            Attributes must be real, and are applied by the component's
+            `update()` method if it has one.
+    values : dict
+            Numerical component values for each point of the sweep, keyed by
+            component name, each with shape (N, len(setVals())).
+    data : dict
+            Measured values, keyed by (detector name, property) tuples. Each
+            property must be a power, for example `'intensity'` or
+            `'Stokes'`, with the shape of the detected property for the
+            sweep.
+    weights : dict
+            Weight of each residual, keyed as `data` and broadcast against
+            it. Defaults to 1 for all data.
+    """
+
+    def __init__(self, model, parameters, values, data, weights=None):
+        self.model = model
+        self.parameters = list(parameters)
+        self.values = values
+        self.data = {}
+        self.weights = {}
+
+        self.batch = {}
+        nPoints = None
+        for name, vals in values.items():
+            vals = np.asarray(vals, dtype=complex)
+            self.batch[name] = vals.reshape(vals.shape[0], -1)
+            if nPoints is None:
+                nPoints = vals.shape[0]
+
+        if nPoints is None:
+            raise Exception('No batched values to fit.')
+        self.nPoints = nPoints
+
+        self.fitted = [_parse_parameter(parameter)
+                       for parameter in self.parameters]
+        for name, attribute, index in self.fitted:
+            if name not in model.components:
+                raise Exception('Component {} not in model.'.format(name))
+            if name in values:
+                raise Exception(
+                    'Component {} is both fitted and batched.'.format(name))
+            if not(hasattr(model.components[name], attribute)):
+                raise Exception('Component {} has no attribute {}.'.format(
+                    name, attribute))
+
+        for key, measured in data.items():
+            detector, prop = key
+            if detector not in model.detectors:
+                raise Exception('Detector {} not in model.'.format(detector))
+            if prop not in POWER_PROPERTIES:
+                raise Exception('Cannot fit {}, only detected powers can be '
+                                'fitted.'.format(prop))
+            if prop not in model.detectors[detector].properties:
+                raise Exception('Detector {} does not detect {}.'.format(
+                    detector, prop))
+
+            measured = np.asarray(measured, dtype=float)
+            if measured.shape[0] != nPoints:
+                raise Exception('Data for {} have {} points, expected '
+                                '{}.'.format(key, measured.shape[0], nPoints))
+
+            self.data[key] = measured
+            self.weights[key] = 1.0 if weights is None else \
+                np.asarray(weights.get(key, 1.0), dtype=float)
+
+        # detectors with data, and their elements of the solution vector.
+        self.detectorNames = list(dict.fromkeys(key[0] for key in self.data))
+        self.targets = np.concatenate(
+            [model.detectors[name].node_index + np.arange(4)
+             for name in self.detectorNames])
+
+    def _set(self, fitted, value):
+        """Sets a single fitted attribute and marks its component as
+        updated."""
+        name, attribute, index = fitted
+        component = self.model.components[name]
+
+        if index is None:
+            setattr(component, attribute, value)
+        else:
+            vals = list(getattr(component, attribute))
+            vals[index] = value
+            setattr(component, attribute, vals)
+
+        if hasattr(component, 'update'):
+            component.update()
+        else:
+            self.model.updated.append(name)
+
+    def _get(self, fitted):
+        """Returns a single fitted attribute."""
+        name, attribute, index = fitted
+        value = getattr(self.model.components[name], attribute)
+
+        return np.real(value if index is None else value[index])
+
+    def set_parameters(self, parameters):
+        """Sets the fitted attributes of the model components.
+
+        Parameters
+        ----------
+        parameters : array_like
+                Value of each fitted parameter, in the order of `parameters`.
+        """
+        for fitted, value in zip(self.fitted, parameters):
+            self._set(fitted, float(value))
+
+    def get_parameters(self):
+        """Returns the current values of the fitted parameters.
+
+        Returns
+        -------
+        parameters : ndarray
+                Value of each fitted parameter, in the order of `parameters`.
+        """
+        return np.array([self._get(fitted) for fitted in self.fitted],
+                        dtype=float)
+
+    def residuals(self, parameters):
+        """Returns the weighted residuals of the model for the given
+        parameters.
+
+        Parameters
+        ----------
+        parameters : array_like
+                Value of each fitted parameter.
+
+        Returns
+        -------
+        residuals : ndarray
+                Weighted differences between modelled and measured data,
+                flattened in the order of `data`.
+        """
+        self.set_parameters(parameters)
+        results = self.model.evaluate_batch(self.values)
+
+        return np.concatenate(
+            [np.ravel((results[detector][prop] - measured)
+                      * self.weights[(detector, prop)])
+             for (detector, prop), measured in self.data.items()])
+
+    def _value_derivative(self, fitted, value):
+        """Returns the derivative of a component's values with respect to a
+        fitted parameter, from the component if available, otherwise by
+        central differences."""
+        name, attribute, index = fitted
+        component = self.model.components[name]
+
+        derivative = None
+        if index is None and hasattr(component, 'value_derivative'):
+            derivative = component.value_derivative(attribute)
+
+        if derivative is None:
+            step = DIFFERENCE_STEP * max(1, abs(value))
+            self._set(fitted, value + step)
+            plus = np.array(component.setVals(), dtype=complex)
+            self._set(fitted, value - step)
+            minus = np.array(component.setVals(), dtype=complex)
+            self._set(fitted, value)
+            derivative = (plus - minus) / (2 * step)
+
+        return np.asarray(derivative, dtype=complex)
+
+    def _fused(self, component):
+        """Returns True if the values of a component enter lambdified
+        elements of the matrix equation."""
+        if isinstance(component, components.Source):
+            fused = self.model.fusedRhsVariables
+        else:
+            fused = self.model.fusedMatrixVariables
+
+        return bool(np.any(fused[component.set_slice]))
+
+    def jacobian(self, parameters):
+        """Returns the Jacobian of the weighted residuals.
+
+        The derivatives of the solution are calculated analytically for all
+        points and parameters from a single batched solve. If the values of
+        a fitted component enter lambdified elements of the matrix equation
+        (see `strapy.Model.useLambdify`), the residuals are differentiated
+        by central differences instead.
+
+        Parameters
+        ----------
+        parameters : array_like
+                Value of each fitted parameter.
+
+        Returns
+        -------
+        jacobian : ndarray
+                Derivative of each residual with respect to each parameter,
+                with shape (len(residuals), len(parameters)).
+        """
+        parameters = np.asarray(parameters, dtype=float)
+
+        model = self.model
+        fittedComponents = [model.components[fitted[0]]
+                            for fitted in self.fitted]
+
+        if any(self._fused(component) for component in fittedComponents):
+            return self._difference_jacobian(parameters)
+
+        self.set_parameters(parameters)
+        model._stamp()
+        nGroups = len(model.coherenceGroups)
+        nTargets = len(self.targets)
+
+        # columns of the inverse network matrix in the rows stamped by the
+        # fitted components, and the solution elements their matrix entries
+        # multiply.
+        rows = np.unique(np.concatenate(
+            [component.stampRows for component in fittedComponents]))
+        cols = np.unique(np.concatenate(
+            [component.stampCols for component in fittedComponents
+             if not(isinstance(component, components.Source))]
+            + [np.empty(0, dtype=int)]))
+
+        solutions = model._solve_batch(
+            self.batch, np.concatenate((self.targets, cols)), rows)
+        x = solutions[..., :nGroups]
+        inverse = solutions[:, :nTargets, nGroups:]
+
+        # changes to db - dA x in the stamped rows for each parameter, with
+        # shape (parameters, rows, N, groups).
+        xCols = np.moveaxis(x[:, nTargets:], 0, 1).reshape(
+            len(cols), self.nPoints * nGroups)
+        residual = np.zeros((len(self.fitted), len(rows), self.nPoints,
+                             nGroups), dtype=complex)
+        for j, (fitted, component) in enumerate(zip(self.fitted,
+                                                    fittedComponents)):
+            entries = self._value_derivative(fitted, parameters[j])[
+                component.stampSymbols] * component.stampSigns
+            rowPos = np.searchsorted(rows, component.stampRows)
+
+            if isinstance(component, components.Source):
+                np.add.at(residual[j], (rowPos, slice(None),
+                                        model.rhsGroups[component.stampRows]),
+                          entries[:, np.newaxis])
+            else:
+                change = np.zeros((len(rows), len(cols)), dtype=complex)
+                np.add.at(change, (rowPos,
+                                   np.searchsorted(cols, component.stampCols)),
+                          entries)
+                residual[j] = -(change @ xCols).reshape(residual.shape[1:])
+
+        derivatives = np.einsum('ntr,prng->pntg', inverse, residual,
+                                optimize=True)
+
+        # detected powers are quadratic in the amplitudes, so the difference
+        # of powers at amplitudes +/- dx gives the exact derivative.
+        shape = (self.nPoints, len(self.detectorNames), 4, nGroups)
+        amplitudes = np.moveaxis(x[:, :nTargets].reshape(shape), -1, -2)
+        changes = np.moveaxis(
+            derivatives.reshape((len(self.fitted),) + shape), -1, -2)
+        properties = tuple(set(key[1] for key in self.data))
+        plus = calculate_properties(amplitudes + changes, properties)
+        minus = calculate_properties(amplitudes - changes, properties)
+
+        blocks = []
+        for (detector, prop), measured in self.data.items():
+            row = self.detectorNames.index(detector)
+            derivative = np.sum(plus[prop][:, :, row] - minus[prop][:, :, row],
+                                axis=2) / 2
+            blocks.append(np.reshape(
+                derivative * self.weights[(detector, prop)],
+                (len(self.fitted), -1)).T)
+
+        return np.concatenate(blocks, axis=0)
+
+    def _difference_jacobian(self, parameters):
+        """Returns the Jacobian of the weighted residuals by central
+        differences."""
+        columns = []
+        for j, value in enumerate(parameters):
+            step = DIFFERENCE_STEP * max(1, abs(value))
+            shifted = parameters.copy()
+            shifted[j] = value + step
+            plus = self.residuals(shifted)
+            shifted[j] = value - step
+            minus = self.residuals(shifted)
+            columns.append((plus - minus) / (2 * step))
+
+        self.set_parameters(parameters)
+
+        return np.stack(columns, axis=1)
+
+    def fit(self, initial=None, **options):
+        """Fits the parameters by nonlinear least squares.
+
+        Uses `scipy.optimize.least_squares()` with the analytic Jacobian of
+        `jacobian()`. The model is left with the fitted parameters set.
+
+        Parameters
+        ----------
+        initial : array_like
+                Initial value of each parameter. Defaults to the current
+                values of the fitted attributes.
+        **options
+                Further options passed to `scipy.optimize.least_squares()`,
+                for example `bounds` or `x_scale`.
+
+        Returns
+        -------
+        result : scipy.optimize.OptimizeResult
+                Result of the fit, with fitted parameters `x`.
+        """
+        if initial is None:
+            initial = self.get_parameters()
+
+        options.setdefault('jac', self.jacobian)
+        result = scipy.optimize.least_squares(self.residuals, initial,
+                                              **options)
+        self.set_parameters(result.x)
+
+        return result
@@ -0,0 +1,214 @@
+"""The materials module holds dispersive optical materials, whose refractive
+indices are calculated from dispersion formulas for any array of wavelengths.
+
+Materials can be used in place of refractive indices by
+:py:meth:`strapy.components.Stack.set_material()`,
+:py:meth:`strapy.components.Stack.set_layers()` and
+:py:meth:`strapy.components.Stack.set_periodic()`, and for the birefringence
+of :py:class:`strapy.components.Waveplate`, so that stack and waveplate phases
+follow the wavelength in spectral sweeps. Each material is defined in a
+separate class, and must inherit from the `_Material` class.
+
+Index tables are cached in the least recently used cache `INDEX_CACHE`, keyed
+by material and wavelengths, so repeated spectral sweeps over the same
+wavelengths do not re-evaluate dispersion formulas.
+
+Predefined materials are:
+
+    * `BK7` - Schott N-BK7 glass.
+    * `FUSED_SILICA` - fused silica (Malitson, 1965).
+    * `QUARTZ_O`, `QUARTZ_E` - ordinary and extraordinary indices of
+        crystalline quartz (Ghosh, 1999).
+"""
+
+
+import numpy as np
+from .cache import LRUCache
+
+
+# refractive index tables, keyed by material and wavelengths.
+INDEX_CACHE = LRUCache(256)
+
+
+class _Material():
+    """General material class for inheritance of common properties.
+
+    Not for external use.
+
+    Attributes
+    ----------
+    name : str
+            Name of the material.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '{}({})'.format(self.__class__.__name__, self.name)
+
+    def _evaluate(self, wavelengths):
+        """Returns refractive indices at wavelengths in micrometres."""
+        raise NotImplementedError
+
+    def index(self, wavelengths):
+        """Returns the refractive index at each wavelength.
+
+        Parameters
+        ----------
+        wavelengths : array_like
+                Vacuum wavelengths in metres.
+
+        Returns
+        -------
+        indices : ndarray or complex
+                Complex refractive indices, with the shape of `wavelengths`.
+                Cached arrays are read only.
+        """
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        key = (self, wavelengths.shape, wavelengths.tobytes())
+
+        indices = INDEX_CACHE.get(key)
+        if indices is None:
+            indices = np.asarray(self._evaluate(wavelengths * 1e6),
+                                 dtype=complex)
+            indices.setflags(write=False)
+            INDEX_CACHE.put(key, indices)
+
+        if indices.ndim == 0:
+            return complex(indices)
+
+        return indices
+
+
+class Constant(_Material):
+    """Non-dispersive material.
+
+    Attributes
+    ----------
+    n : complex
+            Complex refractive index.
+    """
+
+    def __init__(self, n, name=None):
+        _Material.__init__(self, str(n) if name is None else name)
+        self.n = complex(n)
+
+    def _evaluate(self, wavelengths):
+        return np.full(np.shape(wavelengths), self.n)
+
+
+class Sellmeier(_Material):
+    """Material with a Sellmeier dispersion formula,
+
+        n^2 = A + sum(B_i * L^2 / (L^2 - C_i))
+
+    for wavelength L in micrometres.
+
+    Attributes
+    ----------
+    B : tuple of double
+            Sellmeier coefficients.
+    C : tuple of double
+            Sellmeier resonance wavelengths squared, in square micrometres.
+    A : double
+            Constant term.
+    """
+
+    def __init__(self, B, C, A=1, name='Sellmeier'):
+        _Material.__init__(self, name)
+
+        if len(B) != len(C):
+            raise Exception('{} B coefficients given for {} C '
+                            'coefficients.'.format(len(B), len(C)))
+
+        self.B = tuple(B)
+        self.C = tuple(C)
+        self.A = A
+
+    def _evaluate(self, wavelengths):
+        square = wavelengths**2
+        nSquare = self.A + sum(B * square / (square - C)
+                               for B, C in zip(self.B, self.C))
+
+        return np.sqrt(nSquare + 0j)
+
+
+class Cauchy(_Material):
+    """Material with a Cauchy dispersion formula,
+
+        n = sum(A_i / L^(2i))
+
+    for wavelength L in micrometres.
+
+    Attributes
+    ----------
+    A : tuple of double
+            Cauchy coefficients, starting from the constant term.
+    """
+
+    def __init__(self, A, name='Cauchy'):
+        _Material.__init__(self, name)
+        self.A = tuple(A)
+
+    def _evaluate(self, wavelengths):
+        return sum(A / wavelengths**(2 * i) for i, A in enumerate(self.A)) \
+            + 0j
+
+
+def index(material, wavelengths):
+    """Returns the refractive index of a material or fixed index.
+
+    Parameters
+    ----------
+    material : strapy.materials._Material or complex
+            Material, or a fixed refractive index.
+    wavelengths : array_like
+            Vacuum wavelengths in metres.
+
+    Returns
+    -------
+    indices : ndarray or complex
+            Complex refractive indices, with the shape of `wavelengths`, or
+            the fixed index.
+    """
+    if isinstance(material, _Material):
+        return material.index(wavelengths)
+
+    return complex(material)
+
+
+def layer_indices(materials, wavelengths):
+    """Returns the refractive indices of a sequence of layers.
+
+    Parameters
+    ----------
+    materials : tuple
+            Material, or fixed refractive index, of each layer.
+    wavelengths : array_like
+            Vacuum wavelengths in metres.
+
+    Returns
+    -------
+    indices : ndarray
+            Complex refractive indices, with shape
+            `np.shape(wavelengths) + (len(materials),)`.
+    """
+    shape = np.shape(wavelengths)
+
+    return np.stack([np.broadcast_to(index(material, wavelengths), shape)
+                     for material in materials], axis=-1)
+
+
+BK7 = Sellmeier((1.03961212, 0.231792344, 1.01046945),
+                (0.00600069867, 0.0200179144, 103.560653), name='BK7')
+
+FUSED_SILICA = Sellmeier((0.6961663, 0.4079426, 0.8974794),
+                         (0.0684043**2, 0.1162414**2, 9.896161**2),
+                         name='fused silica')
+
+QUARTZ_O = Sellmeier((1.07044083, 1.10202242), (1.00585997e-2, 100),
+                     A=1.28604141, name='quartz (ordinary)')
+
+QUARTZ_E = Sellmeier((1.09509924, 1.15662475), (1.02101864e-2, 100),
+                     A=1.28851804, name='quartz (extraordinary)')
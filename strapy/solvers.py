@@ -0,0 +1,332 @@
+"""The solvers module holds the linear solver backends used to solve the
+network matrix equation. Each backend is defined in a separate class, and must
+inherit from the `_Solver` class.
+
+Backends are selected with :py:meth:`strapy.Model.set_solver()`, either by
+name or automatically (`'auto'`, the default) from the size and sparsity of
+the network matrix:
+
+    * `'dense'` - LAPACK solve of the dense network matrix, best for small
+        models.
+    * `'lu'` - dense LU factorisation, cached until the network matrix
+        changes. Useful when only sources are changed between evaluations.
+    * `'sparse'` - sparse direct LU factorisation, cached until the network
+        matrix changes. Best for larger models, where each node couples to
+        only a few others.
+    * `'iterative'` - GMRES or BiCGSTAB Krylov solver with an incomplete LU
+        preconditioner, for very large networks. Solves are warm-started from
+        the previous solution, and the preconditioner reused while it remains
+        effective.
+
+The network matrix is always held densely by the model; sparse backends
+gather the possibly non-zero elements, which are fixed at build time, into a
+sparse matrix with a precomputed structure before solving.
+"""
+
+
+import numpy as np
+import scipy.linalg
+import scipy.sparse
+import scipy.sparse.linalg
+
+
+# network matrices with fewer rows than this are solved densely.
+DENSE_SIZE = 200
+# network matrices with at least this many rows are solved iteratively.
+ITERATIVE_SIZE = 20000
+# network matrices with a greater fraction of variable elements than this are
+# solved densely, regardless of size.
+DENSE_SPARCITY = 0.1
+
+
+def select_solver(shape, sparcity):
+    """Returns the name of the solver backend best suited to a network matrix.
+
+    Parameters
+    ----------
+    shape : tuple of int
+            Shape of the network matrix.
+    sparcity : float
+            Fraction of network matrix elements set by component values.
+
+    Returns
+    -------
+    name : str
+            Name of the solver backend.
+    """
+    if shape[0] < DENSE_SIZE or sparcity > DENSE_SPARCITY:
+        return 'dense'
+    if shape[0] < ITERATIVE_SIZE:
+        return 'sparse'
+    return 'iterative'
+
+
+class _Solver():
+    """General solver class for inheritance of common properties.
+
+    Not for external use.
+
+    Attributes
+    ----------
+    solves : int
+            Total number of solves.
+    """
+
+    def __init__(self):
+        self.shape = None
+        self.pattern = None
+        self.solves = 0
+
+    def setup(self, shape, pattern):
+        """Initialises solver for the structure of a built network matrix.
+
+        Should not need to be called by the user.
+
+        Parameters
+        ----------
+        shape : tuple of int
+                Shape of the network matrix.
+        pattern : tuple of ndarray
+                Row and column indices of all possibly non-zero network matrix
+                elements.
+        """
+        self.shape = shape
+        self.pattern = pattern
+
+    def solve(self, matrix, rhs, matrixChanged=True):
+        """Solves the network matrix equation.
+
+        Should not need to be called by the user.
+
+        Parameters
+        ----------
+        matrix : ndarray
+                Network matrix.
+        rhs : ndarray
+                Right hand side vector, or several right hand side vectors
+                as columns.
+        matrixChanged : bool
+                False if the network matrix is unchanged since the last solve,
+                allowing cached factorisations to be reused.
+
+        Returns
+        -------
+        solution_vector : ndarray
+                Solution to the network matrix equation.
+        """
+        raise NotImplementedError
+
+
+class _SparseSolver(_Solver):
+    """General class for solvers operating on a sparse network matrix.
+
+    Not for external use.
+    """
+
+    def setup(self, shape, pattern):
+        _Solver.setup(self, shape, pattern)
+
+        # order elements by column, so that gathered values are directly the
+        # data array of a compressed sparse column matrix.
+        rows, cols = pattern
+        order = np.lexsort((rows, cols))
+        self.rows = rows[order]
+        self.cols = cols[order]
+        self.indptr = np.zeros(shape[1] + 1, dtype=int)
+        self.indptr[1:] = np.cumsum(np.bincount(self.cols,
+                                                minlength=shape[1]))
+
+    def sparse_matrix(self, matrix):
+        """Returns network matrix as a compressed sparse column matrix.
+
+        Parameters
+        ----------
+        matrix : ndarray
+                Dense network matrix.
+        """
+        return scipy.sparse.csc_matrix(
+            (matrix[self.rows, self.cols], self.rows, self.indptr),
+            shape=self.shape)
+
+
+class DenseSolver(_Solver):
+    """Dense LAPACK solver.
+
+    The network matrix is solved directly with `numpy.linalg.solve` on every
+    evaluation.
+    """
+
+    def solve(self, matrix, rhs, matrixChanged=True):
+        self.solves += 1
+        return np.linalg.solve(matrix, rhs)
+
+
+class LUSolver(_Solver):
+    """Dense LU solver with cached factorisation.
+
+    The LU factorisation of the network matrix is kept until the matrix
+    changes, so evaluations that only change sources cost two triangular
+    solves.
+    """
+
+    def __init__(self):
+        _Solver.__init__(self)
+        self.factors = None
+
+    def solve(self, matrix, rhs, matrixChanged=True):
+        self.solves += 1
+        if matrixChanged or self.factors is None:
+            self.factors = scipy.linalg.lu_factor(matrix, check_finite=False)
+        return scipy.linalg.lu_solve(self.factors, rhs, check_finite=False)
+
+
+class SparseSolver(_SparseSolver):
+    """Sparse direct solver with cached factorisation.
+
+    The network matrix is factorised with SuperLU, and the factorisation kept
+    until the matrix changes.
+    """
+
+    def __init__(self):
+        _SparseSolver.__init__(self)
+        self.factors = None
+
+    def solve(self, matrix, rhs, matrixChanged=True):
+        self.solves += 1
+        if matrixChanged or self.factors is None:
+            self.factors = scipy.sparse.linalg.splu(self.sparse_matrix(matrix))
+        return self.factors.solve(rhs)
+
+
+class IterativeSolver(_SparseSolver):
+    """Krylov subspace solver with incomplete LU preconditioner.
+
+    Each solve is started from the previous solution, and the incomplete LU
+    preconditioner is kept across changes to the network matrix until a solve
+    takes more than `refresh_iterations` iterations. For sweeps in which the
+    network matrix changes slowly this typically gives convergence in a few
+    iterations per point. Several right hand sides, such as those of the
+    coherence groups of a model, are solved in turn with the same
+    preconditioner, each started from the same column of the previous
+    solution. If the iterative solve fails to converge the network matrix is
+    solved with a sparse direct factorisation instead, and `fallbacks`
+    incremented.
+
+    Attributes
+    ----------
+    method : str
+            Krylov method, either `'gmres'` or `'bicgstab'`.
+    tol : float
+            Relative residual tolerance for convergence.
+    maxiter : int
+            Maximum number of iterations before falling back to a direct
+            solve.
+    drop_tol : float
+            Drop tolerance of the incomplete LU preconditioner.
+    fill_factor : float
+            Fill factor of the incomplete LU preconditioner.
+    warm_start : bool
+            If true, each solve is started from the previous solution.
+    refresh_iterations : int
+            Number of iterations above which the preconditioner is rebuilt
+            before the next solve. If `None` the preconditioner is rebuilt
+            whenever the network matrix changes.
+    iterations : int
+            Number of iterations taken by the last solve, over all right hand
+            sides.
+    total_iterations : int
+            Total number of iterations over all solves.
+    preconditioner_builds : int
+            Number of times the preconditioner has been built.
+    fallbacks : int
+            Number of solves that fell back to a direct factorisation.
+    """
+
+    def __init__(self, method='gmres', tol=1e-10, maxiter=1000, drop_tol=1e-4,
+                 fill_factor=10, warm_start=True, refresh_iterations=20):
+        _SparseSolver.__init__(self)
+
+        if method not in ('gmres', 'bicgstab'):
+            raise Exception('Unknown iterative method {}.'.format(method))
+
+        self.method = method
+        self.tol = tol
+        self.maxiter = maxiter
+        self.drop_tol = drop_tol
+        self.fill_factor = fill_factor
+        self.warm_start = warm_start
+        self.refresh_iterations = refresh_iterations
+        self.iterations = 0
+        self.total_iterations = 0
+        self.preconditioner_builds = 0
+        self.fallbacks = 0
+        self.preconditioner = None
+        self.previous = None
+
+    def _count(self, *args):
+        """Callback counting solver iterations."""
+        self.iterations += 1
+
+    def solve(self, matrix, rhs, matrixChanged=True):
+        sparseMatrix = self.sparse_matrix(matrix)
+
+        if self.preconditioner is None or (
+                matrixChanged and self.refresh_iterations is None):
+            ilu = scipy.sparse.linalg.spilu(sparseMatrix,
+                                            drop_tol=self.drop_tol,
+                                            fill_factor=self.fill_factor)
+            self.preconditioner = scipy.sparse.linalg.LinearOperator(
+                self.shape, ilu.solve, dtype=complex)
+            self.preconditioner_builds += 1
+
+        warm = self.warm_start and self.previous is not None \
+            and self.previous.shape == rhs.shape
+
+        x = np.zeros(rhs.shape, dtype=complex)
+        factors = None
+        stale = False
+
+        self.iterations = 0
+        for i in range(rhs.shape[1]):
+            x0 = self.previous[:, i] if warm else None
+            start = self.iterations
+
+            if self.method == 'gmres':
+                x[:, i], info = scipy.sparse.linalg.gmres(
+                    sparseMatrix, rhs[:, i], x0=x0, rtol=self.tol, atol=0,
+                    maxiter=self.maxiter, M=self.preconditioner,
+                    callback=self._count, callback_type='pr_norm')
+            else:
+                x[:, i], info = scipy.sparse.linalg.bicgstab(
+                    sparseMatrix, rhs[:, i], x0=x0, rtol=self.tol, atol=0,
+                    maxiter=self.maxiter, M=self.preconditioner,
+                    callback=self._count)
+
+            # a stale preconditioner is discarded once it stops being
+            # effective.
+            if self.refresh_iterations is not None and \
+                    self.iterations - start > self.refresh_iterations:
+                stale = True
+
+            if info != 0:
+                self.fallbacks += 1
+                stale = True
+                if factors is None:
+                    factors = scipy.sparse.linalg.splu(sparseMatrix)
+                x[:, i] = factors.solve(rhs[:, i])
+
+        self.total_iterations += self.iterations
+        self.solves += 1
+
+        if stale:
+            self.preconditioner = None
+
+        self.previous = x
+
+        return x
+
+
+SOLVERS = {'dense': DenseSolver,
+           'lu': LUSolver,
+           'sparse': SparseSolver,
+           'iterative': IterativeSolver}
@@ -0,0 +1,249 @@
+"""The store module holds the persistent result store used to reuse model
+solutions across runs, see :py:meth:`strapy.Model.set_store()`.
+
+Results are kept in a directory holding an SQLite index and NumPy `.npy`
+blobs. Each result is keyed by a hash of the model topology (its components,
+nodes and detectors), the kind of result, and a hash of the values of all
+components, so re-running an unchanged study finds its results in the store
+rather than solving again. Results written together, for example all points
+of a batched evaluation, share one blob and are indexed in a single
+transaction. Results written one at a time, for example by single
+evaluations in an optimisation loop, are held in memory and written together
+once `FLUSH_SIZE` are pending, or when the store is flushed or closed; they
+are found by lookups in the meantime. Pending results are also written when
+the interpreter exits, and stores can be used as context managers, closing
+on exit from the block.
+
+The store does not detect changes to the code of components; it should be
+cleared after changing component definitions or upgrading strapy.
+"""
+
+
+import atexit
+import os
+import sqlite3
+import uuid
+import numpy as np
+
+
+# name of the SQLite index within a store directory.
+INDEX_NAME = 'index.sqlite'
+# maximum number of states looked up by a single query.
+LOOKUP_BATCH = 500
+# number of single results held in memory before they are written together.
+FLUSH_SIZE = 256
+
+
+class ResultStore():
+    """Persistent store of model results.
+
+    Attributes
+    ----------
+    path : str
+            Directory holding the store.
+    hits : int
+            Number of results found by lookups.
+    misses : int
+            Number of results not found by lookups.
+    writes : int
+            Number of results written.
+    pending : dict
+            Single results not yet written, keyed by (topology, kind) and
+            then by state.
+    """
+
+    def __init__(self, path):
+        os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.pending = {}
+
+        self.connection = sqlite3.connect(os.path.join(path, INDEX_NAME))
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS results (topology TEXT, '
+                'kind TEXT, state TEXT, blob TEXT, row INTEGER, '
+                'PRIMARY KEY (topology, kind, state))')
+
+        # pending results of stores left open are written at exit.
+        atexit.register(self.flush)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        self.flush()
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def get_many(self, topology, kind, states):
+        """Looks up the results of many states.
+
+        Parameters
+        ----------
+        topology : str
+                Hash of the model topology.
+        kind : str
+                Kind of result.
+        states : list of str
+                Hash of each state.
+
+        Returns
+        -------
+        found : ndarray
+                True for each state with a stored result.
+        values : ndarray
+                Stored results of the found states, in order, or None if no
+                states were found.
+        """
+
+        pending = self.pending.get((topology, kind), {})
+        unwritten = [state for state in states if state not in pending]
+
+        locations = {}
+        for start in range(0, len(unwritten), LOOKUP_BATCH):
+            batch = unwritten[start:start + LOOKUP_BATCH]
+            locations.update(
+                (state, (blob, row)) for state, blob, row in
+                self.connection.execute(
+                    'SELECT state, blob, row FROM results WHERE topology = ? '
+                    'AND kind = ? AND state IN ({})'.format(
+                        ', '.join('?' * len(batch))),
+                    [topology, kind] + list(batch)))
+
+        found = np.array([state in locations or state in pending
+                          for state in states], dtype=bool)
+        self.hits += int(np.sum(found))
+        self.misses += len(states) - int(np.sum(found))
+
+        if not(found.any()):
+            return found, None
+
+        # read each blob once, taking the rows of all its states.
+        hits = [state for state in states
+                if state in locations or state in pending]
+        values = [pending.get(state) for state in hits]
+        blobs = {}
+        for i, state in enumerate(hits):
+            if state in locations:
+                blob, row = locations[state]
+                blobs.setdefault(blob, []).append((i, row))
+        for blob, positions in blobs.items():
+            stored = np.load(os.path.join(self.path, blob), mmap_mode='r')
+            for i, row in positions:
+                values[i] = np.array(stored[row])
+
+        return found, np.stack(values)
+
+    def put_many(self, topology, kind, states, values):
+        """Writes the results of many states as one blob, indexed in a single
+        transaction.
+
+        Parameters
+        ----------
+        topology : str
+                Hash of the model topology.
+        kind : str
+                Kind of result.
+        states : list of str
+                Hash of each state.
+        values : ndarray
+                Result of each state, along the first axis.
+        """
+
+        if len(states) == 0:
+            return
+
+        blob = uuid.uuid4().hex + '.npy'
+
+        # the blob is complete before it is indexed.
+        temporary = os.path.join(self.path, blob + '.tmp')
+        with open(temporary, 'wb') as file:
+            np.save(file, np.asarray(values))
+        os.replace(temporary, os.path.join(self.path, blob))
+
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                [(topology, kind, state, blob, row)
+                 for row, state in enumerate(states)])
+
+        self.writes += len(states)
+
+    def get(self, topology, kind, state):
+        """Returns the stored result of a single state, or None.
+
+        Parameters
+        ----------
+        topology : str
+                Hash of the model topology.
+        kind : str
+                Kind of result.
+        state : str
+                Hash of the state.
+        """
+        found, values = self.get_many(topology, kind, [state])
+
+        return values[0] if found[0] else None
+
+    def put(self, topology, kind, state, value):
+        """Adds the result of a single state.
+
+        The result is held in memory, and written with other single results
+        once `FLUSH_SIZE` are pending, or by `flush()` or `close()`.
+
+        Parameters
+        ----------
+        topology : str
+                Hash of the model topology.
+        kind : str
+                Kind of result.
+        state : str
+                Hash of the state.
+        value : ndarray
+                Result to be stored.
+        """
+        self.pending.setdefault((topology, kind), {})[state] = \
+            np.array(value)
+
+        if sum(len(results) for results in self.pending.values()) \
+                >= FLUSH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Writes all pending single results, one blob for each topology and
+        kind of result."""
+        pending = self.pending
+        self.pending = {}
+
+        for (topology, kind), results in pending.items():
+            self.put_many(topology, kind, list(results.keys()),
+                          np.stack(list(results.values())))
+
+    def clear(self):
+        """Removes all stored and pending results, including partly written
+        blobs, and resets the counters."""
+        self.pending = {}
+
+        with self.connection:
+            self.connection.execute('DELETE FROM results')
+
+        for name in os.listdir(self.path):
+            if name.endswith('.npy') or name.endswith('.npy.tmp'):
+                os.remove(os.path.join(self.path, name))
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def close(self):
+        """Writes pending results and closes the index of the store."""
+        self.flush()
+        self.connection.close()
+        atexit.unregister(self.flush)
@@ -0,0 +1,204 @@
+"""The tmm module holds a vectorised transfer matrix method for calculating
+the stack matrices of multilayers, used by :py:class:`strapy.components.Stack`.
+
+Stack matrices are calculated with NumPy for any number of wavelengths,
+thicknesses and angles of incidence at once, broadcast against each other,
+so that thin film and etalon sweeps need no per-point calls. Matrices follow
+the convention of `pyctmm.get_matrix()`: the P polarised transfer matrix in
+the upper left 2x2 block and the S polarised transfer matrix in the lower
+right block, with propagation through every layer, including the incident
+and exit media, and complex refractive indices n + ik as passed to
+`pyctmm.set_ind()`.
+"""
+
+
+import numpy as np
+
+
+def _cosines(indices, incident, theta):
+    """Returns the cosine of the propagation angle in each layer, from
+    Snell's law. Signed zeros are cleared so that evanescent layers take the
+    principal branch."""
+
+    arg = 1 - (incident * np.sin(theta) / indices)**2
+    arg.imag += 0.0
+
+    return np.sqrt(arg)
+
+
+def _chain(matrices, indices, thicknesses, cos, wavelengths):
+    """Right multiplies P and S transfer matrices, with shape (2, ..., 2, 2),
+    by the interface and propagation matrices of each layer after the first
+    along the last axis of `indices`."""
+
+    # phase thickness of each layer.
+    delta = 2 * np.pi * indices * thicknesses * cos / wavelengths
+    forward = np.exp(-1j * delta)
+    backward = np.exp(1j * delta)
+
+    # interface matrices [[1, r], [r, 1]] / t for P and S polarised light.
+    ni = indices[..., :-1]
+    nj = indices[..., 1:]
+    ci = cos[..., :-1]
+    cj = cos[..., 1:]
+
+    pDenominator = nj * ci + ni * cj
+    sDenominator = ni * ci + nj * cj
+    r = np.stack(((nj * ci - ni * cj) / pDenominator,
+                  (ni * ci - nj * cj) / sDenominator))
+    t = np.stack((2 * ni * ci / pDenominator, 2 * ni * ci / sDenominator))
+
+    for layer in range(1, indices.shape[-1]):
+        a = matrices[..., 0]
+        b = matrices[..., 1]
+        rl = r[..., layer - 1, np.newaxis]
+        tl = t[..., layer - 1, np.newaxis]
+
+        matrices = np.stack(
+            ((a + b * rl) / tl * forward[..., layer, np.newaxis],
+             (a * rl + b) / tl * backward[..., layer, np.newaxis]),
+            axis=-1)
+
+    return matrices
+
+
+def _stack_result(matrices):
+    """Returns P and S transfer matrices as 4x4 stack matrices."""
+
+    result = np.zeros(matrices.shape[1:-2] + (4, 4), dtype=complex)
+    result[..., :2, :2] = matrices[0]
+    result[..., 2:, 2:] = matrices[1]
+
+    return result
+
+
+def stack_matrices(indices, thicknesses, wavelengths, theta=0):
+    """Returns the stack matrices of a multilayer.
+
+    All arguments are broadcast against each other, with layers along the
+    last axis of `indices` and `thicknesses`.
+
+    Parameters
+    ----------
+    indices : array_like
+            Complex refractive index of each layer, including the
+            semi-infinite incident and exit media, with shape (..., L).
+    thicknesses : array_like
+            Physical thickness of each layer in metres, with shape (..., L).
+    wavelengths : array_like
+            Vacuum wavelengths in metres.
+    theta : array_like
+            Angle of incidence in the first layer, in radians.
+
+    Returns
+    -------
+    matrices : ndarray
+            Stack matrices, with shape (..., 4, 4).
+    """
+
+    indices = np.asarray(indices, dtype=complex)
+    thicknesses = np.asarray(thicknesses, dtype=float)
+    wavelengths = np.asarray(wavelengths, dtype=float)[..., np.newaxis]
+    theta = np.asarray(theta, dtype=float)[..., np.newaxis]
+
+    shape = np.broadcast_shapes(indices.shape, thicknesses.shape,
+                                wavelengths.shape, theta.shape)
+    indices = np.broadcast_to(indices, shape)
+    thicknesses = np.broadcast_to(thicknesses, shape)
+
+    cos = _cosines(indices, indices[..., :1], theta)
+
+    # propagation through the first layer, then each following layer.
+    matrices = np.zeros((2,) + shape[:-1] + (2, 2), dtype=complex)
+    delta = 2 * np.pi * indices[..., 0] * thicknesses[..., 0] * cos[..., 0] \
+        / wavelengths[..., 0]
+    matrices[..., 0, 0] = np.exp(-1j * delta)
+    matrices[..., 1, 1] = np.exp(1j * delta)
+
+    return _stack_result(_chain(matrices, indices, thicknesses, cos,
+                                wavelengths))
+
+
+def periodic_matrices(incident, indices, thicknesses, repeats,
+                      exit_medium, wavelengths, theta=0):
+    """Returns the stack matrices of a periodic multilayer.
+
+    The multilayer is a unit cell of layers repeated `repeats` times between
+    semi-infinite incident and exit media, for example a Bragg mirror. The
+    transfer matrix of the unit cell is calculated once, and raised to the
+    number of repeats by binary exponentiation, so the cost grows with the
+    logarithm of the number of repeats rather than the number of layers.
+
+    All arguments are broadcast against each other, with layers along the
+    last axis of `indices` and `thicknesses`.
+
+    Parameters
+    ----------
+    incident : array_like
+            Complex refractive index of the incident medium.
+    indices : array_like
+            Complex refractive index of each layer of the unit cell, with
+            shape (..., L).
+    thicknesses : array_like
+            Physical thickness of each layer of the unit cell in metres, with
+            shape (..., L).
+    repeats : int
+            Number of repeats of the unit cell, at least 1.
+    exit_medium : array_like
+            Complex refractive index of the exit medium.
+    wavelengths : array_like
+            Vacuum wavelengths in metres.
+    theta : array_like
+            Angle of incidence in the incident medium, in radians.
+
+    Returns
+    -------
+    matrices : ndarray
+            Stack matrices, with shape (..., 4, 4), equal to those of
+            `stack_matrices()` for the expanded multilayer.
+    """
+
+    if int(repeats) != repeats or repeats < 1:
+        raise Exception('Periodic multilayer must have at least one repeat.')
+
+    incident = np.asarray(incident, dtype=complex)[..., np.newaxis]
+    exit_medium = np.asarray(exit_medium, dtype=complex)[..., np.newaxis]
+    indices = np.asarray(indices, dtype=complex)
+    thicknesses = np.asarray(thicknesses, dtype=float)
+    wavelengths = np.asarray(wavelengths, dtype=float)[..., np.newaxis]
+    theta = np.asarray(theta, dtype=float)[..., np.newaxis]
+
+    shape = np.broadcast_shapes(indices.shape, thicknesses.shape,
+                                incident.shape, exit_medium.shape,
+                                wavelengths.shape, theta.shape)
+    indices = np.broadcast_to(indices, shape)
+    thicknesses = np.broadcast_to(thicknesses, shape)
+    incident = np.broadcast_to(incident, shape[:-1] + (1,))
+    exit_medium = np.broadcast_to(exit_medium, shape[:-1] + (1,))
+
+    # layers of the incident medium and first cell, the interface between
+    # cells followed by a cell, and the interface into the exit medium.
+    headIndices = np.concatenate((incident, indices), axis=-1)
+    cellIndices = np.concatenate((indices[..., -1:], indices), axis=-1)
+    tailIndices = np.concatenate((indices[..., -1:], exit_medium), axis=-1)
+
+    headThicknesses = np.concatenate((np.zeros(shape[:-1] + (1,)),
+                                      thicknesses), axis=-1)
+    cellThicknesses = np.concatenate((thicknesses[..., -1:], thicknesses),
+                                     axis=-1)
+    tailThicknesses = np.concatenate((thicknesses[..., -1:],
+                                      np.zeros(shape[:-1] + (1,))), axis=-1)
+
+    identity = np.zeros((2,) + shape[:-1] + (2, 2), dtype=complex)
+    identity[..., 0, 0] = 1
+    identity[..., 1, 1] = 1
+
+    head = _chain(identity, headIndices, headThicknesses,
+                  _cosines(headIndices, incident, theta), wavelengths)
+    cell = _chain(identity, cellIndices, cellThicknesses,
+                  _cosines(cellIndices, incident, theta), wavelengths)
+    tail = _chain(identity, tailIndices, tailThicknesses,
+                  _cosines(tailIndices, incident, theta), wavelengths)
+
+    return _stack_result(
+        head @ np.linalg.matrix_power(cell, int(repeats) - 1) @ tail)
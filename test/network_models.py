@@ -0,0 +1,156 @@
+"""Model factories shared by the tests."""
+
+import strapy as ts
+import numpy as np
+import sympy as sp
+
+
+class CoupledMirror(ts.components.Mirror):
+    """Mirror with a P reflectivity of rP * rS, giving a matrix element with
+    more than one symbol."""
+
+    def initEquation(self, nodes):
+        ts.components.Mirror.initEquation(self, nodes)
+
+        rP = sp.symbols(self.name + '_rP')
+        rS = sp.symbols(self.name + '_rS')
+
+        self.equation = sp.Eq(
+            sp.Matrix([-rP * rS * nodes[self.nodes[0]].symbols[2],
+                       -rS * nodes[self.nodes[0]].symbols[3]]),
+            self.equation.rhs)
+
+
+def cavity_model(properties=('amplitude', 'intensity')):
+    """Returns a built model of a lossy cavity between two partially
+    transmitting beam splitters, with detectors on both outputs logging
+    `properties`."""
+
+    model = ts.Model()
+    model.wavelength = 633e-9
+
+    model.add_component(ts.components.Source, 'laser', 'n0')
+    model.add_component(ts.components.BeamSplitter, 'bs1',
+                        ('n1', 'n2', 'n3', 'n4'))
+    model.add_component(ts.components.BeamSplitter, 'bs2',
+                        ('n5', 'n6', 'n7', 'n8'))
+    model.add_component(ts.components.Dump, 'd1', 'n9')
+    model.add_component(ts.components.Dump, 'd2', 'n10')
+    model.add_component(ts.components.Dump, 'd3', 'n11')
+    model.add_component(ts.components.Dump, 'd4', 'n12')
+    model.add_component(ts.components.Dump, 'd5', 'n13')
+
+    model.add_component(ts.components.Stack, 'sIn', ('n0', 'n1'))
+    model.add_component(ts.components.Stack, 'sCav', ('n3', 'n5'))
+    model.add_component(ts.components.Stack, 's2', ('n2', 'n9'))
+    model.add_component(ts.components.Stack, 's4', ('n4', 'n10'))
+    model.add_component(ts.components.Stack, 's6', ('n6', 'n11'))
+    model.add_component(ts.components.Stack, 's7', ('n7', 'n12'))
+    model.add_component(ts.components.Stack, 's8', ('n8', 'n13'))
+
+    model.add_detector('refl', 'n9', properties)
+    model.add_detector('trans', 'n12', properties)
+
+    model.components['laser'].amplitude[0] = 1
+    model.components['laser'].amplitude[1] = 1
+
+    for name in ('bs1', 'bs2'):
+        model.components[name].rP = np.sqrt(0.9)
+        model.components[name].rS = np.sqrt(0.8)
+        model.components[name].tP = np.sqrt(0.1)
+        model.components[name].tS = np.sqrt(0.2)
+
+    model.components['sCav'].set_length(0.1, loss=0.01)
+
+    model.build()
+
+    return model
+
+
+def stack_model():
+    """Returns a built source, stack and dump model with a detector at the
+    stack output."""
+
+    model = ts.Model()
+    model.wavelength = 633e-9
+
+    model.add_component(ts.components.Source, 'laser', 'n0')
+    model.add_component(ts.components.Dump, 'dump', 'n1')
+
+    model.add_component(ts.components.Stack, 'stack', ('n0', 'n1'))
+
+    model.add_detector('out', 'n1', ('amplitude', 'intensity'))
+
+    model.components['laser'].amplitude[0] = 1
+    model.components['laser'].amplitude[1] = 1
+
+    model.build()
+
+    return model
+
+
+def ring_model(reflectivity=0.95):
+    """Returns a built model of a ring cavity closed by two beam splitters
+    of intensity reflectivity `reflectivity`, with detectors on the
+    reflected and transmitted outputs."""
+
+    model = ts.Model()
+    model.wavelength = 633e-9
+
+    model.add_component(ts.components.Source, 'laser', 'n0')
+    model.add_component(ts.components.BeamSplitter, 'bs1',
+                        ('n1', 'n2', 'n3', 'n4'))
+    model.add_component(ts.components.BeamSplitter, 'bs2',
+                        ('n5', 'n6', 'n7', 'n8'))
+    model.add_component(ts.components.Dump, 'd1', 'n9')
+    model.add_component(ts.components.Dump, 'd2', 'n10')
+    model.add_component(ts.components.Dump, 'd3', 'n11')
+
+    model.add_component(ts.components.Stack, 'sIn', ('n0', 'n1'))
+    model.add_component(ts.components.Stack, 'sCav', ('n3', 'n5'))
+    model.add_component(ts.components.Stack, 'sRet', ('n6', 'n4'))
+    model.add_component(ts.components.Stack, 's2', ('n2', 'n9'))
+    model.add_component(ts.components.Stack, 's7', ('n7', 'n10'))
+    model.add_component(ts.components.Stack, 's8', ('n8', 'n11'))
+
+    model.add_detector('refl', 'n9', ('amplitude', 'intensity'))
+    model.add_detector('trans', 'n10', ('amplitude', 'intensity'))
+
+    for name in ('bs1', 'bs2'):
+        model.components[name].rP = np.sqrt(reflectivity)
+        model.components[name].rS = np.sqrt(reflectivity)
+        model.components[name].tP = np.sqrt(1 - reflectivity)
+        model.components[name].tS = np.sqrt(1 - reflectivity)
+
+    model.build()
+
+    return model
+
+
+def stray_model():
+    """Returns a built model as `cavity_model()`, with a stray light source
+    in place of the dump at n13 and the phase also detected at the
+    transmitted output."""
+
+    model = ts.Model()
+    for name, component in cavity_model().components.items():
+        if name != 'd5':
+            model.add_component(type(component), name, component.nodes)
+    model.add_component(ts.components.Source, 'stray', 'n13')
+
+    model.add_detector('refl', 'n9', ('amplitude', 'intensity'))
+    model.add_detector('trans', 'n12', ('amplitude', 'intensity', 'phase'))
+
+    for name in ('bs1', 'bs2'):
+        model.components[name].rP = np.sqrt(0.9)
+        model.components[name].rS = np.sqrt(0.8)
+        model.components[name].tP = np.sqrt(0.1)
+        model.components[name].tS = np.sqrt(0.2)
+
+    model.components['sCav'].set_length(0.1, loss=0.01)
+    model.components['laser'].amplitude = [1, 1]
+    model.components['stray'].amplitude = [0.3, 0.2j]
+
+    model.build()
+
+    return model
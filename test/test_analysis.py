@@ -0,0 +1,88 @@
+import unittest
+import strapy as ts
+import numpy as np
+
+
+class TestAnalysis(unittest.TestCase):
+    def test_heydemann(self):
+        """Test that known ellipse parameters are recovered for a batch of
+        realisations, and that the corrected phase is linear.
+        """
+
+        rng = np.random.default_rng(0)
+        nRealisations = 1000
+
+        p = rng.uniform(-0.1, 0.1, (nRealisations, 1))
+        q = rng.uniform(-0.1, 0.1, (nRealisations, 1))
+        r = rng.uniform(0.8, 1.2, (nRealisations, 1))
+        alpha = rng.uniform(-0.1, 0.1, (nRealisations, 1))
+        R = rng.uniform(0.5, 2, (nRealisations, 1))
+
+        displacement = np.linspace(0, 2, 200)
+        phi = 4 * np.pi * displacement + 0.3
+
+        x = p + R * np.cos(phi)
+        y = q + (R / r) * np.sin(phi - alpha)
+
+        result = ts.analysis.heydemann(x, y, displacement)
+
+        self.assertEqual(result['phase'].shape, x.shape)
+        self.assertTrue(np.allclose(result['p'], p[:, 0]))
+        self.assertTrue(np.allclose(result['q'], q[:, 0]))
+        self.assertTrue(np.allclose(result['r'], r[:, 0]))
+        self.assertTrue(np.allclose(result['alpha'], alpha[:, 0]))
+        self.assertTrue(np.allclose(result['R'], R[:, 0]))
+        self.assertTrue(np.allclose(result['slope'], 4 * np.pi))
+        self.assertLess(np.max(np.abs(result['nonlinearity'])), 1e-9)
+
+    def test_heydemann_uncorrected(self):
+        """Test that an uncorrected quadrature error appears as periodic
+        nonlinearity, which is removed by the correction.
+        """
+
+        displacement = np.linspace(0, 1, 400, endpoint=False)
+        phi = 4 * np.pi * displacement
+
+        x = np.cos(phi)
+        y = np.sin(phi - 0.05)
+
+        raw = np.unwrap(np.arctan2(y, x))
+        rawResidual, _ = ts.analysis.linear_residual(raw, displacement)
+        result = ts.analysis.heydemann(x, y, displacement)
+
+        self.assertGreater(np.max(np.abs(rawResidual)), 1e-3)
+        self.assertLess(np.max(np.abs(result['nonlinearity'])), 1e-9)
+
+    def test_periodic_error(self):
+        """Test that first and second order periodic error amplitudes and
+        phases are recovered for a batch of model variants.
+        """
+
+        rng = np.random.default_rng(1)
+        nVariants = 500
+        fringes = 3
+
+        amplitudes = rng.uniform(0, 1e-9, (nVariants, 2))
+        phases = rng.uniform(-np.pi, np.pi, (nVariants, 2))
+
+        fringe = np.linspace(0, fringes, 300, endpoint=False)
+        residual = sum(
+            amplitudes[:, [k]] * np.cos(2 * np.pi * (k + 1) * fringe
+                                        + phases[:, [k]])
+            for k in range(2))
+
+        fitted, fittedPhases = ts.analysis.periodic_error(residual, fringes)
+
+        self.assertEqual(fitted.shape, (nVariants, 2))
+        self.assertTrue(np.allclose(fitted, amplitudes, rtol=0, atol=1e-15))
+        self.assertTrue(np.allclose(np.exp(1j * fittedPhases),
+                                    np.exp(1j * phases)))
+
+        with self.assertRaises(Exception):
+            ts.analysis.periodic_error(residual, 2.5)
+        with self.assertRaises(Exception):
+            ts.analysis.periodic_error(residual, fringes, orders=(50,))
+
+
+if __name__ == '__main__':
+    unittest.main()
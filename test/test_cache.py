@@ -0,0 +1,63 @@
+import unittest
+import strapy as ts
+import numpy as np
+
+
+class TestCache(unittest.TestCase):
+    def test_lru(self):
+        """Test that the least recently used entry is evicted, and that hits,
+        misses and evictions are counted.
+        """
+
+        cache = ts.cache.LRUCache(2)
+
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+
+        cache.put('c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions),
+                         (2, 1, 1))
+
+        cache.clear()
+
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions),
+                         (0, 0, 0))
+
+    def test_layer_cache(self):
+        """Test that repeated multilayer definitions reuse the cached stack
+        matrix, and that a changed wavelength does not.
+        """
+
+        ts.components.LAYER_CACHE.clear()
+
+        model = ts.Model()
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Dump, 'dump', 'n1')
+        model.add_component(ts.components.Stack, 'stack', ('n0', 'n1'))
+
+        stack = model.components['stack']
+
+        stack.set_layers((1, 1.5, 1), (0, 1e-6, 0))
+        matrix = stack.stack_matrix
+        stack.set_layers([1, 1.5, 1], np.array([0, 1e-6, 0]))
+
+        self.assertIs(stack.stack_matrix, matrix)
+        self.assertFalse(matrix.flags.writeable)
+        self.assertEqual(ts.components.LAYER_CACHE.hits, 1)
+        self.assertEqual(ts.components.LAYER_CACHE.misses, 1)
+
+        model.set_wavelength(1064e-9)
+
+        self.assertIsNot(stack.stack_matrix, matrix)
+        self.assertEqual(ts.components.LAYER_CACHE.misses, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
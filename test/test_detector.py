@@ -0,0 +1,127 @@
+import unittest
+import strapy as ts
+import numpy as np
+
+
+class TestDetector(unittest.TestCase):
+    def test_vectorised_readout(self):
+        """Test that detectors read out together by the model match detectors
+        read out individually, and that detected amplitudes are views into the
+        model readout.
+        """
+
+        model = ts.Model()
+        model.wavelength = 633e-9
+
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.BeamSplitter, 'bs',
+                            ('n1', 'n2', 'n3', 'n4'))
+        model.add_component(ts.components.Mirror, 'm1', 'n5')
+        model.add_component(ts.components.Dump, 'd2', 'n6')
+        model.add_component(ts.components.Dump, 'd3', 'n7')
+
+        model.add_component(ts.components.Stack, 'sIn', ('n0', 'n1'))
+        model.add_component(ts.components.Stack, 's1', ('n2', 'n5'))
+        model.add_component(ts.components.Stack, 's2', ('n3', 'n6'))
+        model.add_component(ts.components.Stack, 's3', ('n4', 'n7'))
+
+        for i in range(8):
+            model.add_detector('pd{}'.format(i), 'n{}'.format(i),
+                               ('amplitude', 'intensity', 'S intensity',
+                                'P intensity'))
+
+        model.components['laser'].amplitude = [0.6, 0.8j]
+        model.components['bs'].rP = np.sqrt(0.3)
+        model.components['bs'].tP = np.sqrt(0.7)
+
+        model.build()
+        model.components['s1'].set_length(0.2)
+        model.evaluate()
+
+        self.assertEqual(model.detectorReadout['amplitude'].shape, (8, 4))
+
+        for detector in model.detectors.values():
+            single = ts.Detector(detector.name, detector.node,
+                                 detector.properties)
+            single.node_index = detector.node_index
+            single.update(model.solution_vector)
+
+            self.assertTrue(np.allclose(detector.amplitudes,
+                                        single.amplitudes))
+            self.assertAlmostEqual(detector.intensity, single.intensity)
+            self.assertAlmostEqual(detector.S_intensity, single.S_intensity)
+            self.assertAlmostEqual(detector.P_intensity, single.P_intensity)
+            self.assertAlmostEqual(detector.intensity,
+                                   detector.S_intensity
+                                   + detector.P_intensity)
+            self.assertTrue(np.shares_memory(
+                detector.amplitudes, model.detectorReadout['amplitude']))
+
+    def test_stokes(self):
+        """Test the Stokes parameters of circularly and linearly polarised
+        light.
+        """
+
+        model = ts.Model()
+        model.wavelength = 633e-9
+
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Dump, 'dump', 'n1')
+
+        model.add_component(ts.components.Stack, 'stack', ('n0', 'n1'))
+
+        model.add_detector('out', 'n1', ('Stokes',))
+
+        model.components['laser'].amplitude = [1 / np.sqrt(2),
+                                               -1j / np.sqrt(2)]
+
+        model.build()
+        model.evaluate()
+
+        self.assertTrue(np.allclose(model.detectors['out'].stokes,
+                                    [[1, 0, 0, 1], [0, 0, 0, 0]]))
+
+        model.components['laser'].amplitude = [1 / np.sqrt(2),
+                                               1 / np.sqrt(2)]
+        model.updated.append('laser')
+        model.evaluate()
+
+        self.assertTrue(np.allclose(model.detectors['out'].stokes,
+                                    [[1, 0, 1, 0], [0, 0, 0, 0]]))
+
+    def test_directional_phase(self):
+        """Test directional intensities from a partially reflecting mirror,
+        and that phases are unwrapped along a batched sweep.
+        """
+
+        model = ts.Model()
+        model.wavelength = 633e-9
+
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Mirror, 'mirror', 'n1')
+
+        model.add_component(ts.components.Stack, 'stack', ('n0', 'n1'))
+
+        model.add_detector('out', 'n0', ('a intensity', 'b intensity',
+                                         'phase'))
+
+        model.components['laser'].amplitude = [0, 1]
+        model.components['mirror'].rS = np.sqrt(0.9)
+
+        model.build()
+        model.evaluate()
+
+        self.assertAlmostEqual(model.detectors['out'].a_intensity, 1)
+        self.assertAlmostEqual(model.detectors['out'].b_intensity, 0.9)
+
+        lengths = np.linspace(0, 2, 41)
+        results = model.sweep(
+            lambda x: model.components['stack'].set_length(x), lengths)
+        phase = results['out']['phase'][:, 3]
+
+        # double pass through the stack
+        self.assertTrue(np.allclose(phase - phase[0], 4 * np.pi * lengths))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,153 @@
+import unittest
+import strapy as ts
+import numpy as np
+from network_models import CoupledMirror
+
+
+def polarimeter_model(mirror=False):
+    """Returns a built model of a rotating waveplate followed by a second
+    waveplate and a polarising beam splitter, with intensity detectors on
+    both outputs of the beam splitter. If `mirror` is true, light leaving the
+    second output is reflected back by a mirror with a lambdified matrix
+    element."""
+
+    model = ts.Model()
+    model.wavelength = 633e-9
+
+    model.add_component(ts.components.Source, 'laser', 'n0')
+    model.add_component(ts.components.Waveplate, 'scan', ('n1', 'n2'))
+    model.add_component(ts.components.Waveplate, 'wp', ('n3', 'n4'))
+    model.add_component(ts.components.PolarisingBeamSplitter, 'pbs',
+                        ('n5', 'n6', 'n7', 'n8'))
+    model.add_component(ts.components.Dump, 'd1', 'n9')
+    if mirror:
+        model.add_component(CoupledMirror, 'mirror', 'n10')
+        model.components['mirror'].rP = 0.5
+        model.components['mirror'].rS = 0.4
+    else:
+        model.add_component(ts.components.Dump, 'd2', 'n10')
+    model.add_component(ts.components.Dump, 'd3', 'n11')
+
+    model.add_component(ts.components.Stack, 'sIn', ('n0', 'n1'))
+    model.add_component(ts.components.Stack, 's1', ('n2', 'n3'))
+    model.add_component(ts.components.Stack, 's2', ('n4', 'n5'))
+    model.add_component(ts.components.Stack, 's3', ('n6', 'n9'))
+    model.add_component(ts.components.Stack, 's4', ('n7', 'n10'))
+    model.add_component(ts.components.Stack, 's5', ('n8', 'n11'))
+
+    model.add_detector('pd1', 'n9', ('intensity', 'Stokes'))
+    model.add_detector('pd2', 'n10', ('intensity',))
+
+    model.components['laser'].amplitude = [0.3, 1]
+
+    model.components['scan'].retardance = np.pi / 2
+    model.components['scan'].update()
+
+    model.components['wp'].rotation = 0.2
+    model.components['wp'].retardance = 2.8
+    model.components['wp'].update()
+
+    model.components['pbs'].rExtinction = 0.01
+    model.components['pbs'].tExtinction = 0.02
+    model.components['pbs'].update()
+
+    model.build()
+
+    return model
+
+
+def scan_values(model, rotations):
+    """Returns the batched values of the scanned waveplate at each rotation."""
+
+    scan = model.components['scan']
+    values = []
+    for rotation in rotations:
+        scan.rotation = rotation
+        scan.update()
+        values.append(scan.setVals())
+
+    scan.rotation = 0
+    scan.update()
+
+    return {'scan': np.array(values)}
+
+
+class TestFitting(unittest.TestCase):
+    def test_jacobian(self):
+        """Test that the analytic Jacobian matches central differences of the
+        residuals, for analytic and differenced component derivatives.
+        """
+
+        model = polarimeter_model()
+        values = scan_values(model, np.linspace(0, np.pi, 50))
+        data = {('pd1', 'intensity'): np.zeros(50),
+                ('pd1', 'Stokes'): np.zeros((50, 2, 4)),
+                ('pd2', 'intensity'): np.zeros(50)}
+
+        fit = ts.fitting.Fit(
+            model, ['wp.rotation', 'wp.retardance', 'pbs.rExtinction',
+                    'pbs.theta0', 'laser.amplitude[0]'], values, data,
+            weights={('pd2', 'intensity'): np.linspace(1, 2, 50)})
+        parameters = fit.get_parameters()
+
+        jacobian = fit.jacobian(parameters)
+        difference = fit._difference_jacobian(parameters)
+
+        self.assertEqual(jacobian.shape, (50 * 10, 5))
+        self.assertTrue(np.allclose(jacobian, difference, atol=1e-6))
+        self.assertTrue(np.allclose(fit.get_parameters(), parameters))
+
+    def test_fused_jacobian(self):
+        """Test that the Jacobian is analytic for parameters of components
+        outside lambdified elements, and differenced for components inside
+        them.
+        """
+
+        model = polarimeter_model(mirror=True)
+        self.assertTrue(model.useLambdify)
+
+        values = scan_values(model, np.linspace(0, np.pi, 20))
+        data = {('pd1', 'intensity'): np.zeros(20),
+                ('pd2', 'intensity'): np.zeros(20)}
+
+        fit = ts.fitting.Fit(model, ['wp.rotation', 'pbs.rExtinction'],
+                             values, data)
+        parameters = fit.get_parameters()
+        jacobian = fit.jacobian(parameters)
+        difference = fit._difference_jacobian(parameters)
+        self.assertTrue(np.allclose(jacobian, difference, atol=1e-6))
+        self.assertFalse(np.array_equal(jacobian, difference))
+
+        fit = ts.fitting.Fit(model, ['wp.rotation', 'mirror.rS'], values,
+                             data)
+        parameters = fit.get_parameters()
+        self.assertTrue(np.array_equal(fit.jacobian(parameters),
+                                       fit._difference_jacobian(parameters)))
+
+    def test_fit(self):
+        """Test that waveplate and beam splitter parameters are recovered
+        from a synthetic sweep.
+        """
+
+        model = polarimeter_model()
+        values = scan_values(model, np.linspace(0, np.pi, 200))
+        results = model.evaluate_batch(values)
+        data = {('pd1', 'intensity'): results['pd1']['intensity'],
+                ('pd2', 'intensity'): results['pd2']['intensity']}
+
+        fit = ts.fitting.Fit(model, ['wp.rotation', 'wp.retardance',
+                                     'pbs.rExtinction'], values, data)
+        result = fit.fit([0.1, 3, 0.03], bounds=([-1, 0, 0], [1, 6, 0.5]))
+
+        self.assertTrue(np.allclose(result.x, [0.2, 2.8, 0.01], atol=1e-6))
+        self.assertAlmostEqual(model.components['wp'].rotation, result.x[0])
+
+        with self.assertRaises(Exception):
+            ts.fitting.Fit(model, ['scan.rotation'], values, data)
+        with self.assertRaises(Exception):
+            ts.fitting.Fit(model, ['wp.rotation'], values,
+                           {('pd1', 'amplitude'): np.zeros((200, 4))})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,132 @@
+import unittest
+import strapy as ts
+import numpy as np
+
+
+class TestMaterials(unittest.TestCase):
+    def test_indices(self):
+        """Test predefined materials against tabulated indices at 632.8 nm,
+        and that index tables are cached.
+        """
+
+        ts.materials.INDEX_CACHE.clear()
+
+        wavelengths = np.array([632.8e-9, 1064e-9])
+
+        self.assertAlmostEqual(ts.materials.BK7.index(632.8e-9).real, 1.5151,
+                               places=4)
+        self.assertAlmostEqual(
+            ts.materials.FUSED_SILICA.index(632.8e-9).real, 1.4570, places=4)
+        self.assertAlmostEqual(ts.materials.QUARTZ_O.index(632.8e-9).real,
+                               1.5426, places=4)
+        self.assertAlmostEqual(ts.materials.QUARTZ_E.index(632.8e-9).real,
+                               1.5517, places=4)
+
+        indices = ts.materials.BK7.index(wavelengths)
+
+        self.assertEqual(indices.shape, (2,))
+        self.assertLess(indices[1].real, indices[0].real)
+        self.assertIs(ts.materials.BK7.index(wavelengths.copy()), indices)
+        self.assertEqual(ts.materials.INDEX_CACHE.hits, 1)
+
+        cauchy = ts.materials.Cauchy((1.5, 0.004))
+        self.assertAlmostEqual(cauchy.index(1e-6), 1.504)
+        self.assertIsInstance(cauchy.index(1e-6), complex)
+        self.assertEqual(ts.materials.INDEX_CACHE.hits, 2)
+
+    def test_dispersive_components(self):
+        """Test that material stacks, multilayers and quartz waveplates give
+        the same spectral sweep as evaluating each wavelength in turn.
+        """
+
+        model = ts.Model()
+        model.wavelength = 633e-9
+
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Waveplate, 'wp', ('n2', 'n3'))
+        model.add_component(ts.components.Mirror, 'mirror', 'n5')
+
+        model.add_component(ts.components.Stack, 'etalon', ('n0', 'n1'))
+        model.add_component(ts.components.Stack, 'glass', ('n1', 'n2'))
+        model.add_component(ts.components.Stack, 's2', ('n3', 'n5'))
+
+        model.add_detector('out', 'n0', ('amplitude', 'intensity'))
+
+        model.components['laser'].amplitude[0] = 1
+        model.components['mirror'].rP = 0.5
+        model.components['mirror'].rS = 0.5
+
+        waveplate = model.components['wp']
+        waveplate.rotation = np.pi / 8
+        waveplate.set_materials(ts.materials.QUARTZ_E, ts.materials.QUARTZ_O,
+                                1e-3)
+
+        model.build()
+
+        model.components['etalon'].set_layers(
+            (1, ts.materials.FUSED_SILICA, 1), (0, 1e-5, 0))
+        model.components['glass'].set_material(ts.materials.BK7, 5e-3)
+        model.components['s2'].set_length(0.1)
+
+        self.assertAlmostEqual(
+            waveplate.retardance,
+            2 * np.pi * 1e-3 * (1.551650798448974 - 1.542605901383042)
+            / 633e-9, places=2)
+
+        with self.assertRaises(Exception):
+            waveplate.set_materials(ts.materials.QUARTZ_E, None, 1e-3)
+
+        plate = ts.components.Waveplate('plate', ('n6', 'n7'), model)
+        plate.slow_material = ts.materials.QUARTZ_E
+        with self.assertRaises(Exception):
+            plate.update()
+
+        wavelengths = np.linspace(630e-9, 636e-9, 25)
+        results = model.spectral_sweep(wavelengths)
+
+        for i, wavelength in enumerate(wavelengths):
+            model.set_wavelength(wavelength)
+            model.evaluate()
+
+            self.assertAlmostEqual(results['out']['intensity'][i],
+                                   model.detectors['out'].intensity)
+            self.assertTrue(np.allclose(results['out']['amplitude'][i],
+                                        model.detectors['out'].amplitudes))
+
+    def test_material_to_layers(self):
+        """Test that a material stack switched to a multilayer is swept and
+        re-evaluated as the multilayer, not the earlier material slab.
+        """
+
+        model = ts.Model()
+        model.wavelength = 633e-9
+
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Dump, 'dump', 'n1')
+        model.add_component(ts.components.Stack, 'stack', ('n0', 'n1'))
+        model.add_detector('out', 'n1', ('amplitude', 'intensity'))
+
+        model.components['laser'].amplitude[0] = 1
+
+        model.build()
+
+        stack = model.components['stack']
+        stack.set_material(ts.materials.BK7, 1e-3)
+        stack.set_layers((1, 1.5, 1), (0, 100e-9, 0))
+
+        self.assertIsNone(stack.material)
+        self.assertIsNone(stack.thickness)
+
+        results = model.spectral_sweep([model.wavelength])
+        model.evaluate()
+        self.assertTrue(np.allclose(results['out']['amplitude'][0],
+                                    model.detectors['out'].amplitudes))
+
+        model.set_wavelength(model.wavelength)
+        model.evaluate()
+        self.assertTrue(np.allclose(results['out']['amplitude'][0],
+                                    model.detectors['out'].amplitudes))
+
+
+if __name__ == '__main__':
+    unittest.main()
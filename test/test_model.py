@@ -0,0 +1,680 @@
+import unittest
+import strapy as ts
+import numpy as np
+from network_models import CoupledMirror, cavity_model, stack_model, \
+    ring_model, stray_model
+
+
+class TestModel(unittest.TestCase):
+    def test_unchanged_evaluate(self):
+        """Test that re-evaluating an unchanged model reuses the previous
+        solution, and that changed values are still picked up.
+        """
+
+        model = stack_model()
+
+        model.components['stack'].set_length(0.25)
+        model.evaluate()
+        solution = model.solution_vector
+
+        model.components['stack'].set_length(0.25)
+        model.evaluate()
+
+        self.assertIs(model.solution_vector, solution)
+
+        model.components['stack'].set_length(0.5)
+        model.evaluate()
+
+        self.assertIsNot(model.solution_vector, solution)
+        self.assertAlmostEqual(model.detectors['out'].amplitudes[0], -1)
+        self.assertAlmostEqual(model.detectors['out'].amplitudes[1], -1)
+
+    def test_partial_stamp(self):
+        """Test that a component update changing only some of its values
+        gives the same matrix as a freshly built model.
+        """
+
+        model = stack_model()
+        model.evaluate()
+
+        model.components['stack'].set_length(0.1, loss=0.2)
+        model.evaluate()
+
+        reference = stack_model()
+        reference.components['stack'].set_length(0.1, loss=0.2)
+        reference.evaluate()
+
+        self.assertTrue(np.allclose(model.matrix, reference.matrix))
+        self.assertAlmostEqual(model.detectors['out'].intensity,
+                               reference.detectors['out'].intensity)
+
+    def test_fused_elements(self):
+        """Test that matrix elements with more than one symbol are evaluated
+        by the lambdify fallback, alongside directly stamped elements.
+        """
+
+        model = ts.Model()
+        model.wavelength = 633e-9
+
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(CoupledMirror, 'mirror', 'n1')
+
+        model.add_component(ts.components.Stack, 'stack', ('n0', 'n1'))
+
+        model.add_detector('out', 'n0', ('amplitude',))
+
+        model.components['laser'].amplitude[0] = 1
+        model.components['laser'].amplitude[1] = 1
+
+        model.components['mirror'].rP = 0.5
+        model.components['mirror'].rS = 0.8
+
+        model.build()
+        model.evaluate()
+
+        self.assertTrue(model.useLambdify)
+        self.assertEqual(len(model.fusedMatrixRows), 1)
+        self.assertAlmostEqual(model.detectors['out'].amplitudes[2], -0.4)
+        self.assertAlmostEqual(model.detectors['out'].amplitudes[3], -0.8)
+
+        model.components['mirror'].rS = 1
+        model.updated.append('mirror')
+        model.evaluate()
+
+        self.assertAlmostEqual(model.detectors['out'].amplitudes[2], -0.5)
+        self.assertAlmostEqual(model.detectors['out'].amplitudes[3], -1)
+
+    def test_sweep(self):
+        """Test that a batched sweep gives the same detected values as
+        evaluating each point in turn, for both low rank and full batched
+        solves, and leaves the model state consistent.
+        """
+
+        lengths = np.linspace(0, 1, 17)
+
+        for model in (stack_model(), cavity_model()):
+            detector = list(model.detectors.keys())[-1]
+            stack = 'stack' if 'stack' in model.components else 'sCav'
+
+            results = model.sweep(
+                lambda x: model.components[stack].set_length(x, loss=0.1),
+                lengths)
+
+            for i, length in enumerate(lengths):
+                model.components[stack].set_length(length, loss=0.1)
+                model.evaluate()
+
+                self.assertAlmostEqual(results[detector]['intensity'][i],
+                                       model.detectors[detector].intensity)
+                self.assertTrue(np.allclose(
+                    results[detector]['amplitude'][i],
+                    model.detectors[detector].amplitudes))
+
+    def test_adaptive_sweep(self):
+        """Test that an adaptive sweep of a cavity resolves its resonance to
+        the target tolerance with fewer points than a uniform sweep, which
+        misses it.
+        """
+
+        model = ring_model()
+        stack = model.components['sCav']
+
+        points, results = model.adaptive_sweep(
+            lambda x: stack.set_length(x), 0, 1, tolerance=1e-3)
+
+        dense = np.linspace(0, 1, 20001)
+        reference = model.sweep(lambda x: stack.set_length(x), dense)
+        uniform = np.linspace(0, 1, len(points))
+        uniformResults = model.sweep(lambda x: stack.set_length(x), uniform)
+
+        self.assertTrue(np.all(np.diff(points) > 0))
+        self.assertLess(len(points), 200)
+        self.assertLess(np.min(np.diff(points)), np.max(np.diff(points)) / 8)
+
+        for detector in ('refl', 'trans'):
+            expected = reference[detector]['intensity']
+            scale = np.ptp(expected)
+            adaptiveError = np.max(np.abs(np.interp(
+                dense, points, results[detector]['intensity']) - expected))
+            uniformError = np.max(np.abs(np.interp(
+                dense, uniform, uniformResults[detector]['intensity'])
+                - expected))
+
+            self.assertLess(adaptiveError, 2e-3 * scale)
+            self.assertGreater(uniformError, 10 * adaptiveError)
+
+        with self.assertRaises(Exception):
+            model.adaptive_sweep(lambda x: stack.set_length(x), 0, 1,
+                                 prop='Stokes')
+        with self.assertRaises(Exception):
+            model.adaptive_sweep(lambda x: stack.set_length(x), 0.5, 0.5)
+
+        # running out of points before reaching the tolerance is warned of.
+        with self.assertWarns(UserWarning):
+            points, results = model.adaptive_sweep(
+                lambda x: stack.set_length(x), 0, 1, tolerance=1e-3,
+                max_points=40)
+        self.assertEqual(len(points), 40)
+
+    def test_resonances(self):
+        """Test that the resonances of ring and linear cavities are found at
+        the transmission peaks of a dense sweep, with the sweep's linewidth,
+        and free spectral ranges of one and half a wavelength.
+        """
+
+        model = ring_model()
+        stack = model.components['sCav']
+        stack.set_length(0.3)
+        resonances = model.resonances('sCav')
+
+        lengths = np.linspace(0.3, 1.3, 20001)
+        intensity = model.evaluate_batch(
+            {'sCav': stack.length_values(lengths)})['trans']['intensity']
+        peak = lengths[intensity >= np.max(intensity) / 2]
+
+        # two polarisations and two directions of circulation.
+        self.assertEqual(len(resonances['pole']), 4)
+        self.assertTrue(np.allclose(resonances['offset'],
+                                    lengths[np.argmax(intensity)] - 0.3))
+        self.assertTrue(np.allclose(resonances['linewidth'],
+                                    peak[-1] - peak[0], atol=1e-4))
+        self.assertTrue(np.allclose(np.abs(resonances['pole']), 1 / 0.95))
+        self.assertTrue(np.allclose(resonances['fsr'], 1))
+        self.assertTrue(np.allclose(resonances['finesse'],
+                                    1 / resonances['linewidth']))
+
+        # linear cavity, in which P polarised light resonates a quarter
+        # wavelength from S polarised light.
+        model = ts.Model()
+        model.wavelength = 633e-9
+
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Mirror, 'mirror', 'n2')
+        model.add_component(ts.components.Stack, 'coupler', ('n0', 'n1'))
+        model.add_component(ts.components.Stack, 'cavity', ('n1', 'n2'))
+        model.add_detector('inside', 'n1', ('amplitude', 'S intensity'))
+
+        model.components['mirror'].rP = 0.99
+        model.components['mirror'].rS = 0.99
+        model.components['coupler'].set_layers([1, 4, 1],
+                                               [0, 633e-9 / 16, 0])
+        model.build()
+
+        resonances = model.resonances('cavity')
+        stack = model.components['cavity']
+        intensity = model.evaluate_batch(
+            {'cavity': stack.length_values(resonances['offset'])}
+        )['inside']['S intensity']
+
+        self.assertTrue(np.allclose(resonances['offset'],
+                                    [0, 0.25, 0.5, 0.75]))
+        self.assertTrue(np.allclose(resonances['fsr'], 0.5))
+        self.assertTrue(np.all(intensity[[0, 2]] > 100 * intensity[[1, 3]]))
+
+        # a low finesse linear cavity, whose peaks are much wider than those
+        # of a single pass through the stack.
+        model.components['mirror'].rP = 0.6
+        model.components['mirror'].rS = 0.6
+        model.updated.append('mirror')
+        resonances = model.resonances('cavity')
+
+        offsets = np.linspace(-0.25, 0.25, 20001)
+        intensity = model.evaluate_batch(
+            {'cavity': stack.length_values(offsets)})['inside']['S intensity']
+        peak = offsets[intensity >= np.max(intensity) / 2]
+
+        self.assertTrue(np.allclose(resonances['linewidth'],
+                                    peak[-1] - peak[0], atol=1e-4))
+        self.assertTrue(np.allclose(resonances['finesse'],
+                                    0.5 / resonances['linewidth']))
+
+        with self.assertRaises(Exception):
+            model.resonances('mirror')
+
+    def test_simulate_trajectory(self):
+        """Test that a chunked trajectory from a generator matches a single
+        batched sweep, reuses one network solve, and has continuous phase.
+        """
+
+        model = cavity_model(('amplitude', 'intensity', 'phase'))
+
+        lengths = 0.1 + 1e-3 * np.arange(1000)
+        results = model.sweep(
+            lambda x: model.components['sCav'].set_length(x, loss=0.01),
+            lengths)
+
+        chunks = list(model.simulate_trajectory(
+            'sCav', (length for length in lengths), chunk=128, loss=0.01))
+
+        self.assertEqual(len(chunks), 8)
+        self.assertIsNotNone(model.batchResponse)
+
+        for prop in ('intensity', 'phase'):
+            trajectory = np.concatenate(
+                [chunk['trans'][prop] for chunk in chunks])
+            self.assertTrue(np.allclose(trajectory, results['trans'][prop]))
+
+        response = model.batchResponse
+        next(model.simulate_trajectory('sCav', lengths, chunk=10, loss=0.01))
+        self.assertIs(model.batchResponse, response)
+
+    def test_frequency_sweep(self):
+        """Test that a batched source frequency sweep matches evaluating the
+        model at each wavelength, with only path length stacks following the
+        frequency.
+        """
+
+        model = cavity_model(('amplitude', 'intensity', 'phase'))
+        model.components['sCav'].set_path_length(0.05, loss=0.01)
+        model.components['s7'].set_path_length(0.2)
+        model.components['sIn'].set_length(0.3)
+
+        frequency = ts.components.SPEED_OF_LIGHT / 633e-9
+        frequencies = frequency + 2e9 * np.sin(np.linspace(0, 2 * np.pi, 50))
+
+        results = model.frequency_sweep(frequencies, chunk=16)
+
+        for i, frequency in enumerate(frequencies):
+            model.set_wavelength(ts.components.SPEED_OF_LIGHT / frequency)
+            model.evaluate()
+
+            self.assertAlmostEqual(results['trans']['intensity'][i],
+                                   model.detectors['trans'].intensity)
+            self.assertTrue(np.allclose(results['refl']['amplitude'][i],
+                                        model.detectors['refl'].amplitudes))
+
+        self.assertEqual(model.components['sIn'].path_length, None)
+        self.assertLess(np.max(np.abs(np.diff(results['trans']['phase'],
+                                              axis=0))), np.pi)
+
+        chunks = list(model.frequency_trajectory(
+            (frequency for frequency in frequencies), chunk=16))
+
+        self.assertEqual([len(c['trans']['intensity']) for c in chunks],
+                         [16, 16, 16, 2])
+        self.assertTrue(np.allclose(
+            np.concatenate([c['trans']['phase'] for c in chunks]),
+            results['trans']['phase']))
+
+    def test_spectral_sweep(self):
+        """Test that a batched spectral sweep matches evaluating the model at
+        each wavelength, for path length and multilayer stacks and a
+        waveplate with physical retardance.
+        """
+
+        model = ts.Model()
+        model.wavelength = 633e-9
+
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Waveplate, 'wp', ('n2', 'n3'))
+        model.add_component(ts.components.Mirror, 'mirror', 'n5')
+
+        model.add_component(ts.components.Stack, 'etalon', ('n0', 'n1'))
+        model.add_component(ts.components.Stack, 's1', ('n1', 'n2'))
+        model.add_component(ts.components.Stack, 's2', ('n3', 'n5'))
+
+        model.add_detector('out', 'n0', ('amplitude', 'intensity'))
+
+        model.components['laser'].amplitude[0] = 1
+        model.components['mirror'].rP = 0.5
+        model.components['mirror'].rS = 0.5
+
+        model.components['wp'].path_difference = 633e-9 / 4
+        model.components['wp'].rotation = np.pi / 8
+        model.components['wp'].update()
+
+        model.build()
+
+        model.components['etalon'].set_layers((1, 1.5 + 1e-4j, 1),
+                                              (0, 1e-5, 0))
+        model.components['s1'].set_path_length(0.01)
+        model.components['s2'].set_length(0.1)
+
+        wavelengths = np.linspace(630e-9, 636e-9, 40)
+        results = model.spectral_sweep(wavelengths)
+
+        for i, wavelength in enumerate(wavelengths):
+            model.set_wavelength(wavelength)
+            model.evaluate()
+
+            self.assertAlmostEqual(results['out']['intensity'][i],
+                                   model.detectors['out'].intensity)
+            self.assertTrue(np.allclose(results['out']['amplitude'][i],
+                                        model.detectors['out'].amplitudes))
+
+        self.assertGreater(np.ptp(results['out']['intensity']), 0.01)
+
+    def test_evaluate_broadband(self):
+        """Test that broadband evaluation matches a finely sampled incoherent
+        sum over the line shape, and that the number of quadrature nodes
+        grows with the optical path difference.
+        """
+
+        model = stack_model()
+        model.components['stack'].set_layers((1, 1.5, 1), (0, 1e-3, 0))
+        laser = model.components['laser']
+
+        # a monochromatic source matches a single evaluation.
+        model.evaluate()
+        self.assertAlmostEqual(model.evaluate_broadband()['out']['intensity'],
+                               model.detectors['out'].intensity)
+
+        centre = ts.components.SPEED_OF_LIGHT / model.wavelength
+        halfWidth = ts.components.SPEED_OF_LIGHT * 0.1e-9 \
+            / model.wavelength**2 / 2
+        frequencies = centre + np.linspace(-8, 8, 20001) * halfWidth
+        density = np.exp(-np.log(2) * ((frequencies - centre) / halfWidth)**2)
+        results = model.spectral_sweep(
+            ts.components.SPEED_OF_LIGHT / frequencies)
+        expected = np.sum(density * results['out']['intensity']) \
+            / np.sum(density)
+
+        laser.set_line_shape('gaussian', 0.1e-9)
+        broadband = model.evaluate_broadband()['out']
+        self.assertAlmostEqual(broadband['intensity'], expected, places=6)
+        self.assertNotIn('amplitude', broadband)
+
+        # the same line shape tabulated as power per unit wavelength.
+        wavelengths = ts.components.SPEED_OF_LIGHT / frequencies[::10]
+        laser.set_line_shape('table', wavelengths=wavelengths,
+                             density=density[::10] / wavelengths**2)
+        self.assertAlmostEqual(model.evaluate_broadband()['out']['intensity'],
+                               expected, places=5)
+
+        laser.set_line_shape('lorentzian', 0.1e-9)
+        short, _ = laser.quadrature(model.max_path_difference())
+        model.components['stack'].set_layers((1, 1.5, 1), (0, 1e-2, 0))
+        long, _ = laser.quadrature(model.max_path_difference())
+        self.assertGreater(len(long), len(short))
+
+        model = ts.Model()
+        model.add_component(ts.components.Source, 'laser1', 'n0')
+        model.add_component(ts.components.Source, 'laser2', 'n1')
+        model.add_component(ts.components.Stack, 'stack', ('n0', 'n1'))
+        model.add_detector('out', 'n1', ('intensity',))
+        model.build()
+
+        model.components['laser1'].set_line_shape('gaussian', 0.1e-9)
+        with self.assertRaises(Exception):
+            model.evaluate_broadband()
+
+    def test_coherence_groups(self):
+        """Test that sources in different coherence groups add in power, with
+        amplitudes matching each source alone, for single, low rank batched
+        and dense batched evaluations, from a single solve.
+        """
+
+        def alone(on, off):
+            """Returns trans amplitudes with only source `on` emitting."""
+            saved = model.components[off].amplitude
+            model.components[off].amplitude = [0, 0]
+            model.updated.extend((on, off))
+            model.evaluate()
+            model.components[off].amplitude = saved
+            model.updated.append(off)
+            return model.detectors['trans'].amplitudes.copy()
+
+        model = stray_model()
+        model.evaluate()
+        coherent = model.detectors['trans'].intensity
+        laser = alone('laser', 'stray')
+        stray = alone('stray', 'laser')
+
+        model.components['stray'].set_coherence_group('stray')
+        self.assertEqual(model.coherenceGroups, [0, 'stray'])
+
+        solves = model.solver.solves
+        model.evaluate()
+        self.assertEqual(model.solver.solves, solves + 1)
+
+        trans = model.detectors['trans']
+        self.assertTrue(np.allclose(trans.amplitudes, (laser, stray)))
+        self.assertAlmostEqual(trans.intensity, np.sum(np.abs(laser)**2)
+                               + np.sum(np.abs(stray)**2))
+        self.assertGreater(abs(trans.intensity - coherent), 1e-3)
+        self.assertEqual(model.field_map('n12').shape, (2, 4))
+
+        lengths = np.linspace(0.1, 0.6, 7)
+        rP = np.linspace(0.5, 0.9, 7)
+        reduced = model.sweep(
+            lambda x: model.components['sCav'].set_length(x, loss=0.01),
+            lengths)
+
+        for i in range(len(lengths)):
+            model.components['sCav'].set_length(lengths[i], loss=0.01)
+            model.evaluate()
+            self.assertAlmostEqual(reduced['trans']['intensity'][i],
+                                   trans.intensity)
+            self.assertTrue(np.allclose(reduced['trans']['amplitude'][i],
+                                        trans.amplitudes))
+        self.assertEqual(reduced['trans']['phase'].shape, (7, 2, 4))
+
+        dense = model.sweep(
+            lambda x: (setattr(model.components['bs1'], 'rP', x),
+                       setattr(model.components['bs2'], 'rP', x),
+                       model.updated.extend(('bs1', 'bs2'))), rP)
+
+        for i in range(len(rP)):
+            model.components['bs1'].rP = rP[i]
+            model.components['bs2'].rP = rP[i]
+            model.updated.extend(('bs1', 'bs2'))
+            model.evaluate()
+            self.assertAlmostEqual(dense['trans']['intensity'][i],
+                                   model.detectors['trans'].intensity)
+
+    def test_heterodyne(self):
+        """Test that heterodyne beat signals match the fields of each source
+        evaluated alone, and that the beat phase follows the measurement arm
+        along a trajectory.
+        """
+
+        model = ts.Model()
+        model.add_component(ts.components.Source, 'f1', 'n0')
+        model.add_component(ts.components.Source, 'f2', 'n5')
+        model.add_component(ts.components.BeamSplitter, 'bs',
+                            ('n1', 'n2', 'n3', 'n4'))
+        model.add_component(ts.components.Dump, 'd1', 'n6')
+        model.add_component(ts.components.Dump, 'd2', 'n7')
+
+        model.add_component(ts.components.Stack, 'ref', ('n0', 'n1'))
+        model.add_component(ts.components.Stack, 'arm', ('n5', 'n4'))
+        model.add_component(ts.components.Stack, 's2', ('n2', 'n6'))
+        model.add_component(ts.components.Stack, 's3', ('n3', 'n7'))
+
+        model.add_detector('out', 'n6', ('amplitude', 'intensity'))
+
+        model.components['f1'].amplitude = [1, 0.5]
+        model.components['f2'].amplitude = [0.8j, 0.3]
+        model.components['f2'].set_frequency_offset(2e6)
+        for name in ('ref', 's2', 's3'):
+            model.components[name].set_path_length(0.5)
+        model.components['arm'].set_path_length(0.2)
+
+        model.build()
+
+        # fields of each source alone, at its own frequency.
+        fields = []
+        for on, off in (('f1', 'f2'), ('f2', 'f1')):
+            amplitude = model.components[off].amplitude
+            model.components[off].amplitude = [0, 0]
+            model.set_wavelength(ts.components.SPEED_OF_LIGHT / (
+                ts.components.SPEED_OF_LIGHT / 633e-9
+                + model.components[on].frequency_offset))
+            model.updated.extend((on, off))
+            model.evaluate()
+            fields.append(model.detectors['out'].amplitudes.copy())
+            model.components[off].amplitude = amplitude
+            model.updated.append(off)
+        model.set_wavelength(633e-9)
+
+        beat = 2 * np.sum(fields[0] * np.conj(fields[1]))
+        results = model.evaluate_heterodyne()['out']
+
+        self.assertAlmostEqual(results['beat amplitude'], abs(beat))
+        self.assertAlmostEqual(results['beat phase'], np.angle(beat))
+        self.assertAlmostEqual(results['intensity'],
+                               np.sum(np.abs(fields[0])**2)
+                               + np.sum(np.abs(fields[1])**2))
+
+        model.components['arm'].set_length(0)
+        lengths = np.linspace(0, 3, 61)
+        trajectory = list(model.heterodyne_trajectory('arm', lengths,
+                                                      chunk=16))
+        phase = np.concatenate([result['out']['beat phase']
+                                for result in trajectory])
+
+        self.assertEqual(len(trajectory), 4)
+        self.assertTrue(np.allclose(np.abs(np.diff(phase)),
+                                    2 * np.pi * 0.05, rtol=1e-6))
+
+        model.components['f2'].set_coherence_group('f2')
+        with self.assertRaises(Exception):
+            model.evaluate_heterodyne()
+
+        model.components['f2'].set_coherence_group(0)
+        model.components['f2'].set_frequency_offset(0)
+        with self.assertRaises(Exception):
+            model.evaluate_heterodyne()
+
+    def test_impulse_response(self):
+        """Test that the impulse response of an etalon has peaks at the
+        direct and ghost reflection delays, with the amplitudes of the
+        Fresnel coefficients, and that delays through multilayers and path
+        length stacks add.
+        """
+
+        model = stack_model()
+        model.components['stack'].set_layers((1, 1.5, 1), (0, 1e-3, 0))
+
+        # bandwidth chosen so that the single pass delay is 10 points.
+        delay = 1.5e-3 / ts.components.SPEED_OF_LIGHT
+        delays, response = model.impulse_response('out', 10 / delay, 256)
+
+        self.assertEqual(response.shape, (256, 4))
+        self.assertAlmostEqual(delays[128], 0)
+        self.assertAlmostEqual(delays[138] / delay, 1)
+
+        self.assertAlmostEqual(abs(response[138, 0]), 0.96)
+        self.assertAlmostEqual(abs(response[158, 0]), 0.96 * 0.04)
+        self.assertAlmostEqual(abs(response[118, 0]), 0)
+        self.assertAlmostEqual(abs(response[128, 0]), 0)
+
+        model.components['stack'].set_path_length(1.5e-3)
+        delays, response = model.impulse_response('out', 10 / delay, 256)
+        self.assertAlmostEqual(abs(response[138, 1]), 1)
+
+        # an etalon coating followed by a path of twice its delay.
+        model = ts.Model()
+        model.wavelength = 633e-9
+
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Dump, 'dump', 'n2')
+        model.add_component(ts.components.Stack, 'coating', ('n0', 'n1'))
+        model.add_component(ts.components.Stack, 'path', ('n1', 'n2'))
+        model.add_detector('out', 'n2', ('amplitude',))
+
+        model.components['laser'].amplitude[0] = 1
+
+        model.build()
+
+        model.components['coating'].set_layers((1, 1.5, 1), (0, 1e-3, 0))
+        model.components['path'].set_path_length(3e-3)
+        delays, response = model.impulse_response('out', 10 / delay, 256)
+
+        self.assertAlmostEqual(abs(response[158, 0]), 0.96)
+        self.assertAlmostEqual(abs(response[178, 0]), 0.96 * 0.04)
+        self.assertAlmostEqual(abs(response[138, 0]), 0)
+        self.assertAlmostEqual(abs(response[118, 0]), 0)
+
+    def test_memo(self):
+        """Test that memoised evaluations of revisited states match solved
+        evaluations, including after a cached factorisation has gone stale,
+        and that cache statistics are counted.
+        """
+
+        model = cavity_model()
+        model.set_solver('lu')
+        reference = cavity_model()
+
+        model.set_memo(2)
+
+        for length in (0.1, 0.2, 0.1, 0.2, 0.3, 0.1):
+            model.components['sCav'].set_length(length, loss=0.01)
+            model.evaluate()
+            reference.components['sCav'].set_length(length, loss=0.01)
+            reference.evaluate()
+            self.assertAlmostEqual(model.detectors['trans'].intensity,
+                                   reference.detectors['trans'].intensity)
+
+        self.assertEqual(model.solver.solves, 4)
+        self.assertEqual(model.memo_stats(),
+                         {'size': 2, 'maxsize': 2, 'hits': 2, 'misses': 4,
+                          'evictions': 2, 'hit_rate': 2 / 6})
+
+        # a memoised state reached by a source change, then a new source
+        # change, must refactorise the network matrix.
+        for target in (model, reference):
+            target.components['sCav'].set_length(0.3, loss=0.01)
+            target.evaluate()
+            target.components['laser'].amplitude = [0.5, 1]
+            target.updated.append('laser')
+            target.evaluate()
+        self.assertTrue(np.allclose(model.detectors['trans'].amplitudes,
+                                    reference.detectors['trans'].amplitudes))
+
+        # results taken from the memo can be changed in place without
+        # changing the memo.
+        model.components['sCav'].set_length(0.1, loss=0.01)
+        model.evaluate()
+        model.solution_vector[:] = 0
+        model.detectors['trans'].amplitudes[:] = 0
+        model.components['sCav'].set_length(0.3, loss=0.01)
+        model.evaluate()
+        hits = model.memo.hits
+        model.components['sCav'].set_length(0.1, loss=0.01)
+        model.evaluate()
+        self.assertEqual(model.memo.hits, hits + 1)
+        reference.components['sCav'].set_length(0.1, loss=0.01)
+        reference.evaluate()
+        self.assertTrue(np.allclose(model.solution_vector,
+                                    reference.solution_vector))
+        self.assertTrue(np.allclose(model.detectors['trans'].amplitudes,
+                                    reference.detectors['trans'].amplitudes))
+
+        model.set_memo(None)
+        with self.assertRaises(Exception):
+            model.memo_stats()
+
+    def test_field_map(self):
+        """Test that the field map matches detectors at every node, for both
+        single and batched evaluations.
+        """
+
+        model = cavity_model()
+        model.evaluate()
+        fields = model.field_map()
+
+        self.assertEqual(fields.shape, (len(model.nodes), 4))
+        self.assertTrue(np.allclose(fields[model.nodeIndex['n12'] // 4],
+                                    model.detectors['trans'].amplitudes))
+        self.assertTrue(np.allclose(model.field_map('n9'),
+                                    model.detectors['refl'].amplitudes))
+
+        lengths = np.linspace(0, 0.5, 5)
+        results = model.sweep(
+            lambda x: model.components['sCav'].set_length(x), lengths,
+            fields=True)
+        sweepFields = model.field_map(('n9', 'n12'), sweep=True)
+
+        self.assertEqual(model.field_map(sweep=True).shape,
+                         (5, len(model.nodes), 4))
+        self.assertTrue(np.allclose(sweepFields[:, 0],
+                                    results['refl']['amplitude']))
+        self.assertTrue(np.allclose(sweepFields[:, 1],
+                                    results['trans']['amplitude']))
+        self.assertTrue(np.allclose(
+            model.field_map(['n9', 'n12'], sweep=True), sweepFields))
+
+
+if __name__ == '__main__':
+    unittest.main()
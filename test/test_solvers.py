@@ -0,0 +1,124 @@
+import unittest
+import strapy as ts
+import numpy as np
+from network_models import cavity_model, stray_model
+
+
+class TestSolvers(unittest.TestCase):
+    def test_backends(self):
+        """Test that all solver backends give the same detected values as the
+        dense solver, before and after a change to the network matrix.
+        """
+
+        reference = cavity_model()
+        reference.set_solver('dense')
+
+        for name in ('lu', 'sparse', 'iterative'):
+            model = cavity_model()
+            model.set_solver(name)
+
+            for length in (0.1, 0.37):
+                reference.components['sCav'].set_length(length, loss=0.01)
+                reference.evaluate()
+                model.components['sCav'].set_length(length, loss=0.01)
+                model.evaluate()
+
+                for detector in ('refl', 'trans'):
+                    self.assertAlmostEqual(
+                        model.detectors[detector].intensity,
+                        reference.detectors[detector].intensity)
+                    self.assertTrue(np.allclose(
+                        model.detectors[detector].amplitudes,
+                        reference.detectors[detector].amplitudes))
+
+    def test_warm_start(self):
+        """Test that a fine sweep with the iterative solver reuses its
+        preconditioner, converges in few iterations per point and matches the
+        dense solver.
+        """
+
+        reference = cavity_model()
+        reference.set_solver('dense')
+        model = cavity_model()
+        model.set_solver('iterative', refresh_iterations=5)
+
+        for length in np.linspace(0.1, 0.11, 20):
+            reference.components['sCav'].set_length(length, loss=0.01)
+            reference.evaluate()
+            model.components['sCav'].set_length(length, loss=0.01)
+            model.evaluate()
+
+            self.assertAlmostEqual(model.detectors['trans'].intensity,
+                                   reference.detectors['trans'].intensity)
+
+        self.assertEqual(model.solver.solves, 20)
+        self.assertEqual(model.solver.fallbacks, 0)
+        self.assertLess(model.solver.preconditioner_builds, 20)
+        self.assertLessEqual(model.solver.total_iterations / 20, 5)
+
+    def test_coherence_groups(self):
+        """Test that the iterative solver solves the right hand side of each
+        coherence group with one preconditioner, warm-started across a sweep.
+        """
+
+        reference = stray_model()
+        reference.set_solver('dense')
+        model = stray_model()
+        model.set_solver('iterative', refresh_iterations=5)
+
+        for target in (reference, model):
+            target.components['stray'].set_coherence_group('stray')
+
+        for length in np.linspace(0.1, 0.11, 20):
+            for target in (reference, model):
+                target.components['sCav'].set_length(length, loss=0.01)
+                target.evaluate()
+
+            self.assertAlmostEqual(model.detectors['trans'].intensity,
+                                   reference.detectors['trans'].intensity)
+            self.assertTrue(np.allclose(
+                model.detectors['trans'].amplitudes,
+                reference.detectors['trans'].amplitudes))
+
+        self.assertEqual(model.solution_vector.shape[1], 2)
+        self.assertEqual(model.solver.solves, 20)
+        self.assertEqual(model.solver.fallbacks, 0)
+        self.assertLess(model.solver.preconditioner_builds, 20)
+        self.assertLessEqual(model.solver.total_iterations / 40, 5)
+
+    def test_source_only_change(self):
+        """Test that the cached LU factorisation is reused when only the
+        source changes, and gives the correct solution.
+        """
+
+        model = cavity_model()
+        model.set_solver('lu')
+        model.evaluate()
+        factors = model.solver.factors
+
+        model.components['laser'].amplitude = [0, 2]
+        model.updated.append('laser')
+        model.evaluate()
+
+        self.assertIs(model.solver.factors, factors)
+        self.assertTrue(np.allclose(
+            model.matrix @ model.solution_vector, model.rhs))
+
+    def test_auto(self):
+        """Test automatic backend selection from network matrix shape and
+        sparsity.
+        """
+
+        model = cavity_model()
+
+        self.assertIsInstance(model.solver, ts.solvers.DenseSolver)
+        self.assertEqual(ts.solvers.select_solver((1000, 1000), 0.01),
+                         'sparse')
+        self.assertEqual(ts.solvers.select_solver((1000, 1000), 0.5),
+                         'dense')
+        self.assertEqual(ts.solvers.select_solver((50000, 50000), 1e-4),
+                         'iterative')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,11 @@
 import unittest
 import strapy as ts
 import numpy as np
-import pyctmm
+
+try:
+    import pyctmm
+except ImportError:
+    pyctmm = None
 
 
 class TestStack(unittest.TestCase):
@@ -54,6 +58,7 @@ class TestStack(unittest.TestCase):
 
         self.assertAlmostEqual(model.detectors['out'].intensity, 1)
 
+    @unittest.skipIf(pyctmm is None, 'pyctmm not installed')
     def test_set_pyctmm_free_space(self):
         """Test that the set_ctmm method produces the correct results.
 
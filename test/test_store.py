@@ -0,0 +1,149 @@
+import unittest
+import tempfile
+import os
+import strapy as ts
+import numpy as np
+from network_models import cavity_model
+
+
+class TestStore(unittest.TestCase):
+    def test_store(self):
+        """Test that results are found by state across store instances,
+        written in bulk, and cleared.
+        """
+
+        with tempfile.TemporaryDirectory() as path:
+            store = ts.store.ResultStore(path)
+            store.put_many('t', 'k', ['a', 'b', 'c'],
+                           np.arange(6).reshape(3, 2))
+            store.put('t', 'k', 'd', np.array([7, 8]))
+            store.close()
+
+            store = ts.store.ResultStore(path)
+            found, values = store.get_many('t', 'k', ['c', 'x', 'a', 'd'])
+
+            self.assertEqual(list(found), [True, False, True, True])
+            self.assertTrue(np.array_equal(values, [[4, 5], [0, 1], [7, 8]]))
+            self.assertIsNone(store.get('u', 'k', 'a'))
+            self.assertEqual((store.hits, store.misses), (3, 2))
+            self.assertEqual(len(store), 4)
+
+            # a blob left partly written is removed by clearing.
+            open(os.path.join(path, 'partial.npy.tmp'), 'wb').close()
+            store.clear()
+            self.assertEqual(len(store), 0)
+            self.assertIsNone(store.get('t', 'k', 'a'))
+            self.assertEqual(os.listdir(path), [ts.store.INDEX_NAME])
+            store.close()
+
+            # pending results are written on leaving a with block.
+            with ts.store.ResultStore(path) as store:
+                store.put('t', 'k', 'a', np.array([1, 2]))
+            with ts.store.ResultStore(path) as store:
+                self.assertTrue(np.array_equal(store.get('t', 'k', 'a'),
+                                               [1, 2]))
+
+    def test_buffered_puts(self):
+        """Test that single results are found before they are written, and
+        are written together as one blob on flushing, closing or filling the
+        buffer.
+        """
+
+        def blobs(path):
+            return len([name for name in os.listdir(path)
+                        if name.endswith('.npy')])
+
+        with tempfile.TemporaryDirectory() as path:
+            store = ts.store.ResultStore(path)
+            for i in range(5):
+                store.put('t', 'k', str(i), np.array([i, i]))
+
+            self.assertEqual(blobs(path), 0)
+            self.assertTrue(np.array_equal(store.get('t', 'k', '3'), [3, 3]))
+            found, values = store.get_many('t', 'k', ['1', 'x', '4'])
+            self.assertEqual(list(found), [True, False, True])
+            self.assertTrue(np.array_equal(values, [[1, 1], [4, 4]]))
+
+            store.flush()
+            self.assertEqual(blobs(path), 1)
+            self.assertEqual(store.writes, 5)
+
+            for i in range(ts.store.FLUSH_SIZE):
+                store.put('t', 'k', 'b' + str(i), np.array([i, i]))
+            self.assertEqual(blobs(path), 2)
+            self.assertEqual(store.pending, {})
+
+            store.put('t', 'k', 'last', np.array([0, 0]))
+            store.close()
+            self.assertEqual(blobs(path), 3)
+
+            store = ts.store.ResultStore(path)
+            self.assertEqual(len(store), 6 + ts.store.FLUSH_SIZE)
+            store.close()
+
+            # single evaluations of a model are written in bulk.
+            model = cavity_model()
+            model.set_store(path)
+            for length in np.linspace(0, 0.5, 7):
+                model.components['sCav'].set_length(length)
+                model.evaluate()
+            self.assertEqual(blobs(path), 3)
+            model.store.close()
+            self.assertEqual(blobs(path), 4)
+
+    def test_model_store(self):
+        """Test that a re-run of a sweep and evaluation with the same store
+        takes its results from the store, without solving, and that only new
+        points of a partly stored sweep are solved.
+        """
+
+        lengths = np.linspace(0, 0.5, 11)
+
+        with tempfile.TemporaryDirectory() as path:
+            model = cavity_model()
+            model.set_store(path)
+            model.evaluate()
+            first = model.simulate_trajectory('sCav', lengths, chunk=4,
+                                              loss=0.01)
+            first = [result['trans']['intensity'] for result in first]
+            model.sweep(
+                lambda x: model.components['sCav'].set_length(x, loss=0.01),
+                lengths)
+            model.store.close()
+
+            model = cavity_model()
+            model.set_store(path)
+
+            model.evaluate()
+            second = model.simulate_trajectory('sCav', lengths, chunk=4,
+                                               loss=0.01)
+            second = [result['trans']['intensity'] for result in second]
+
+            self.assertEqual(model.solver.solves, 0)
+            self.assertEqual((model.store.hits, model.store.misses), (12, 0))
+
+            reference = cavity_model()
+            reference.evaluate()
+            self.assertTrue(np.allclose(
+                model.detectors['trans'].amplitudes,
+                reference.detectors['trans'].amplitudes))
+            self.assertTrue(np.array_equal(np.concatenate(first),
+                                           np.concatenate(second)))
+
+            results = model.sweep(
+                lambda x: model.components['sCav'].set_length(x, loss=0.01),
+                np.linspace(0, 1, 21))
+            self.assertEqual((model.store.hits, model.store.misses), (23, 10))
+            self.assertEqual(model.store.writes, 10)
+
+            expected = reference.sweep(
+                lambda x: reference.components['sCav'].set_length(x,
+                                                                  loss=0.01),
+                np.linspace(0, 1, 21))
+            self.assertTrue(np.allclose(results['trans']['amplitude'],
+                                        expected['trans']['amplitude']))
+            model.store.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,141 @@
+import unittest
+import strapy as ts
+import numpy as np
+
+try:
+    import pyctmm
+except ImportError:
+    pyctmm = None
+
+
+def pyctmm_matrix(indices, thicknesses, wavelength, theta):
+    """Returns the stack matrix of a multilayer calculated by pyctmm."""
+
+    cstack = pyctmm.create_stack(len(indices), wavelength, theta)
+
+    for i, (index, thickness) in enumerate(zip(indices, thicknesses)):
+        pyctmm.set_ind(cstack, i, np.real(index), np.imag(index))
+        pyctmm.set_d(cstack, i, thickness)
+
+    pyctmm.evaluate(cstack)
+
+    return pyctmm.get_matrix(cstack)
+
+
+class TestTMM(unittest.TestCase):
+    def test_half_wave_layer(self):
+        """Test that a half wave layer between equal media is transparent, and
+        that a single interface gives the Fresnel reflectivity.
+        """
+
+        wavelength = 633e-9
+        matrix = ts.tmm.stack_matrices((1, 1.515, 1),
+                                       (0, wavelength / 1.515 / 2, 0),
+                                       wavelength)
+
+        self.assertTrue(np.allclose(matrix, -np.identity(4)))
+
+        matrix = ts.tmm.stack_matrices((1, 1.5), (0, 0), wavelength)
+
+        self.assertAlmostEqual(matrix[1, 0] / matrix[0, 0], 0.2)
+        self.assertAlmostEqual(matrix[3, 2] / matrix[2, 2], -0.2)
+
+    @unittest.skipIf(pyctmm is None, 'pyctmm not installed')
+    def test_pyctmm(self):
+        """Test that stack matrices match pyctmm for random multilayers,
+        including absorbing layers and oblique incidence.
+        """
+
+        rng = np.random.default_rng(0)
+
+        for trial in range(100):
+            nLayers = rng.integers(1, 6)
+            absorbing = rng.random(nLayers) < 0.5
+            indices = rng.uniform(1, 2.5, nLayers) \
+                + 1j * rng.uniform(-3, 0, nLayers) * absorbing
+            indices[0] = rng.uniform(1, 1.2)
+            thicknesses = rng.uniform(0, 1e-6, nLayers)
+            wavelength = rng.uniform(400e-9, 1600e-9)
+            theta = rng.uniform(0, 0.6)
+
+            self.assertTrue(np.allclose(
+                ts.tmm.stack_matrices(indices, thicknesses, wavelength, theta),
+                pyctmm_matrix(indices, thicknesses, wavelength, theta)))
+
+    @unittest.skipIf(pyctmm is None, 'pyctmm not installed')
+    def test_batched(self):
+        """Test that broadcast wavelengths and angles, and Stack layer
+        sweeps, match per-point pyctmm stacks.
+        """
+
+        indices = (1, 1.5 - 0.01j, 2.1, 1.3)
+        thicknesses = (0, 2e-7, 3e-7, 0)
+        wavelengths = np.linspace(500e-9, 900e-9, 7)
+        theta = np.linspace(0, 0.5, 5)[:, np.newaxis]
+
+        matrices = ts.tmm.stack_matrices(indices, thicknesses, wavelengths,
+                                         theta)
+
+        self.assertEqual(matrices.shape, (5, 7, 4, 4))
+        self.assertTrue(np.allclose(
+            matrices[3, 2],
+            pyctmm_matrix(indices, thicknesses, wavelengths[2], theta[3, 0])))
+
+        model = ts.Model()
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Dump, 'dump', 'n1')
+        model.add_component(ts.components.Stack, 'stack', ('n0', 'n1'))
+        model.components['stack'].set_layers(indices, thicknesses)
+
+        sweep = np.tile(thicknesses, (10, 1))
+        sweep[:, 2] = np.linspace(0, 1e-6, 10)
+        values = model.components['stack'].layer_values(thicknesses=sweep)
+
+        self.assertEqual(values.shape, (10, 16))
+        for i in range(10):
+            self.assertTrue(np.allclose(
+                values[i].reshape(4, 4),
+                pyctmm_matrix(indices, sweep[i], model.wavelength, 0)))
+
+    def test_periodic(self):
+        """Test that periodic multilayers match the expanded multilayer, for
+        a quarter wave Bragg mirror over a range of wavelengths, and that
+        the mirror is highly reflective at its design wavelength.
+        """
+
+        wavelength = 633e-9
+        cell = (1.45, 2.3)
+        thicknesses = (wavelength / 4 / 1.45, wavelength / 4 / 2.3)
+        wavelengths = np.linspace(500e-9, 800e-9, 31)
+
+        for repeats in (1, 2, 7, 20):
+            periodic = ts.tmm.periodic_matrices(1, cell, thicknesses, repeats,
+                                                1.52, wavelengths, 0.3)
+            expanded = ts.tmm.stack_matrices(
+                (1,) + cell * repeats + (1.52,),
+                (0,) + thicknesses * repeats + (0,), wavelengths, 0.3)
+
+            self.assertTrue(np.allclose(periodic, expanded))
+
+        model = ts.Model()
+        model.add_component(ts.components.Source, 'laser', 'n0')
+        model.add_component(ts.components.Dump, 'dump', 'n1')
+        model.add_component(ts.components.Stack, 'stack', ('n0', 'n1'))
+        stack = model.components['stack']
+
+        stack.set_periodic(1, cell, thicknesses, 20, 1.52)
+        matrix = stack.stack_matrix
+
+        self.assertGreater(np.abs(matrix[1, 0] / matrix[0, 0])**2, 0.9999)
+        self.assertTrue(np.allclose(
+            stack.wavelength_values(wavelengths),
+            ts.tmm.periodic_matrices(1, cell, thicknesses, 20, 1.52,
+                                     wavelengths).reshape(-1, 16)))
+
+        with self.assertRaises(Exception):
+            ts.tmm.periodic_matrices(1, cell, thicknesses, 0, 1.52,
+                                     wavelength)
+
+
+if __name__ == '__main__':
+    unittest.main()